@@ -0,0 +1,94 @@
+"""Import time budget for the sl package
+
+Imports each module in a fresh interpreter with '-X importtime', keeps the
+best cumulative time of several runs and compares it with a budget.  It
+also checks that cheap imports do not drag in heavy standard library
+modules (http.server, ssl, logging, ...), which is the more reliable
+signal on a noisy machine.  Exits with status 1 if anything is over.
+
+Usage::
+
+    python benchmarks/importtime.py [--runs N] [--budget MODULE=MS ...]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cumulative import time budgets in milliseconds
+BUDGETS = {
+    'sl': 5.0,
+    'sl.util': 10.0,
+    'sl.headers': 15.0,
+    'sl.handlers': 20.0,
+    'sl.server': 120.0,
+}
+
+# Modules that must not be loaded as a side effect of importing a module
+FORBIDDEN = {
+    'sl': ('sl.server', 'sl.handlers', 'http.server', 'ssl', 'logging',
+           'platform', 'email'),
+    'sl.util': ('http.server', 'ssl', 'logging', 'platform'),
+    'sl.headers': ('http.server', 'ssl', 'logging', 'platform'),
+    'sl.handlers': ('http.server', 'ssl', 'logging', 'platform'),
+    'sl.server': ('logging', 'platform', 'sl.tls', 'sl.metrics'),
+}
+
+
+def import_time(module):
+    """Cumulative import time of 'module' in microseconds (one run)"""
+    out = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+        cwd=ROOT, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL,
+        universal_newlines=True, check=True).stderr
+    for line in reversed(out.splitlines()):
+        if line.startswith('import time:'):
+            fields = line.split('|')
+            if fields[2].strip() == module:
+                return int(fields[1])
+    raise RuntimeError('no import time reported for %s' % module)
+
+
+def loaded_modules(module):
+    out = subprocess.run(
+        [sys.executable, '-c',
+         'import sys, %s; print("\\n".join(sys.modules))' % module],
+        cwd=ROOT, stdout=subprocess.PIPE, universal_newlines=True,
+        check=True).stdout
+    return set(out.split())
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--budget', action='append', default=[],
+                        metavar='MODULE=MS')
+    args = parser.parse_args(argv[1:])
+    budgets = dict(BUDGETS)
+    for item in args.budget:
+        name, _, ms = item.partition('=')
+        budgets[name] = float(ms)
+
+    failed = False
+    print('%-12s %10s %10s  %s' % ('module', 'best ms', 'budget', 'status'))
+    for module, budget in sorted(budgets.items()):
+        import_time(module)             # warm up (writes .pyc files)
+        best = min(import_time(module) for i in range(args.runs)) / 1000.0
+        problems = []
+        if best > budget:
+            problems.append('over budget')
+        unwanted = sorted(set(FORBIDDEN.get(module, ())) &
+                          loaded_modules(module))
+        if unwanted:
+            problems.append('imports ' + ', '.join(unwanted))
+        failed = failed or bool(problems)
+        print('%-12s %10.2f %10.1f  %s' % (module, best, budget,
+                                           '; '.join(problems) or 'ok'))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
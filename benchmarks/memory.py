@@ -0,0 +1,102 @@
+"""Per-connection memory footprint of the handler objects
+
+Keeps N simulated connections alive, each holding the objects the server
+keeps per connection and per response (a bound ServerHandler, its Headers
+and a FileWrapper), and reports the traced allocation per connection.  The
+same measurement is repeated with dict-based subclasses of the same classes
+to show what the slot-based layouts save.
+
+Usage::
+
+    python benchmarks/memory.py [connections]
+"""
+
+import io
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sl.headers import Headers  # noqa: E402
+from sl.server import ServerHandler  # noqa: E402
+from sl.util import FileWrapper  # noqa: E402
+
+
+class DictServerHandler(ServerHandler):
+    pass
+
+
+class DictHeaders(Headers):
+    pass
+
+
+class DictFileWrapper(FileWrapper):
+    pass
+
+
+class FakeServer(object):
+    response_buffer_size = 0
+    keep_alive = False
+
+
+class FakeRequestHandler(object):
+
+    server = FakeServer()
+
+    def __init__(self):
+        self.rfile = io.BytesIO()
+        self.wfile = io.BytesIO()
+
+    def get_stderr(self):
+        return sys.stderr
+
+
+def instance_size(obj):
+    size = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def connection(handler_class, headers_class, wrapper_class, request_handler):
+    handler = handler_class(None, None, None, None, multithread=False)
+    handler.bind(request_handler)
+    handler.reset({})
+    handler.status = '200 OK'
+    handler.headers = headers_class([('Content-Type', 'text/plain'),
+                                     ('Content-Length', '12')])
+    handler.result = wrapper_class(request_handler.rfile)
+    return handler
+
+
+def measure(classes, count):
+    request_handlers = [FakeRequestHandler() for i in range(count)]
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    live = [connection(*(classes + (rh,))) for rh in request_handlers]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total = sum(stat.size_diff for stat in after.compare_to(before, 'lineno'))
+    sample = live[0]
+    sizes = [instance_size(sample), instance_size(sample.headers),
+             instance_size(sample.result)]
+    return total / float(count), sizes
+
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 10000
+    rows = [
+        ('slots', (ServerHandler, Headers, FileWrapper)),
+        ('dicts', (DictServerHandler, DictHeaders, DictFileWrapper)),
+    ]
+    print('%d connections' % count)
+    print('%-6s %12s %14s %8s %12s' % ('layout', 'bytes/conn', 'ServerHandler',
+                                       'Headers', 'FileWrapper'))
+    for name, classes in rows:
+        per_conn, sizes = measure(classes, count)
+        print('%-6s %12.1f %14d %8d %12d' % ((name, per_conn) + tuple(sizes)))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,311 @@
+"""Microbenchmarks of the per-request building blocks
+
+Each case times one small operation in isolation, without sockets or
+network access: building the environ from a parsed request, Headers
+operations, writing the status line and headers, Date formatting, path
+shifting, FileWrapper iteration, and the cost of the validators around a
+trivial application.  Every case is timed 'repeat' times for at least
+'min_time' seconds each and the best time per operation is kept.
+
+Results can be saved as JSON and later compared: cases that got slower by
+more than 'threshold' (a fraction) are flagged and the exit status is 1.
+
+Usage::
+
+    python benchmarks/micro.py [-k SUBSTRING] [--save FILE]
+    python benchmarks/micro.py --save baseline.json
+    ... change something ...
+    python benchmarks/micro.py --compare baseline.json [--threshold 0.1]
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sl.handlers import SimpleHandler, format_date_time  # noqa: E402
+from sl.headers import Headers  # noqa: E402
+from sl.server import WSGIRequestHandler, WSGIServer  # noqa: E402
+from sl.util import FileWrapper, shift_path_info  # noqa: E402
+from sl.validate import SamplingValidator, validator  # noqa: E402
+
+REQUEST = (
+    b'GET /app/items/42?page=2&sort=name HTTP/1.1\r\n'
+    b'Host: example.com\r\n'
+    b'User-Agent: Mozilla/5.0 (X11; Linux x86_64; rv:120.0) Firefox/120.0\r\n'
+    b'Accept: text/html,application/xhtml+xml,*/*;q=0.8\r\n'
+    b'Accept-Language: en-US,en;q=0.5\r\n'
+    b'Accept-Encoding: gzip, deflate, br\r\n'
+    b'Cookie: session=0123456789abcdef; theme=dark\r\n'
+    b'Connection: keep-alive\r\n'
+    b'\r\n'
+)
+
+RESPONSE_HEADERS = [
+    ('Content-Type', 'text/html; charset=utf-8'),
+    ('Content-Length', '1234'),
+    ('Cache-Control', 'no-cache'),
+    ('Set-Cookie', 'session=0123456789abcdef; Path=/; HttpOnly'),
+    ('X-Frame-Options', 'DENY'),
+]
+
+
+class NullStream(object):
+    """Output stream that discards everything"""
+
+    def write(self, data):
+        return len(data)
+
+    def writelines(self, lines):
+        pass
+
+    def flush(self):
+        pass
+
+
+def hello_app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain'),
+                              ('Content-Length', '12')])
+    return [b'Hello world!']
+
+
+def make_request_handler():
+    """A WSGIRequestHandler that has parsed REQUEST, without a socket"""
+    server = WSGIServer(('127.0.0.1', 0), WSGIRequestHandler,
+                        bind_and_activate=False)
+    server.server_name = 'localhost'
+    server.server_port = 8000
+    server.setup_environ()
+    handler = WSGIRequestHandler.__new__(WSGIRequestHandler)
+    handler.server = server
+    handler.client_address = ('127.0.0.1', 54321)
+    handler.connection = None
+    handler.rfile = io.BytesIO(REQUEST)
+    handler.wfile = io.BytesIO()
+    handler.raw_requestline = handler.rfile.readline()
+    handler.parse_request()
+    server.server_close()
+    return handler
+
+
+def request_environ():
+    return make_request_handler().get_environ()
+
+
+def make_simple_handler():
+    environ = request_environ()
+    handler = SimpleHandler(io.BytesIO(), NullStream(), NullStream(),
+                            environ, multithread=False)
+    handler.setup_environ()
+    handler.status = '200 OK'
+    handler.headers = Headers(list(RESPONSE_HEADERS))
+    return handler
+
+
+# Cases: name -> setup() returning the callable to time
+
+def case_get_environ():
+    return make_request_handler().get_environ
+
+
+def case_headers_build():
+    def build():
+        headers = Headers()
+        for name, value in RESPONSE_HEADERS:
+            headers[name] = value
+        headers.add_header('Content-Disposition', 'attachment',
+                           filename='report.csv')
+        return headers
+    return build
+
+
+def case_headers_lookup():
+    headers = Headers(list(RESPONSE_HEADERS))
+
+    def lookup():
+        headers.get('content-length')
+        'Date' in headers
+        headers.get_all('Set-Cookie')
+        headers.setdefault('Content-Type', 'text/plain')
+    return lookup
+
+
+def case_headers_bytes():
+    headers = Headers(list(RESPONSE_HEADERS))
+    return headers.__bytes__
+
+
+def case_send_preamble():
+    return make_simple_handler().send_preamble
+
+
+def case_send_headers():
+    handler = make_simple_handler()
+
+    def send_headers():
+        handler.headers_sent = False
+        handler.send_headers()
+    return send_headers
+
+
+def case_format_date_time():
+    now = time.time
+    return lambda: format_date_time(now())
+
+
+def case_shift_path_info():
+    def shift():
+        environ = {'SCRIPT_NAME': '/app', 'PATH_INFO': '/items/42/edit'}
+        shift_path_info(environ)
+        shift_path_info(environ)
+    return shift
+
+
+def case_filewrapper_iter():
+    data = io.BytesIO(b'x' * (1 << 20))
+
+    def iterate():
+        data.seek(0)
+        for block in FileWrapper(data, 65536):
+            pass
+    return iterate
+
+
+def run_app(app):
+    environ = request_environ()
+    environ['wsgi.errors'] = NullStream()
+
+    def start_response(status, headers, exc_info=None):
+        return NullStream().write
+
+    def request():
+        result = app(dict(environ), start_response)
+        for chunk in result:
+            pass
+        if hasattr(result, 'close'):
+            result.close()
+    return request
+
+
+def case_app_plain():
+    return run_app(hello_app)
+
+
+def case_app_validator():
+    return run_app(validator(hello_app))
+
+
+def case_app_sampling_validator():
+    return run_app(SamplingValidator(hello_app, rate=0.01))
+
+
+def case_handler_run():
+    environ = request_environ()
+
+    def run():
+        handler = SimpleHandler(io.BytesIO(), NullStream(), NullStream(),
+                                environ, multithread=False)
+        handler.run(hello_app)
+    return run
+
+
+CASES = [(name[5:], setup) for name, setup in sorted(globals().items())
+         if name.startswith('case_')]
+
+
+def measure(func, repeat, min_time):
+    """Best time per call of 'func', in nanoseconds"""
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time / 5:
+            break
+        number *= 2 if elapsed else 10
+    number = max(1, int(number * (min_time / elapsed)))
+    best = min(timer.repeat(repeat, number)) / number
+    return best * 1e9
+
+
+def run_cases(pattern, repeat, min_time):
+    results = {}
+    for name, setup in CASES:
+        if pattern and pattern not in name:
+            continue
+        results[name] = measure(setup(), repeat, min_time)
+        print('%-26s %12.1f ns' % (name, results[name]))
+        sys.stdout.flush()
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print the changes against 'baseline'; return the regressed cases"""
+    regressions = []
+    print('\n%-26s %12s %12s %8s' % ('case', 'baseline', 'now', 'change'))
+    for name in sorted(results):
+        old = baseline.get(name)
+        if old is None:
+            print('%-26s %12s %12.1f %8s' % (name, '-', results[name], 'new'))
+            continue
+        change = results[name] / old - 1.0
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print('%-26s %12.1f %12.1f %+7.1f%%%s' % (
+            name, old, results[name], change * 100, flag))
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-k', dest='pattern',
+                        help='only run cases whose name contains this')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='seconds per timing run [default: 0.2]')
+    parser.add_argument('--save', metavar='FILE',
+                        help='write the results to FILE as JSON')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='compare with the results saved in FILE')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='slowdown flagged as a regression '
+                             '[default: 0.10]')
+    parser.add_argument('--list', action='store_true',
+                        help='list the cases and exit')
+    args = parser.parse_args(argv[1:])
+    if args.list:
+        for name, setup in CASES:
+            print(name)
+        return 0
+
+    print('Python %s on %s, best of %d, ns per operation' % (
+        platform.python_version(), platform.platform(), args.repeat))
+    results = run_cases(args.pattern, args.repeat, args.min_time)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'implementation': platform.python_implementation(),
+                'platform': platform.platform(),
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'unit': 'ns',
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+            f.write('\n')
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
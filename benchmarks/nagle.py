@@ -0,0 +1,82 @@
+"""Latency of small keep-alive responses with and without TCP_NODELAY
+
+A response is written in several small pieces (status line, Date, Server,
+headers, body).  With Nagle's algorithm on, every piece after the first
+waits for the client to ACK the previous one, and clients delay ACKs, so
+a small response can stall for tens of milliseconds.  This runs the same
+sequential keep-alive requests against a server with SocketOptions
+nodelay on and off and prints the latency percentiles.
+
+Usage::
+
+    python benchmarks/nagle.py [requests]
+"""
+
+import http.client
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sl.listeners import SocketOptions  # noqa: E402
+from sl.server import (ThreadingWSGIServer, WSGIRequestHandler,  # noqa: E402
+                       make_server)
+
+
+class QuietHandler(WSGIRequestHandler):
+    quiet = True
+
+
+def app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain'),
+                              ('Content-Length', '12')])
+    return [b'Hello world!']
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(nodelay, count):
+    server = make_server('127.0.0.1', 0, app,
+                         server_class=ThreadingWSGIServer,
+                         handler_class=QuietHandler,
+                         socket_options=SocketOptions(nodelay=nodelay))
+    server.keep_alive = True
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        conn = http.client.HTTPConnection(*server.server_address)
+        timings = []
+        for i in range(count):
+            started = time.perf_counter()
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            timings.append(time.perf_counter() - started)
+        conn.close()
+    finally:
+        server.shutdown()
+        thread.join()
+        server.server_close()
+    timings.sort()
+    return timings
+
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 200
+    print('%d sequential keep-alive requests, times in ms' % count)
+    print('%-8s %8s %8s %8s %8s %8s' % ('nodelay', 'p50', 'p90', 'p99',
+                                         'max', 'req/s'))
+    for nodelay in (True, False):
+        timings = run(nodelay, count)
+        print('%-8s %8.3f %8.3f %8.3f %8.3f %8.0f' % (
+            nodelay, percentile(timings, 0.5) * 1000,
+            percentile(timings, 0.9) * 1000,
+            percentile(timings, 0.99) * 1000, timings[-1] * 1000,
+            count / sum(timings)))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -13,13 +13,74 @@ Current Contents:
 * validate -- validation wrapper that sits between an app and a server
   to detect errors in either
 
+* metrics -- request counters and latency histograms in Prometheus format
+
+* timing -- per-phase request timing and Server-Timing headers
+
+* accesslog -- asynchronous buffered access logging
+
+* sampler -- sampling profiler producing flame-graph (collapsed) stacks
+
+* profiler -- on-demand cProfile profiles of single requests
+
+* router -- mount several apps by path prefix and Host header
+
+* fastcgi -- FastCGI responder server built on BaseCGIHandler
+
+* uwsgi -- uwsgi binary protocol listener
+
+* listeners -- extra listening sockets and systemd socket activation
+
+* tls -- HTTPS with handshakes in the worker and session resumption
+
+* arbiter -- pre-fork master supervising worker processes
+
+* sizing -- worker and thread counts from cgroup CPU and memory limits
+
+* bench -- loopback load generator ('python -m sl bench')
+
+* testing -- in-process test client, no sockets involved
+
 To-Do:
 
 * cgi_gateway -- Run WSGI apps under CGI (pending a deployment standard)
 
 * cgi_wrapper -- Run CGI apps under WSGI
 
-* router -- a simple middleware component that handles URL traversal
+The names of sl.server and sl.handlers are available from this package,
+but those modules (and http.server, which sl.server needs) are only
+imported when one of the names is first used.
 """
-from .server import *
-from .handlers import *
+import sys
+
+# name -> submodule providing it
+_lazy = {}
+for _name in ('WSGIServer', 'ThreadingWSGIServer', 'ForkingWSGIServer',
+              'ThreadPoolMixIn', 'ThreadPoolWSGIServer', 'WSGIRequestHandler',
+              'demo_app', 'make_server', 'software_version'):
+    _lazy[_name] = 'server'
+for _name in ('BaseHandler', 'SimpleHandler', 'BaseCGIHandler',
+              'CGIHandler', 'IISCGIHandler', 'read_environ'):
+    _lazy[_name] = 'handlers'
+del _name
+
+__all__ = sorted(_lazy)
+
+if sys.version_info >= (3, 7):
+
+    def __getattr__(name):
+        module = _lazy.get(name)
+        if module is None:
+            raise AttributeError("module %r has no attribute %r"
+                                 % (__name__, name))
+        from importlib import import_module
+        value = getattr(import_module('.' + module, __name__), name)
+        globals()[name] = value         # later lookups skip __getattr__
+        return value
+
+    def __dir__():
+        return sorted(set(globals()) | set(_lazy))
+
+else:  # no module __getattr__ (PEP 562): import eagerly
+    from .server import *
+    from .handlers import *
@@ -1,57 +1,284 @@
+"""Command line launcher
+
+Usage::
+
+    python -m sl [options] [module:app]
+
+    python -m sl --app=app:app
+    python -m sl -b :8000 -b unix:///run/app.sock -w 4 --threads 8 \\
+        --preload mysite.wsgi:application
+    python -m sl -w auto --threads auto mysite.wsgi:application
+
+The application is given as 'module:attribute' (the module may be a
+dotted name, the attribute defaults to 'application'); without one the
+demo application is served.  With '--workers' greater than one a master
+process binds the sockets and forks the workers (see sl.arbiter); with
+'--reuse-port' each worker binds sockets of its own as well.  When
+systemd passes sockets (LISTEN_FDS), they are used instead of '--bind'.
+'auto' worker and thread counts are derived from the CPU and memory
+limits of the container (see sl.sizing).
+
+'python -m sl bench [options] [module:app]' load tests the server classes
+instead (see sl.bench).
+"""
+
+import argparse
+import gc
+import importlib
+import logging
+import os
+import sys
+
 from sl.server import *
-if __name__ == '__main__':
-    import argparse
-    import os
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--app', '-a', help='App for Run as WSGI Server'
-                        )
-    parser.add_argument(
-        '--port', '-p'
-        action='store',
-        default=8000,
-        type=int,
-        nargs='?',
-        help='Specify alternate port [default: 8000]',
-    )
-    parser.add_argument(
-        '--threading', '-t'
-        action='store',
-        default=False,
-        type=bool,
-        nargs='?',
-        help='uses threads to handle requests',
-    )
-    parser.add_argument(
-        '--multiprocessing', '-m'
-        action='store',
-        default=False,
-        type=bool,
-        nargs='?',
-        help='uses processes to handle requests',
-    )
-    args = parser.parse_args()
+from sl.listeners import (SocketOptions, bind_socket, listener_name,
+                          systemd_sockets)
+
+logger = logging.getLogger('sl')
+
+
+def count(value):
+    """argparse type: a positive integer or 'auto'"""
+    if value == 'auto':
+        return value
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError('must be at least 1')
+    return number
+
+
+def load_app(spec):
+    """Import 'module:attribute' (or just 'module') and return the app"""
+    module_name, _, attribute = spec.partition(':')
+    if os.getcwd() not in sys.path and '' not in sys.path:
+        sys.path.insert(0, os.getcwd())
+    module = importlib.import_module(module_name)
+    obj = module
+    for name in (attribute or 'application').split('.'):
+        try:
+            obj = getattr(obj, name)
+        except AttributeError:
+            raise SystemExit('Application %r not found in module %r'
+                             % (attribute or 'application', module_name))
+    if not callable(obj):
+        raise SystemExit('Application %r is not callable' % spec)
+    return obj
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m sl', description='Serve a WSGI application.')
+    parser.add_argument('app_spec', nargs='?', metavar='module:app',
+                        help='WSGI application to serve [default: demo app]')
+    parser.add_argument('--app', '-a', help='same as the positional argument')
+    parser.add_argument('--bind', '-b', action='append', metavar='ADDRESS',
+                        help='address to listen on: HOST:PORT, [V6]:PORT, '
+                             ':PORT, unix:///PATH or fd://N; repeatable '
+                             '[default: :8000]')
+    parser.add_argument('--port', '-p', type=int,
+                        help='listen on all interfaces on PORT (same as '
+                             '--bind :PORT)')
+    parser.add_argument('--workers', '-w', type=count, default=1,
+                        help='number of worker processes, or auto to '
+                             'size from the CPU and memory limits '
+                             '[default: 1, serve from this process]')
+    parser.add_argument('--threads', type=count, default=1,
+                        help='threads per worker, or auto [default: 1]')
+    parser.add_argument('--max-connections', type=int, metavar='N',
+                        help='connections a worker admits at once; more '
+                             'wait in the listen backlog [default: '
+                             'unlimited, or 4 per thread with auto]')
+    parser.add_argument('--worker-memory', type=float, default=64,
+                        metavar='MB',
+                        help='memory one worker is expected to use, for '
+                             'auto sizing [default: 64]')
+    parser.add_argument('--resize-interval', type=float, default=0,
+                        metavar='SECONDS',
+                        help='with auto sizing, re-read the limits this '
+                             'often and adjust the workers [default: 0, '
+                             'never]')
+    parser.add_argument('--threading', '-t', action='store_true',
+                        help='start a thread per connection')
+    parser.add_argument('--multiprocessing', '-m', action='store_true',
+                        help='fork a process per connection')
+    parser.add_argument('--preload', action='store_true',
+                        help='import the app before forking the workers '
+                             'and freeze the garbage collector, so workers '
+                             'share its memory copy-on-write')
+    parser.add_argument('--keep-alive', action='store_true',
+                        help='use HTTP/1.1 persistent connections')
+    parser.add_argument('--keep-alive-timeout', type=float, default=5.0,
+                        metavar='SECONDS',
+                        help='close a persistent connection idle this long '
+                             '[default: 5]')
+    parser.add_argument('--graceful-timeout', type=float, default=30.0,
+                        metavar='SECONDS',
+                        help='time workers get to finish their requests '
+                             'when stopping [default: 30]')
+    parser.add_argument('--max-requests', type=int, default=0, metavar='N',
+                        help='recycle a worker after about N requests '
+                             '[default: 0, never]')
+    parser.add_argument('--max-requests-jitter', type=int, default=0,
+                        metavar='N',
+                        help='add a random 0..N to each worker\'s '
+                             '--max-requests so they do not all restart '
+                             'at once')
+    parser.add_argument('--max-rss', type=float, default=0, metavar='MB',
+                        help='recycle a worker whose resident memory '
+                             'exceeds MB megabytes')
+    parser.add_argument('--max-age', type=float, default=0,
+                        metavar='SECONDS',
+                        help='recycle a worker after SECONDS of service')
+    parser.add_argument('--backlog', type=int, default=2048,
+                        help='listen() backlog of each socket '
+                             '[default: 2048]')
+    parser.add_argument('--reuse-port', action='store_true',
+                        help='bind with SO_REUSEPORT, giving each worker '
+                             'an accept queue of its own')
+    parser.add_argument('--no-nodelay', dest='nodelay', action='store_false',
+                        help='leave Nagle\'s algorithm on (no TCP_NODELAY)')
+    parser.add_argument('--defer-accept', type=int, metavar='SECONDS',
+                        help='TCP_DEFER_ACCEPT timeout (Linux)')
+    parser.add_argument('--fastopen', type=int, metavar='QUEUE',
+                        help='TCP_FASTOPEN queue length')
+    parser.add_argument('--sndbuf', type=int, metavar='BYTES',
+                        help='SO_SNDBUF of the sockets')
+    parser.add_argument('--rcvbuf', type=int, metavar='BYTES',
+                        help='SO_RCVBUF of the sockets')
+    parser.add_argument('--quiet', '-q', action='store_true',
+                        help='do not log requests')
+    return parser
+
+
+def server_class_for(args):
+    if args.multiprocessing:
+        return ForkingWSGIServer
     if args.threading:
-        server_class = ThreadingWSGIServer
-    elif args.multiprocessing:
-        server_class = ForkingWSGIServer
+        return ThreadingWSGIServer
+    if args.threads > 1:
+        return ThreadPoolWSGIServer
+    return WSGIServer
+
+
+def make_cli_server(args, sockets):
+    """Create the server around the already listening 'sockets'"""
+    handler_class = WSGIRequestHandler
+    if args.quiet:
+        handler_class = type('WSGIRequestHandler', (WSGIRequestHandler,),
+                             {'quiet': True})
+    server = server_class_for(args)(('', 0), handler_class,
+                                    bind_and_activate=False)
+    server.keep_alive = args.keep_alive
+    server.reuse_port = args.reuse_port
+    server.keep_alive_timeout = args.keep_alive_timeout or None
+    server.pool_size = args.threads
+    if args.max_connections:
+        # Pool threads plus waiting connections; forking: live children
+        server.pool_queue_size = max(1, args.max_connections - args.threads)
+        server.max_children = args.max_connections
+    server.set_socket_options(SocketOptions(
+        nodelay=args.nodelay, defer_accept=args.defer_accept,
+        fastopen=args.fastopen, sndbuf=args.sndbuf, rcvbuf=args.rcvbuf))
+    server.use_socket(sockets[0])
+    for sock in sockets[1:]:
+        server.add_listener(sock)
+    return server
+
+
+def resolve_auto(args):
+    """Resolve 'auto' worker and thread counts in 'args'
+
+    Returns a callable that re-evaluates the worker count, for the
+    Arbiter, if '--resize-interval' asks for that, else None.
+    """
+    if 'auto' not in (args.workers, args.threads):
+        return None
+    from sl.sizing import auto_size
+    auto_workers = args.workers == 'auto'
+    auto_threads = args.threads == 'auto'
+    memory = int(args.worker_memory * 1048576)
+    sizing = auto_size(worker_memory=memory)
+    logger.info('Auto sizing: %s', sizing)
+    if auto_workers:
+        args.workers = sizing.workers
+    if auto_threads:
+        args.threads = sizing.threads
+    if args.max_connections is None:
+        args.max_connections = sizing.max_connections
+    if not args.resize_interval:
+        return None
+    last = [sizing]
+
+    def resize():
+        current = auto_size(worker_memory=memory)
+        if current.key() != last[0].key():
+            logger.info('Auto sizing changed: %s', current)
+            last[0] = current
+        return current.workers if auto_workers else None
+    return resize
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv[:1] == ['bench']:
+        from sl.bench import main as bench
+        return bench(argv[1:], load_app)
+    args = make_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO,
+                        format='[%(process)d] %(levelname)s %(message)s')
+    spec = args.app_spec or args.app
+    resize = resolve_auto(args)
+    binds = args.bind or [':%d' % (args.port or 8000)]
+    if args.port and args.bind:
+        binds.append(':%d' % args.port)
+
+    sockets = systemd_sockets()
+    if sockets:
+        args.reuse_port = False         # systemd keeps listening on them
     else:
-        server_class = WSGIServer
-    if args.app:
-        (module, application) = args.app.split(':')
-        module = __import__(module)
-        application = getattr(module, application)
-        httpd = make_server('', args.port, application,
-                            server_class=server_class)
-        print('WSGIServer: Serving HTTP on port {PORT} ...\n'.format(
-            PORT=args.port))
-        try:
-            httpd.serve_forever()
-        except:
-            print('    WSGIServer: Server Stopped')
+        sockets = [bind_socket(address, args.backlog,
+                               reuse_port=args.reuse_port)
+                   for address in binds]
+    server = make_cli_server(args, sockets)
+
+    # Recycling needs a master process, even for a single worker
+    recycle = args.max_requests or args.max_rss or args.max_age
+    forked = args.workers > 1 or recycle or resize is not None
+    app_loader = None
+    if spec is None:
+        server.set_app(demo_app)
+    elif not forked or args.preload:
+        server.set_app(load_app(spec))
     else:
-        httpd = make_server('', args.port, demo_app, server_class=server_class)
-        print("Serving HTTP on", httpd.host, "port", httpd.port, "...")
+        app_loader = lambda: load_app(spec)     # noqa: E731, in each worker
+
+    for sock in server.listeners:
+        logger.info('Listening on %s', listener_name(sock))
+
+    if not forked:
         try:
-            httpd.serve_forever()
-        except:
-            print('    WSGIServer: Server Stopped')
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return
+
+    from sl.arbiter import Arbiter
+    if args.preload:
+        # Move everything imported so far out of the collector's reach, so
+        # collections in the workers do not touch (and copy) those pages.
+        gc.collect()
+        if hasattr(gc, 'freeze'):
+            gc.freeze()
+    Arbiter(server, max(1, args.workers), app_loader,
+            graceful_timeout=args.graceful_timeout,
+            max_requests=args.max_requests,
+            max_requests_jitter=args.max_requests_jitter,
+            max_rss=int(args.max_rss * 1048576),
+            max_age=args.max_age, resize=resize,
+            resize_interval=args.resize_interval or 30.0).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""Asynchronous buffered access logging
+
+Request threads only build a small tuple and append it to a bounded deque
+(appends are atomic, so no lock is taken).  A daemon thread wakes up every
+'interval' seconds, or as soon as the buffer is half full, formats the
+pending records and writes them to the stream in one batch.  When the
+buffer is full new records are dropped and counted in 'dropped' rather than
+slowing the request down.
+
+Usage::
+
+    httpd = make_server('', 8000, app)
+    httpd.enable_access_log(format='json', sample=0.1)
+    httpd.serve_forever()
+"""
+
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from random import random
+
+__all__ = ['AccessLogger', 'FORMATS']
+
+_monthname = [None, 'Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+              'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+
+def _clf_time(timestamp):
+    year, month, day, hh, mm, ss = time.gmtime(timestamp)[:6]
+    return '%02d/%s/%04d:%02d:%02d:%02d +0000' % (
+        day, _monthname[month], year, hh, mm, ss)
+
+
+def _quote(value):
+    if value is None:
+        return '-'
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def format_combined(record):
+    """Apache/nginx "combined" log line"""
+    (timestamp, remote, requestline, status, size, referer, agent,
+     timing) = record
+    line = '%s - - [%s] "%s" %s %s "%s" "%s"' % (
+        remote, _clf_time(timestamp), _quote(requestline), status,
+        size or '-', _quote(referer), _quote(agent))
+    if timing:
+        line += ' ' + timing
+    return line + '\n'
+
+
+def format_json(record):
+    """One JSON object per line"""
+    (timestamp, remote, requestline, status, size, referer, agent,
+     timing) = record
+    entry = {
+        'time': timestamp, 'remote_addr': remote, 'request': requestline,
+        'status': status, 'bytes': size, 'referer': referer,
+        'user_agent': agent,
+    }
+    if timing:
+        entry['timing'] = timing
+    return json.dumps(entry, separators=(',', ':')) + '\n'
+
+
+FORMATS = {'combined': format_combined, 'json': format_json}
+
+
+class AccessLogger(object):
+    """Collect access log records and write them from a background thread
+
+    'format' is 'combined', 'json' or a callable taking a record tuple
+    and returning a line.  'sample' is the fraction of requests logged.
+    """
+
+    def __init__(self, stream=None, format='combined', sample=1.0,
+                 capacity=8192, interval=0.2):
+        self.stream = stream
+        self.formatter = FORMATS.get(format, format)
+        if not callable(self.formatter):
+            raise ValueError("Unknown access log format: %r" % (format,))
+        self.sample = sample
+        self.capacity = capacity
+        self.interval = interval
+        self.dropped = 0
+        self._buffer = deque()
+        self._high_water = capacity // 2
+        self._wake = threading.Event()
+        self._drop_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+        atexit.register(self.close)
+
+    def log(self, request_handler, status, size, timer=None):
+        """Queue a record for a finished request (called per request)"""
+        if self.sample < 1.0 and random() >= self.sample:
+            return
+        buffer = self._buffer
+        if len(buffer) >= self.capacity:
+            with self._drop_lock:
+                self.dropped += 1
+            return
+        headers = request_handler.headers
+        buffer.append((
+            time.time(), request_handler.client_address[0],
+            request_handler.requestline, status, size,
+            headers.get('Referer'), headers.get('User-Agent'),
+            timer.log_string() if timer is not None else None,
+        ))
+        if self._thread is None:
+            self.start()
+        elif len(buffer) == self._high_water:
+            self._wake.set()
+
+    def start(self):
+        """Start the writer thread"""
+        with self._write_lock:
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(
+                    target=self._run, name='sl-access-log')
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Format and write everything queued so far"""
+        with self._write_lock:
+            buffer = self._buffer
+            if not buffer:
+                return
+            format = self.formatter
+            lines = []
+            try:
+                while True:
+                    lines.append(format(buffer.popleft()))
+            except IndexError:
+                pass
+            stream = self.stream or sys.stderr
+            stream.write(''.join(lines))
+            stream.flush()
+
+    def close(self):
+        """Stop the writer thread after writing out pending records"""
+        self._closed = True
+        self._wake.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(1.0)
+        self.flush()
+
+    def _after_fork(self):
+        # The writer thread does not survive fork(); records queued before
+        # the fork are written by the parent.
+        self._buffer = deque()
+        self._wake = threading.Event()
+        self._drop_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._thread = None
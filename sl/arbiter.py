@@ -0,0 +1,464 @@
+"""Pre-fork master process
+
+An Arbiter forks a fixed number of worker processes that all serve the
+same WSGIServer, i.e. accept on the listening sockets bound by the master.
+The master only supervises: it replaces workers that exit, and stops them
+gracefully (SIGTERM, then SIGKILL after 'graceful_timeout') when it is
+asked to stop.
+
+Signals understood by the master:
+
+* SIGTERM, SIGINT -- stop the workers gracefully and exit
+* SIGHUP -- replace all workers, one at a time (reloads the application
+  unless it was preloaded)
+
+If the server's 'reuse_port' is set, every worker gets accept queues of
+its own: the master keeps each SO_REUSEPORT listener's port bound with a
+socket that does not listen, and each worker binds a listening socket of
+its own to the address, between which the kernel spreads connections.
+Connections still queued on a worker's socket when it exits are reset.
+
+Workers can also be recycled, to keep the memory of long running
+processes flat: after 'max_requests' requests (plus a random jitter of up
+to 'max_requests_jitter', so workers do not all restart together), when
+their resident memory exceeds 'max_rss' bytes, or after 'max_age'
+seconds.  At most one worker is recycled at a time, and its replacement
+is started -- and has loaded the application -- before the old worker is
+asked to stop, so serving capacity never drops.
+
+With a 'resize' callable the master asks every 'resize_interval' seconds
+how many workers there should be (for example from sl.sizing, when the
+container's limits change) and starts or retires workers to match.
+
+Usage::
+
+    server = make_server('', 8000, None)
+    arbiter = Arbiter(server, workers=4, app_loader=lambda: load_app(name))
+    arbiter.run()
+
+If the application is already set on the server when the workers are
+forked ('preload'), every worker shares the imported modules with the
+master; otherwise 'app_loader' is called in each worker after the fork.
+"""
+
+import errno
+import logging
+import mmap
+import os
+import random
+import signal
+import socketserver
+import struct
+import sys
+import threading
+import time
+import traceback
+
+from .listeners import accept_queue, rebind_socket, reuses_port
+
+__all__ = ['Arbiter']
+
+logger = logging.getLogger(__name__)
+
+# Per-worker record in the board shared with the master: a "ready" flag
+# (the application is loaded) and the number of requests served.
+_record = struct.Struct('qq')
+
+
+class Arbiter(object):
+    """Keep 'workers' forked processes serving 'server'"""
+
+    poll_interval = 0.5                 # seconds between supervision rounds
+
+    def __init__(self, server, workers=2, app_loader=None,
+                 graceful_timeout=30.0, max_requests=0,
+                 max_requests_jitter=0, max_rss=0, max_age=0,
+                 resize=None, resize_interval=30.0):
+        self.server = server
+        self.num_workers = workers
+        self.app_loader = app_loader
+        self.graceful_timeout = graceful_timeout
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.max_rss = max_rss          # bytes
+        self.max_age = max_age          # seconds
+        self.resize = resize            # callable -> wanted worker count
+        self.resize_interval = resize_interval
+        self.next_resize = time.monotonic() + resize_interval
+        self.workers = {}               # pid -> start time
+        self.stopping = False
+        self.reload_requested = False
+        # Recycling state (master side)
+        self.limits = {}                # pid -> its max_requests
+        self.replacing = {}             # new pid -> pid it replaces
+        self.retiring = {}              # pid -> SIGKILL deadline
+        # Shared board: one record per worker, the master and its workers
+        # see the same pages after fork()
+        self.board_size = max(2 * workers + 2, 64)
+        self.board = mmap.mmap(-1, self.board_size * _record.size)
+        self.board_slots = {}           # pid -> record index
+        self.board_slot = None          # this worker's record
+        # (listener index, backlog) for each listener bound per worker
+        self.reuse_port = []
+
+    # Master
+
+    def run(self):
+        """Fork the workers and supervise them until stopped"""
+        self.pid = os.getpid()
+        metrics = self.server.metrics
+        if metrics is not None and metrics.slots <= self.board_size:
+            # A metrics slot for every worker that may be alive at once
+            # (the board is sized for that), plus the master's
+            metrics.set_slots(self.board_size + 1)
+        if self.server.reuse_port:
+            self.hold_ports()
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, self.handle_stop)
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, self.handle_reload)
+        logger.info('Master %d starting %d workers', self.pid,
+                    self.num_workers)
+        try:
+            while not self.stopping:
+                self.reap_workers()
+                if self.reload_requested:
+                    self.reload_requested = False
+                    self.reload()
+                if self.resize is not None and \
+                        time.monotonic() >= self.next_resize:
+                    self.next_resize = time.monotonic() + \
+                        self.resize_interval
+                    self.set_workers(self.resize())
+                self.manage_workers()
+                self.recycle_workers()
+                time.sleep(self.poll_interval)
+        finally:
+            self.stop()
+
+    def hold_ports(self):
+        """Keep the SO_REUSEPORT listeners' ports bound without listening
+
+        Only the workers' sockets (see bind_listeners()) then take
+        connections.
+        """
+        server = self.server
+        for index, sock in enumerate(server.listeners):
+            if not reuses_port(sock):
+                continue
+            queue = accept_queue(sock)
+            backlog = queue[1] if queue else server.request_queue_size
+            self.replace_listener(index, rebind_socket(sock))
+            sock.close()
+            self.reuse_port.append((index, backlog))
+
+    def replace_listener(self, index, sock):
+        server = self.server
+        if server.listeners[index] is server.socket:
+            server.socket = sock
+        server.listeners[index] = sock
+
+    def handle_stop(self, signum, frame):
+        self.stopping = True
+
+    def handle_reload(self, signum, frame):
+        self.reload_requested = True
+
+    def manage_workers(self):
+        """Start workers until there are 'num_workers' of them"""
+        while self.active_workers() < self.num_workers and not self.stopping:
+            self.spawn_worker()
+
+    def set_workers(self, count):
+        """Change the number of workers, retiring the youngest if fewer"""
+        if count is None or count == self.num_workers:
+            return
+        logger.info('Changing from %d to %d workers', self.num_workers,
+                    count)
+        self.num_workers = count
+        leaving = set(self.retiring)
+        leaving.update(self.replacing.values())
+        active = sorted((started, pid) for pid, started in self.workers.items()
+                        if pid not in leaving)
+        for started, pid in active[count:]:
+            self.retire(pid)
+
+    def active_workers(self):
+        """Number of workers not being replaced or stopped"""
+        leaving = set(self.retiring)
+        leaving.update(self.replacing.values())
+        return len(self.workers) - len(leaving.intersection(self.workers))
+
+    def spawn_worker(self):
+        metrics = self.server.metrics
+        slot = None
+        if metrics is not None:
+            slot = metrics.reserve_slot(self.workers)
+        record = self.reserve_record()
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = time.monotonic()
+            if slot is not None:
+                metrics.assign_slot(slot, pid)
+            if record is not None:
+                self.board_slots[pid] = record
+            if self.max_requests:
+                self.limits[pid] = self.max_requests + random.randint(
+                    0, self.max_requests_jitter)
+            return pid
+        # Worker process: never return into the master's code
+        self.board_slot = record
+        status = 0
+        try:
+            self.run_worker(slot)
+        except SystemExit as e:
+            status = e.code if isinstance(e.code, int) else 1
+        except BaseException:
+            traceback.print_exc()
+            status = 1
+        finally:
+            sys.stderr.flush()
+            os._exit(status)
+
+    def reap_workers(self):
+        """Collect exited workers; return their pids"""
+        reaped = []
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError as e:
+                if e.errno == errno.ECHILD:
+                    self.workers.clear()
+                    break
+                raise
+            if not pid:
+                break
+            if self.workers.pop(pid, None) is not None:
+                reaped.append(pid)
+                self.board_slots.pop(pid, None)
+                self.limits.pop(pid, None)
+                self.retiring.pop(pid, None)
+                if self.stopping or not status:
+                    continue
+                if os.WIFSIGNALED(status):
+                    logger.warning('Worker %d killed by signal %d', pid,
+                                   os.WTERMSIG(status))
+                else:
+                    logger.warning('Worker %d exited with status %d', pid,
+                                   os.WEXITSTATUS(status))
+        return reaped
+
+    # Recycling
+
+    def recycle_workers(self):
+        """Replace (at most) one worker that reached one of its limits"""
+        now = time.monotonic()
+        for new, old in list(self.replacing.items()):
+            if new not in self.workers:
+                del self.replacing[new]     # died early; try again later
+            elif self.worker_ready(new) or \
+                    now - self.workers[new] > self.graceful_timeout:
+                del self.replacing[new]
+                self.retire(old)
+        for pid, deadline in list(self.retiring.items()):
+            if now > deadline:
+                self.stop_worker(pid, signal.SIGKILL)
+        if self.replacing or self.stopping:
+            return
+        for pid, started in list(self.workers.items()):
+            if pid in self.retiring:
+                continue
+            reason = self.recycle_reason(pid, started, now)
+            if reason:
+                logger.info('Recycling worker %d: %s', pid, reason)
+                self.replacing[self.spawn_worker()] = pid
+                return
+
+    def recycle_reason(self, pid, started, now):
+        """Why worker 'pid' should be replaced, or None"""
+        limit = self.limits.get(pid)
+        if limit:
+            served = self.requests_served(pid)
+            if served >= limit:
+                return '%d requests served' % served
+        if self.max_age and now - started >= self.max_age:
+            return 'running for %d seconds' % (now - started)
+        if self.max_rss:
+            rss = resident_memory(pid)
+            if rss is not None and rss > self.max_rss:
+                return 'resident memory %.1f MB' % (rss / 1048576.0)
+        return None
+
+    def retire(self, pid):
+        """Ask 'pid' to stop gracefully, killing it after the timeout"""
+        if pid in self.workers:
+            self.retiring[pid] = time.monotonic() + self.graceful_timeout
+            self.stop_worker(pid)
+
+    def reserve_record(self):
+        used = set(self.board_slots[pid] for pid in self.workers
+                   if pid in self.board_slots)
+        for record in range(self.board_size):
+            if record not in used:
+                _record.pack_into(self.board, record * _record.size, 0, 0)
+                return record
+        return None
+
+    def worker_ready(self, pid):
+        record = self.board_slots.get(pid)
+        if record is None:
+            return True                 # cannot tell; do not wait
+        return _record.unpack_from(self.board, record * _record.size)[0] != 0
+
+    def requests_served(self, pid):
+        record = self.board_slots.get(pid)
+        if record is None:
+            return 0
+        return _record.unpack_from(self.board, record * _record.size)[1]
+
+    def stop_worker(self, pid, sig=signal.SIGTERM):
+        try:
+            os.kill(pid, sig)
+        except OSError:
+            pass                        # already gone
+
+    def wait_workers(self, pids, timeout):
+        """Wait up to 'timeout' seconds for 'pids' to exit; return the rest"""
+        deadline = time.monotonic() + timeout
+        pids = set(pids)
+        while pids and time.monotonic() < deadline:
+            pids.difference_update(self.reap_workers())
+            pids.intersection_update(self.workers)
+            if pids:
+                time.sleep(0.05)
+        return pids
+
+    def wait_ready(self, pid, timeout):
+        """Wait up to 'timeout' seconds for worker 'pid' to load the app
+
+        Returns False if the worker exited first.
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            self.reap_workers()
+            if pid not in self.workers:
+                return False
+            if self.worker_ready(pid):
+                break
+            time.sleep(0.05)
+        return True
+
+    def reload(self):
+        """Replace every worker, starting each new one before stopping
+        the old one so that capacity never drops
+
+        A new worker gets up to 'graceful_timeout' seconds to load the
+        application.  If one exits instead, the reload stops there and the
+        remaining old workers keep serving.
+        """
+        for pid in list(self.workers):
+            if pid not in self.workers:
+                continue                # exited meanwhile
+            new = self.spawn_worker()
+            if not self.wait_ready(new, self.graceful_timeout):
+                logger.warning('Worker %d exited while starting; reload '
+                               'stopped', new)
+                return
+            self.stop_worker(pid)
+            for left in self.wait_workers([pid], self.graceful_timeout):
+                self.stop_worker(left, signal.SIGKILL)
+
+    def stop(self):
+        """Stop all workers gracefully, killing those that do not exit"""
+        self.stopping = True
+        pids = list(self.workers)
+        for pid in pids:
+            self.stop_worker(pid)
+        for pid in self.wait_workers(pids, self.graceful_timeout):
+            self.stop_worker(pid, signal.SIGKILL)
+        self.wait_workers(pids, 1.0)
+        self.server.server_close()
+
+    # Worker
+
+    def run_worker(self, slot):
+        server = self.server
+        signal.signal(signal.SIGTERM, self.handle_worker_stop)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)    # the master decides
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        if server.metrics is not None:
+            server.metrics.enter_worker(slot)
+        self.bind_listeners()
+        if isinstance(server, socketserver.ThreadingMixIn):
+            # Keep track of the connection threads, so that stopping waits
+            # for the requests in flight instead of killing them with the
+            # process (see join_requests())
+            server.daemon_threads = False
+            server.block_on_close = True
+        if server.get_app() is None and self.app_loader is not None:
+            server.set_app(self.app_loader())
+        if server.sampler is not None:
+            server.sampler.start()      # its thread did not survive fork()
+        self.publish_stats()            # ready: the app is loaded
+        if self.max_requests and self.board_slot is not None:
+            thread = threading.Thread(target=self.publish_loop,
+                                      name='sl-worker-stats')
+            thread.daemon = True
+            thread.start()
+        logger.info('Worker %d serving', os.getpid())
+        try:
+            server.serve_forever()
+        finally:
+            self.join_requests()
+            server.server_close()       # lets in-flight requests finish
+            if server.metrics is not None:
+                server.metrics.flush()
+            if server.access_logger is not None:
+                server.access_logger.flush()
+
+    def bind_listeners(self):
+        """Bind this worker's own sockets for the ports the master holds"""
+        server = self.server
+        for index, backlog in self.reuse_port:
+            held = server.listeners[index]
+            sock = rebind_socket(held, backlog)
+            server.socket_options.apply_listener(sock)
+            self.replace_listener(index, sock)
+            held.close()
+
+    def join_requests(self):
+        """Wait up to 'graceful_timeout' for the connection threads"""
+        # Only set once a thread was started; the class default is a
+        # placeholder that is not a list
+        threads = vars(self.server).get('_threads')
+        if not threads:
+            return
+        deadline = time.monotonic() + self.graceful_timeout
+        for thread in list(threads):
+            thread.join(max(0.0, deadline - time.monotonic()))
+        del threads[:]                  # server_close() must not wait longer
+
+    def handle_worker_stop(self, signum, frame):
+        self.server.shutdown_signal = True
+
+    def publish_stats(self):
+        """Tell the master this worker is ready and how busy it has been"""
+        if self.board_slot is not None:
+            _record.pack_into(self.board, self.board_slot * _record.size,
+                              1, self.server.requests_served)
+
+    def publish_loop(self):
+        while True:
+            time.sleep(self.poll_interval)
+            self.publish_stats()
+
+
+def resident_memory(pid):
+    """Resident set size of process 'pid' in bytes, or None if unknown"""
+    try:
+        with open('/proc/%d/statm' % pid) as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * mmap.PAGESIZE
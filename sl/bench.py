@@ -0,0 +1,438 @@
+"""End-to-end load test of the server classes over loopback
+
+'python -m sl bench' starts a server (WSGIServer, ThreadingWSGIServer,
+ForkingWSGIServer or ThreadPoolWSGIServer) in a child process, listening
+on loopback TCP or on a unix socket, and drives it from a load generator
+made of several processes, each keeping some of the connections busy from
+its own threads.  It then prints the throughput and latency percentiles.
+
+Latency is corrected for coordinated omission: a client that waits for a
+slow response does not send the requests it would otherwise have sent
+meanwhile, so their (long) waiting times would never be recorded.  With
+'--rate' every connection follows a fixed schedule and latency is measured
+from the time each request was due, not from when it could be sent.
+Without a rate (a closed loop), a response that took longer than the
+median is back-filled with the latencies the missed requests would have
+seen, as HdrHistogram does.  The uncorrected figures are shown as well.
+
+Usage::
+
+    python -m sl bench [options] [module:app]
+
+    python -m sl bench --server threading,pool,forking -c 32 -d 10
+    python -m sl bench --unix --keep-alive --rate 2000 mysite.wsgi:app
+    python -m sl bench --body-size 65536 --slow-clients 8
+
+A single-threaded WSGIServer serves one connection at a time, so with
+'--keep-alive' and more than one connection most clients wait until the
+request timeout; use one of the concurrent server classes for that.
+"""
+
+import argparse
+import math
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+from .listeners import bind_socket
+from .server import (ForkingWSGIServer, ThreadingWSGIServer,
+                     ThreadPoolWSGIServer, WSGIRequestHandler, WSGIServer,
+                     demo_app)
+
+__all__ = ['SERVER_CLASSES', 'run_server', 'run_load', 'percentile',
+           'correct_coordinated_omission', 'main']
+
+SERVER_CLASSES = {
+    'simple': WSGIServer,
+    'threading': ThreadingWSGIServer,
+    'forking': ForkingWSGIServer,
+    'pool': ThreadPoolWSGIServer,
+}
+
+PERCENTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+class QuietHandler(WSGIRequestHandler):
+    quiet = True
+
+
+# Server side
+
+def run_server(server_class, address, app, keep_alive=False, threads=8,
+               backlog=1024):
+    """Start 'app' on 'address' in a child process
+
+    Returns the process and the address clients connect to; terminating
+    the process stops the server gracefully.
+    """
+    server = server_class(('', 0), QuietHandler, bind_and_activate=False)
+    server.keep_alive = keep_alive
+    server.pool_size = threads
+    server.use_socket(bind_socket(address, backlog))
+    server.set_app(app)
+    connect_to = server.socket.getsockname()
+    if isinstance(connect_to, tuple):
+        connect_to = connect_to[:2]
+
+    def serve():
+        def stop(signum, frame):
+            server.shutdown_signal = True
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        try:
+            server.serve_forever(poll_interval=0.1)
+        finally:
+            server.server_close()
+
+    process = _context().Process(target=serve, name='sl-bench-server')
+    process.start()
+    server.socket.close()               # the child owns the listener now
+    return process, connect_to
+
+
+def _context():
+    # The server and the load generator are started with fork(), so they
+    # may run closures and the already loaded application
+    return multiprocessing.get_context('fork')
+
+
+# Client side
+
+def make_request(path, body_size, keep_alive, host='localhost'):
+    method = 'POST' if body_size else 'GET'
+    lines = ['%s %s HTTP/1.1' % (method, path), 'Host: %s' % host]
+    if body_size:
+        lines.append('Content-Type: application/octet-stream')
+        lines.append('Content-Length: %d' % body_size)
+    if not keep_alive:
+        lines.append('Connection: close')
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + \
+        b'x' * body_size
+
+
+class Connection(object):
+    """A client connection that sends one request at a time"""
+
+    def __init__(self, address, timeout):
+        self.address = address
+        self.timeout = timeout
+        self.sock = None
+        self.buffer = b''
+
+    def connect(self):
+        if isinstance(self.address, str):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(self.timeout)
+        sock.connect(self.address)
+        self.sock = sock
+        self.buffer = b''
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def send(self, request, pieces=1, delay=0.0):
+        if self.sock is None:
+            self.connect()
+        if pieces <= 1:
+            self.sock.sendall(request)
+            return
+        size = -(-len(request) // pieces)
+        for start in range(0, len(request), size):
+            if start:
+                time.sleep(delay)
+            self.sock.sendall(request[start:start + size])
+
+    def recv(self):
+        data = self.sock.recv(65536)
+        if not data:
+            raise ConnectionError('connection closed by the server')
+        return data
+
+    def read_response(self):
+        """Read one response; return (status, body size)"""
+        buffer = self.buffer
+        while b'\r\n\r\n' not in buffer:
+            buffer += self.recv()
+        head, _, buffer = buffer.partition(b'\r\n\r\n')
+        lines = head.split(b'\r\n')
+        version, status = lines[0].split(None, 2)[:2]
+        close = version == b'HTTP/1.0'
+        length = None
+        for line in lines[1:]:
+            name, _, value = line.partition(b':')
+            name = name.strip().lower()
+            if name == b'content-length':
+                length = int(value)
+            elif name == b'connection':
+                close = value.strip().lower() == b'close'
+        if length is None:
+            while True:                 # body ends when the server closes
+                try:
+                    buffer += self.recv()
+                except ConnectionError:
+                    break
+            length, close = len(buffer), True
+        while len(buffer) < length:
+            buffer += self.recv()
+        self.buffer = buffer[length:]
+        if close:
+            self.close()
+        return int(status), length
+
+
+def client(address, request, options, deadline, count, offset, slow,
+           results, lock):
+    """Send requests on one connection until 'deadline' or 'count'"""
+    conn = Connection(address, options.timeout)
+    raw, corrected = [], []
+    errors = received = done = 0
+    first = last = None
+    interval = None
+    if options.rate and not slow:
+        interval = float(options.concurrency) / options.rate
+    pieces = options.slow_pieces if slow else 1
+    due = time.monotonic() + (interval or 0.0) * offset
+    while (count is None or done < count) and time.monotonic() < deadline:
+        if interval is not None:
+            now = time.monotonic()
+            if due > now:
+                time.sleep(due - now)
+        started = time.monotonic()
+        if first is None:
+            first = started
+        try:
+            conn.send(request, pieces, options.slow_delay)
+            status, size = conn.read_response()
+        except (OSError, ValueError, IndexError):
+            conn.close()
+            errors += 1
+        else:
+            finished = last = time.monotonic()
+            if status >= 400:
+                errors += 1
+            received += size
+            raw.append(finished - started)
+            if interval is not None:
+                corrected.append(finished - due)
+        done += 1
+        if interval is not None:
+            due += interval
+        if not options.keep_alive:
+            conn.close()
+    conn.close()
+    with lock:
+        key = 'slow' if slow else 'normal'
+        results[key + '_raw'].extend(raw)
+        results[key + '_corrected'].extend(corrected)
+        results['errors'] += errors
+        results['bytes'] += received
+        if not slow and last is not None:
+            results['first'] = min(results['first'], first)
+            results['last'] = max(results['last'], last)
+
+
+def load_process(address, request, options, clients, queue):
+    """Run 'clients' (a list of (offset, slow) pairs) as threads"""
+    results = {'normal_raw': [], 'normal_corrected': [], 'slow_raw': [],
+               'slow_corrected': [], 'errors': 0, 'bytes': 0,
+               'first': float('inf'), 'last': float('-inf')}
+    lock = threading.Lock()
+    count = None
+    if options.requests:
+        count = max(1, options.requests // options.concurrency)
+    deadline = time.monotonic() + options.duration
+    threads = [threading.Thread(
+        target=client, args=(address, request, options, deadline, count,
+                             offset, slow, results, lock))
+        for offset, slow in clients]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    queue.put(results)
+
+
+def run_load(address, options):
+    """Drive the server at 'address'; return the merged results"""
+    request = make_request(options.path, options.body_size,
+                           options.keep_alive)
+    clients = [(i, False) for i in range(options.concurrency)]
+    clients += [(i, True) for i in range(options.slow_clients)]
+    processes = max(1, min(options.processes, len(clients)))
+    queue = _context().Queue()
+    workers = [_context().Process(
+        target=load_process,
+        args=(address, request, options, clients[i::processes], queue))
+        for i in range(processes)]
+    for worker in workers:
+        worker.start()
+    parts = [queue.get() for worker in workers]
+    for worker in workers:
+        worker.join()
+    results = parts[0]
+    for part in parts[1:]:
+        for key, value in part.items():
+            if key == 'first':
+                results[key] = min(results[key], value)
+            elif key == 'last':
+                results[key] = max(results[key], value)
+            else:
+                results[key] += value
+    # Throughput is measured over the counted (not slow) requests only,
+    # from the first one sent to the last one answered
+    results['elapsed'] = max(results['last'] - results['first'], 1e-9)
+    return results
+
+
+# Statistics
+
+def percentile(values, p):
+    """The 'p' quantile (0 < p <= 1) of the sorted list 'values'"""
+    if not values:
+        return float('nan')
+    return values[max(0, int(math.ceil(p * len(values))) - 1)]
+
+
+def correct_coordinated_omission(latencies, expected_interval):
+    """Back-fill the requests a closed-loop client failed to send
+
+    For every latency longer than 'expected_interval', the latencies of
+    the requests that would have been sent in the meantime are added
+    (each one interval shorter), like HdrHistogram's
+    recordValueWithExpectedInterval().
+    """
+    corrected = list(latencies)
+    if expected_interval <= 0:
+        return corrected
+    for latency in latencies:
+        missing = latency - expected_interval
+        while missing >= expected_interval:
+            corrected.append(missing)
+            missing -= expected_interval
+    return corrected
+
+
+def report(name, results, options, out=sys.stdout):
+    raw = sorted(results['normal_raw'])
+    if options.rate:
+        corrected = sorted(results['normal_corrected'])
+    else:
+        corrected = sorted(correct_coordinated_omission(
+            raw, percentile(raw, 0.5)))
+    elapsed = results['elapsed']
+    out.write('%s: %d requests in %.2fs, %.1f req/s, %.2f MB/s, '
+              '%d errors\n' % (
+                  name, len(raw), elapsed, len(raw) / elapsed,
+                  results['bytes'] / elapsed / 1e6, results['errors']))
+    out.write('  %-12s' % 'latency ms' + ''.join(
+        '%10s' % ('p%g' % (p * 100)) for p in PERCENTILES) +
+        '%10s\n' % 'max')
+    for label, values in (('corrected', corrected), ('uncorrected', raw)):
+        out.write('  %-12s' % label + ''.join(
+            '%10.3f' % (percentile(values, p) * 1000) for p in PERCENTILES) +
+            '%10.3f\n' % ((values[-1] if values else float('nan')) * 1000))
+    if options.slow_clients:
+        slow = sorted(results['slow_raw'])
+        out.write('  slow clients: %d requests, p50 %.3f ms\n' % (
+            len(slow), percentile(slow, 0.5) * 1000))
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m sl bench',
+        description='Load test the server classes over loopback.')
+    parser.add_argument('app_spec', nargs='?', metavar='module:app',
+                        help='WSGI application [default: demo app]')
+    parser.add_argument('--server', '-s', default='threading',
+                        help='comma-separated server classes to compare: '
+                             '%s [default: threading]'
+                             % ', '.join(sorted(SERVER_CLASSES)))
+    parser.add_argument('--threads', type=int, default=8,
+                        help='threads of the pool server [default: 8]')
+    parser.add_argument('--unix', nargs='?', const='', metavar='PATH',
+                        help='listen on a unix socket (a temporary one if '
+                             'no PATH is given) instead of loopback TCP')
+    parser.add_argument('--concurrency', '-c', type=int, default=16,
+                        help='concurrent connections [default: 16]')
+    parser.add_argument('--processes', '-P', type=int,
+                        default=min(4, os.cpu_count() or 1),
+                        help='load generator processes [default: '
+                             'min(4, CPUs)]')
+    parser.add_argument('--duration', '-d', type=float, default=5.0,
+                        help='seconds per server class [default: 5]')
+    parser.add_argument('--requests', '-n', type=int,
+                        help='stop after about this many requests')
+    parser.add_argument('--rate', '-r', type=float,
+                        help='target requests per second over all '
+                             'connections (open loop)')
+    parser.add_argument('--keep-alive', '-k', action='store_true',
+                        help='reuse connections (HTTP/1.1 keep-alive)')
+    parser.add_argument('--body-size', type=int, default=0, metavar='BYTES',
+                        help='POST a body of this size [default: GET]')
+    parser.add_argument('--path', default='/', help='request path')
+    parser.add_argument('--slow-clients', type=int, default=0, metavar='N',
+                        help='extra connections sending their requests '
+                             'slowly, not counted in the latency')
+    parser.add_argument('--slow-pieces', type=int, default=10,
+                        help='pieces a slow client splits a request into')
+    parser.add_argument('--slow-delay', type=float, default=0.1,
+                        metavar='SECONDS',
+                        help='pause between the pieces [default: 0.1]')
+    parser.add_argument('--timeout', type=float, default=10.0,
+                        help='client socket timeout [default: 10]')
+    return parser
+
+
+def main(argv=None, load_app=None):
+    options = make_parser().parse_args(argv)
+    if options.app_spec:
+        if load_app is None:
+            from sl.__main__ import load_app
+        app = load_app(options.app_spec)
+    else:
+        app = demo_app
+    names = [name.strip() for name in options.server.split(',')]
+    for name in names:
+        if name not in SERVER_CLASSES:
+            raise SystemExit('Unknown server class %r (choose from %s)'
+                             % (name, ', '.join(sorted(SERVER_CLASSES))))
+
+    print('%d connections%s, %s, %s%s' % (
+        options.concurrency,
+        ' + %d slow' % options.slow_clients if options.slow_clients else '',
+        'keep-alive' if options.keep_alive else 'connection per request',
+        'GET' if not options.body_size else
+        'POST %d bytes' % options.body_size,
+        ', %g req/s' % options.rate if options.rate else ''))
+    for name in names:
+        if options.unix is not None:
+            address = 'unix://' + (options.unix or os.path.join(
+                tempfile.mkdtemp(prefix='sl-bench-'), 'sock'))
+        else:
+            address = '127.0.0.1:0'
+        server, connect_to = run_server(SERVER_CLASSES[name], address, app,
+                                        options.keep_alive, options.threads)
+        try:
+            results = run_load(connect_to, options)
+        finally:
+            server.terminate()
+            server.join(options.timeout)
+            if server.is_alive():
+                server.kill()
+                server.join()
+            if options.unix is not None and os.path.exists(connect_to):
+                os.unlink(connect_to)
+        report('%s (%s)' % (name, 'unix' if options.unix is not None
+                            else 'tcp'), results, options)
+        sys.stdout.flush()
@@ -0,0 +1,402 @@
+"""FastCGI responder gateway
+
+Runs a WSGI application behind a FastCGI-speaking front end (nginx,
+Apache mod_proxy_fcgi, lighttpd, ...), keeping the application loaded
+instead of forking a CGI process per request.  Records are read from a TCP
+or unix socket; requests may be multiplexed on one connection, each being
+served by 'FastCGIHandler', a BaseCGIHandler that writes its output as
+FCGI_STDOUT records.
+
+Usage::
+
+    from sl.fastcgi import make_fastcgi_server
+
+    server = make_fastcgi_server('127.0.0.1', 9000, app)
+    # or: make_fastcgi_server('unix:///run/app.sock', None, app)
+    server.serve_forever()
+"""
+
+import os
+import socket
+import struct
+import threading
+from tempfile import SpooledTemporaryFile
+
+try:  # Py3
+    from socketserver import (ThreadingMixIn, TCPServer,
+                              StreamRequestHandler)
+except ImportError:  # Py2
+    from SocketServer import (ThreadingMixIn, TCPServer,
+                              StreamRequestHandler)
+
+from .handlers import BaseCGIHandler
+
+__all__ = ['FastCGIServer', 'FastCGIRequestHandler', 'FastCGIHandler',
+           'make_fastcgi_server']
+
+FCGI_VERSION_1 = 1
+
+FCGI_BEGIN_REQUEST = 1
+FCGI_ABORT_REQUEST = 2
+FCGI_END_REQUEST = 3
+FCGI_PARAMS = 4
+FCGI_STDIN = 5
+FCGI_STDOUT = 6
+FCGI_STDERR = 7
+FCGI_DATA = 8
+FCGI_GET_VALUES = 9
+FCGI_GET_VALUES_RESULT = 10
+FCGI_UNKNOWN_TYPE = 11
+
+FCGI_KEEP_CONN = 1
+FCGI_RESPONDER = 1
+
+FCGI_REQUEST_COMPLETE = 0
+FCGI_CANT_MPX_CONN = 1
+FCGI_UNKNOWN_ROLE = 3
+
+_header = struct.Struct('!BBHHBx')
+_begin_body = struct.Struct('!HB5x')
+_end_body = struct.Struct('!IB3x')
+_unknown_body = struct.Struct('!B7x')
+_long_length = struct.Struct('!I')
+
+MAX_CONTENT = 65535
+
+
+def decode_pairs(data):
+    """Decode FastCGI name-value pairs into a dict of latin-1 strings"""
+    pairs = {}
+    pos, end = 0, len(data)
+    while pos < end:
+        lengths = []
+        for i in (0, 1):
+            length = data[pos]
+            if length & 0x80:
+                length = _long_length.unpack_from(data, pos)[0] & 0x7fffffff
+                pos += 4
+            else:
+                pos += 1
+            lengths.append(length)
+        name_end = pos + lengths[0]
+        value_end = name_end + lengths[1]
+        pairs[data[pos:name_end].decode('iso-8859-1')] = \
+            data[name_end:value_end].decode('iso-8859-1')
+        pos = value_end
+    return pairs
+
+
+def encode_pairs(pairs):
+    """Encode a dict of str names and values as FastCGI name-value pairs"""
+    out = []
+    for name, value in pairs.items():
+        name = name.encode('iso-8859-1')
+        value = value.encode('iso-8859-1')
+        for length in (len(name), len(value)):
+            if length < 128:
+                out.append(bytes((length,)))
+            else:
+                out.append(_long_length.pack(length | 0x80000000))
+        out.append(name)
+        out.append(value)
+    return b''.join(out)
+
+
+class _Request(object):
+    """State of one request while its records are arriving"""
+
+    __slots__ = ('request_id', 'keep_conn', 'params', 'stdin', 'aborted',
+                 'started')
+
+    def __init__(self, request_id, keep_conn, spool_size):
+        self.request_id = request_id
+        self.keep_conn = keep_conn
+        self.params = []
+        self.stdin = SpooledTemporaryFile(spool_size)
+        self.aborted = self.started = False
+
+
+class OutputStream(object):
+    """Binary stream framing writes as records of one type
+
+    Writes are collected until 'flush()' (BaseHandler flushes after each
+    block of the response), which sends them in as few records as
+    possible: nothing is held back past a flush, so streamed output
+    reaches the front end block by block.
+    """
+
+    record_size = MAX_CONTENT
+
+    def __init__(self, connection, request, record_type):
+        self.connection = connection
+        self.request = request
+        self.record_type = record_type
+        self.buffer = []
+        self.used = False
+
+    def write(self, data):
+        if data:
+            self.buffer.append(data)
+        return len(data)
+
+    def flush(self):
+        self.send()
+
+    def send(self):
+        """Send everything written so far"""
+        if self.buffer:
+            data = b''.join(self.buffer)
+            self.buffer = []
+            self.emit(data)
+
+    def emit(self, data):
+        self.used = True
+        if not self.request.aborted:
+            self.connection.send_stream(self.record_type,
+                                        self.request.request_id, data,
+                                        self.record_size)
+
+    def close(self):
+        """Send what is left and the empty record ending the stream"""
+        self.send()
+        if self.used and not self.request.aborted:
+            self.connection.send_record(
+                self.record_type, self.request.request_id, b'')
+
+
+class ErrorStream(object):
+    """Text 'wsgi.errors' stream sent as FCGI_STDERR records"""
+
+    def __init__(self, output):
+        self.output = output
+
+    def write(self, s):
+        self.output.write(s.encode('utf-8', 'replace'))
+        self.output.send()
+
+    def writelines(self, seq):
+        for line in seq:
+            self.write(line)
+
+    def flush(self):
+        self.output.send()
+
+
+class FastCGIHandler(BaseCGIHandler):
+    """BaseCGIHandler for one FastCGI request
+
+    The environ comes entirely from the FCGI_PARAMS sent by the front end;
+    like CGIHandler, nothing from this process's environment is added.
+    """
+
+    os_environ = {}
+    wsgi_multithread = True
+    wsgi_multiprocess = False
+
+    def finish_response(self):
+        # A list is complete already: send it as one block (and so in as
+        # few records as possible) rather than flushing after every item
+        result = self.result
+        if type(result) in (list, tuple) and len(result) > 1:
+            self.result = [b''.join(result)]
+        BaseCGIHandler.finish_response(self)
+
+    def get_scheme(self):
+        scheme = self.environ.get('REQUEST_SCHEME')
+        if scheme in ('http', 'https'):
+            return scheme
+        return BaseCGIHandler.get_scheme(self)
+
+
+class FastCGIRequestHandler(StreamRequestHandler):
+    """Read records from one connection and run the requests they carry"""
+
+    rbufsize = 65536
+
+    def setup(self):
+        StreamRequestHandler.setup(self)
+        self.requests = {}
+        self.write_lock = threading.Lock()
+        self.threads = []
+
+    # Writing
+
+    def send_record(self, record_type, request_id, content):
+        padding = -len(content) & 7
+        data = (_header.pack(FCGI_VERSION_1, record_type, request_id,
+                             len(content), padding)
+                + content + b'\0' * padding)
+        with self.write_lock:
+            self.connection.sendall(data)
+
+    def send_stream(self, record_type, request_id, data, size=MAX_CONTENT):
+        view = memoryview(data)
+        for start in range(0, len(data), size):
+            self.send_record(record_type, request_id,
+                             bytes(view[start:start + size]))
+
+    def end_request(self, request_id, app_status=0,
+                    protocol_status=FCGI_REQUEST_COMPLETE):
+        self.send_record(FCGI_END_REQUEST, request_id,
+                         _end_body.pack(app_status, protocol_status))
+
+    # Reading
+
+    def read_record(self):
+        header = self.rfile.read(_header.size)
+        if len(header) < _header.size:
+            return None
+        version, record_type, request_id, length, padding = \
+            _header.unpack(header)
+        content = self.rfile.read(length + padding)
+        if len(content) < length + padding:
+            return None
+        return record_type, request_id, content[:length]
+
+    def handle(self):
+        try:
+            while True:
+                record = self.read_record()
+                if record is None:
+                    break
+                if not self.handle_record(*record):
+                    break
+        except (ConnectionError, OSError):
+            pass
+        for thread in self.threads:
+            thread.join()
+
+    def handle_record(self, record_type, request_id, content):
+        """Process one record; return False to close the connection"""
+        if request_id == 0:
+            if record_type == FCGI_GET_VALUES:
+                self.get_values(decode_pairs(content))
+            else:
+                self.send_record(FCGI_UNKNOWN_TYPE, 0,
+                                 _unknown_body.pack(record_type))
+            return True
+
+        if record_type == FCGI_BEGIN_REQUEST:
+            role, flags = _begin_body.unpack(content)
+            if role != FCGI_RESPONDER:
+                self.end_request(request_id, 0, FCGI_UNKNOWN_ROLE)
+                return bool(flags & FCGI_KEEP_CONN)
+            if self.requests and not self.server.multiplex:
+                self.end_request(request_id, 0, FCGI_CANT_MPX_CONN)
+                return True
+            self.requests[request_id] = _Request(
+                request_id, bool(flags & FCGI_KEEP_CONN),
+                self.server.spool_size)
+            return True
+
+        request = self.requests.get(request_id)
+        if request is None:
+            return True                 # stale or unknown request; ignore
+        if record_type == FCGI_PARAMS:
+            if content:
+                request.params.append(content)
+        elif record_type == FCGI_STDIN:
+            if content:
+                request.stdin.write(content)
+            else:
+                return self.start_request(request)
+        elif record_type == FCGI_ABORT_REQUEST:
+            request.aborted = True
+            if not request.started:
+                # The application never saw it: end it here
+                request.stdin.close()
+                del self.requests[request_id]
+                self.end_request(request_id)
+                return request.keep_conn
+        return True
+
+    def get_values(self, names):
+        values = {
+            'FCGI_MAX_CONNS': str(self.server.max_conns),
+            'FCGI_MAX_REQS': str(self.server.max_reqs),
+            'FCGI_MPXS_CONNS': '1' if self.server.multiplex else '0',
+        }
+        result = dict((k, v) for k, v in values.items() if k in names)
+        self.send_record(FCGI_GET_VALUES_RESULT, 0, encode_pairs(result))
+
+    # Running requests
+
+    def start_request(self, request):
+        """All input has arrived; run the request"""
+        request.started = True
+        request.stdin.seek(0)
+        if not self.server.multiplex:
+            self.run_request(request)
+            return request.keep_conn
+        thread = threading.Thread(target=self.run_request, args=(request,))
+        thread.daemon = True
+        self.threads = [t for t in self.threads if t.is_alive()]
+        self.threads.append(thread)
+        thread.start()
+        return request.keep_conn
+
+    def run_request(self, request):
+        environ = decode_pairs(b''.join(request.params))
+        stdout = OutputStream(self, request, FCGI_STDOUT)
+        stderr = OutputStream(self, request, FCGI_STDERR)
+        handler = self.server.handler_class(
+            request.stdin, stdout, ErrorStream(stderr), environ)
+        try:
+            handler.run(self.server.get_app())
+        finally:
+            request.stdin.close()
+            try:
+                stdout.close()
+                stderr.close()
+                self.end_request(request.request_id)
+            except (ConnectionError, OSError):
+                pass
+            self.requests.pop(request.request_id, None)
+            if not request.keep_conn:
+                try:
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+
+class FastCGIServer(ThreadingMixIn, TCPServer):
+    """Accept FastCGI connections on a TCP or unix socket
+
+    Each connection is handled in its own thread.  If 'multiplex' is true
+    (the default) requests multiplexed on a connection run concurrently.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+    multiplex = True
+    max_conns = 100
+    max_reqs = 100
+    spool_size = 1024 * 1024            # request bodies larger go to disk
+    handler_class = FastCGIHandler
+    application = None
+
+    def __init__(self, server_address, RequestHandlerClass=None):
+        host = server_address[0]
+        if host.startswith('unix://'):
+            self.address_family = socket.AF_UNIX
+            server_address = host.split('://', 1)[1]
+            if os.path.exists(server_address):
+                os.unlink(server_address)
+        elif ':' in host and hasattr(socket, 'AF_INET6'):
+            self.address_family = socket.AF_INET6
+        TCPServer.__init__(self, server_address,
+                           RequestHandlerClass or FastCGIRequestHandler)
+
+    def get_app(self):
+        return self.application
+
+    def set_app(self, application):
+        self.application = application
+
+
+def make_fastcgi_server(host, port, app, server_class=FastCGIServer,
+                        handler_class=FastCGIRequestHandler):
+    """Create a FastCGI server on 'host' and 'port' (or a unix:// path)"""
+    server = server_class((host, port), handler_class)
+    server.set_app(app)
+    return server
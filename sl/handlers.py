@@ -97,9 +97,26 @@ def read_environ():
     return environ
 
 
+class _OSEnviron(object):
+    """Class attribute holding a read_environ() snapshot, taken on first use
+
+    The snapshot replaces the descriptor on the owning class, so later
+    lookups are ordinary class attribute reads.
+    """
+
+    def __get__(self, instance, owner):
+        environ = read_environ()
+        BaseHandler.os_environ = environ
+        return environ
+
+
 class BaseHandler:
     """Manage the invocation of a WSGI application"""
 
+    # No per-instance __dict__ here; subclasses that do not declare
+    # __slots__ still get one, so they may keep using instance attributes.
+    __slots__ = ()
+
     # Configuration parameters; can override per-subclass or per-instance
     wsgi_version = (1, 0)
     wsgi_multithread = True
@@ -110,10 +127,16 @@ class BaseHandler:
     http_version = "1.0"   # Version that should be used for response
     server_software = None  # String name of server software, if any
 
+    # Results of unknown length are collected up to this many bytes, so
+    # that a short one can be sent in a single write with a Content-Length
+    # instead of being delimited by closing the connection.  0 disables.
+    buffer_size = 0
+
     # os_environ is used to supply configuration from the OS environment:
-    # by default it's a copy of 'os.environ' as of import time, but you can
-    # override this in e.g. your __init__ method.
-    os_environ = read_environ()
+    # by default it's a copy of 'os.environ' as of its first use (not of
+    # import time, to keep importing cheap), but you can override this in
+    # e.g. your __init__ method.
+    os_environ = _OSEnviron()
 
     # Collaborator classes
     wsgi_file_wrapper = FileWrapper     # set to None to disable
@@ -130,6 +153,7 @@ class BaseHandler:
     headers_sent = False
     headers = None
     bytes_sent = 0
+    pending = None          # blocks held back by write_buffered()
 
     def run(self, application):
         """Invoke the application"""
@@ -184,8 +208,11 @@ class BaseHandler:
         """
         try:
             if not self.result_is_file() or not self.sendfile():
-                for data in self.result:
-                    self.write(data)
+                if self.buffer_size and not self.headers_sent:
+                    self.write_buffered()
+                else:
+                    for data in self.result:
+                        self.write(data)
                 self.finish_content()
         except:
             # Call close() on the iterable returned by the WSGI application
@@ -199,6 +226,52 @@ class BaseHandler:
             # See bpo-29183 for more details.
             self.close()
 
+    def write_buffered(self):
+        """Write the result, giving short ones an exact Content-Length
+
+        Blocks are collected until the iterator is exhausted or more than
+        'self.buffer_size' bytes are pending.  In the first case the body
+        goes out in one write with its length; otherwise everything is
+        streamed as usual.  If the application calls write() meanwhile, the
+        collected blocks are sent first (see 'self.pending').
+        """
+        result = self.result
+        try:
+            if len(result) == 1:
+                # set_content_length() already handles this case
+                for data in result:
+                    self.write(data)
+                return
+        except (TypeError, AttributeError, NotImplementedError):
+            pass
+        limit = self.buffer_size
+        self.pending = pending = []
+        size = 0
+        iterator = iter(result)
+        try:
+            for data in iterator:
+                # If the app called write() meanwhile, 'pending' went out
+                # first and was emptied, so only new blocks are in it
+                pending.append(data)
+                size += len(data)
+                if size > limit or self.headers_sent:
+                    break
+            else:
+                self.pending = None
+                if pending:
+                    headers = self.headers
+                    if (headers is not None and not self.headers_sent
+                            and 'Content-Length' not in headers):
+                        headers['Content-Length'] = str(size)
+                    self.write(b''.join(pending))
+                return
+        finally:
+            self.pending = None
+        for data in pending:
+            self.write(data)
+        for data in iterator:
+            self.write(data)
+
     def get_scheme(self):
         """Return the URL scheme being used"""
         return guess_scheme(self.environ)
@@ -288,6 +361,12 @@ class BaseHandler:
             raise AssertionError("write() before start_response()")
 
         elif not self.headers_sent:
+            pending = self.pending
+            if pending:
+                # write_buffered() holds earlier blocks of the result; they
+                # precede what the app writes now
+                data = b''.join(pending) + data
+                del pending[:]
             # Before the first output, send the stored headers
             self.bytes_sent = len(data)    # make sure we know content-length
             self.send_headers()
@@ -444,6 +523,12 @@ class SimpleHandler(BaseHandler):
         )
         handler.run(app)"""
 
+    __slots__ = (
+        'stdin', 'stdout', 'stderr', 'base_env', 'wsgi_multithread',
+        'wsgi_multiprocess', 'environ', 'status', 'result', 'headers',
+        'headers_sent', 'bytes_sent', 'pending',
+    )
+
     def __init__(self, stdin, stdout, stderr, environ,
                  multithread=True, multiprocess=False
                  ):
@@ -453,6 +538,11 @@ class SimpleHandler(BaseHandler):
         self.base_env = environ
         self.wsgi_multithread = multithread
         self.wsgi_multiprocess = multiprocess
+        # Slots hide the class-level defaults in BaseHandler
+        self.environ = self.status = self.result = self.headers = None
+        self.pending = None
+        self.headers_sent = False
+        self.bytes_sent = 0
 
     def get_stdin(self):
         return self.stdin
@@ -478,7 +568,6 @@ class SimpleHandler(BaseHandler):
 
     def _flush(self):
         self.stdout.flush()
-        self._flush = self.stdout.flush
 
 
 class BaseCGIHandler(SimpleHandler):
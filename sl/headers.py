@@ -29,6 +29,8 @@ def _formatparam(param, value=None, quote=1):
 class Headers:
     """Manage a collection of HTTP response headers"""
 
+    __slots__ = ('_headers',)
+
     def __init__(self, headers=None):
         headers = headers if headers is not None else []
         if type(headers) is not list:
@@ -0,0 +1,238 @@
+"""Listening sockets: bind addresses and systemd socket activation
+
+A WSGIServer binds one address itself; further listening sockets -- more
+ports, a local unix socket, or sockets inherited from systemd -- are added
+with 'WSGIServer.add_listener()' and served from the same accept loop.
+
+'SocketOptions' holds the socket tuning applied to every listener and to
+each accepted connection (see 'WSGIServer.set_socket_options()').
+
+Addresses are written as 'host:port', '[v6addr]:port', ':port' (all
+interfaces), 'unix:///path/to.sock' or 'fd://N' for an already listening
+file descriptor.
+
+Usage::
+
+    from sl.listeners import bind_socket, systemd_sockets
+
+    httpd = make_server('', 8000, app)
+    httpd.add_listener(bind_socket('unix:///run/app.sock'))
+    for sock in systemd_sockets():
+        httpd.add_listener(sock)
+    httpd.serve_forever()
+
+With socket activation (a systemd '.socket' unit, or 'systemd-socket-activate'
+when testing) the kernel keeps the sockets open across restarts, so
+connections arriving while the server restarts wait in the accept queue.
+"""
+
+import os
+import socket
+import struct
+
+__all__ = ['SocketOptions', 'parse_address', 'bind_socket',
+           'rebind_socket', 'reuses_port', 'socket_from_fd',
+           'systemd_sockets', 'listener_name', 'accept_queue',
+           'SD_LISTEN_FDS_START']
+
+SD_LISTEN_FDS_START = 3                 # first fd passed by systemd
+
+# Start of Linux 'struct tcp_info': 8 bytes of u8 fields, then u32 rto, ato,
+# snd_mss, rcv_mss, unacked and sacked.  For a listening socket 'unacked'
+# is the current accept queue length and 'sacked' the backlog.
+_tcp_info = struct.Struct('=8x6I')
+
+
+class SocketOptions(object):
+    """Socket tuning for listeners and the connections accepted from them
+
+    nodelay -- set TCP_NODELAY on each connection, so the small writes of
+        a response (status line, headers, body) are not held back by
+        Nagle's algorithm waiting for the client's delayed ACK
+    defer_accept -- TCP_DEFER_ACCEPT seconds: only report a connection
+        once request data has arrived (Linux)
+    fastopen -- TCP_FASTOPEN queue length, letting returning clients send
+        the request with the SYN
+    sndbuf, rcvbuf -- SO_SNDBUF / SO_RCVBUF in bytes, set on listeners and
+        inherited by accepted connections
+    backlog -- listen() backlog of each listener
+
+    Options left at None are not touched; TCP options are skipped for unix
+    sockets and on platforms that lack them.
+    """
+
+    def __init__(self, nodelay=True, defer_accept=None, fastopen=None,
+                 sndbuf=None, rcvbuf=None, backlog=None):
+        self.nodelay = nodelay
+        self.defer_accept = defer_accept
+        self.fastopen = fastopen
+        self.sndbuf = sndbuf
+        self.rcvbuf = rcvbuf
+        self.backlog = backlog
+
+    def apply_listener(self, sock):
+        """Apply the listener options to the listening socket 'sock'"""
+        if _is_tcp(sock):
+            if self.defer_accept is not None and \
+                    hasattr(socket, 'TCP_DEFER_ACCEPT'):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_DEFER_ACCEPT,
+                                int(self.defer_accept))
+            if self.fastopen is not None and hasattr(socket, 'TCP_FASTOPEN'):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_FASTOPEN,
+                                int(self.fastopen))
+        if self.sndbuf is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.sndbuf)
+        if self.rcvbuf is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+        if self.backlog is not None:
+            sock.listen(self.backlog)   # a listening socket takes the new size
+
+    def apply_connection(self, sock):
+        """Apply the per-connection options to an accepted socket"""
+        if self.nodelay and _is_tcp(sock):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+def _is_tcp(sock):
+    return sock.family in (socket.AF_INET, getattr(socket, 'AF_INET6', None))
+
+
+def parse_address(address):
+    """Return (family, sockaddr) for an address string or (host, port)"""
+    if not isinstance(address, str):
+        host, port = address
+        if host.startswith('unix://'):
+            return socket.AF_UNIX, host.split('://', 1)[1]
+        family = socket.AF_INET6 if ':' in host else socket.AF_INET
+        return family, (host.strip('[]'), int(port))
+    if address.startswith('unix://'):
+        return socket.AF_UNIX, address.split('://', 1)[1]
+    host, sep, port = address.rpartition(':')
+    if not sep:
+        raise ValueError("Address needs a port: %r" % address)
+    if host.startswith('['):
+        return socket.AF_INET6, (host[1:-1], int(port))
+    return socket.AF_INET, (host, int(port))
+
+
+def bind_socket(address, backlog=128, reuse_address=True, reuse_port=False):
+    """Return a listening socket for 'address' (see the module docs)
+
+    With 'reuse_port', several processes can bind the same address and
+    the kernel spreads connections between their separate accept queues.
+    """
+    if isinstance(address, str) and address.startswith('fd://'):
+        return socket_from_fd(int(address[5:]))
+    family, sockaddr = parse_address(address)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        if family == socket.AF_UNIX:
+            if os.path.exists(sockaddr):
+                os.unlink(sockaddr)
+        else:
+            if reuse_address:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if reuse_port:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        if family == socket.AF_INET6:
+            sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 1)
+        sock.bind(sockaddr)
+        sock.listen(backlog)
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+
+def rebind_socket(sock, backlog=None):
+    """Return a new socket bound to the address of the TCP socket 'sock'
+
+    Both sockets must have SO_REUSEPORT set, as bind_socket(reuse_port=
+    True) does.  The new socket listens with 'backlog'; with None it only
+    keeps the port bound and takes no connections.
+    """
+    new = socket.socket(sock.family, socket.SOCK_STREAM)
+    try:
+        new.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        new.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        if sock.family == socket.AF_INET6:
+            new.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY,
+                           sock.getsockopt(socket.IPPROTO_IPV6,
+                                           socket.IPV6_V6ONLY))
+        new.bind(sock.getsockname())
+        if backlog is not None:
+            new.listen(backlog)
+    except BaseException:
+        new.close()
+        raise
+    return new
+
+
+def reuses_port(sock):
+    """True if 'sock' is a TCP socket with SO_REUSEPORT set"""
+    return _is_tcp(sock) and hasattr(socket, 'SO_REUSEPORT') and \
+        bool(sock.getsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT))
+
+
+def socket_from_fd(fd):
+    """Wrap an inherited listening file descriptor in a socket object"""
+    sock = socket.socket(fileno=fd)     # family and type are detected
+    sock.set_inheritable(False)
+    return sock
+
+
+def systemd_sockets(unset_environment=True):
+    """Return the sockets passed by systemd socket activation
+
+    Follows sd_listen_fds(3): the descriptors start at 3 and are only
+    meant for this process if LISTEN_PID matches.  The variables are
+    removed from the environment (unless 'unset_environment' is false) so
+    child processes do not claim the sockets again.  Returns an empty list
+    when the process was not socket activated.
+    """
+    pid = os.environ.get('LISTEN_PID')
+    count = os.environ.get('LISTEN_FDS')
+    if unset_environment:
+        for name in ('LISTEN_PID', 'LISTEN_FDS', 'LISTEN_FDNAMES'):
+            os.environ.pop(name, None)
+    if not count or pid is None:
+        return []
+    try:
+        if int(pid) != os.getpid():
+            return []
+        count = int(count)
+    except ValueError:
+        return []
+    return [socket_from_fd(fd) for fd in
+            range(SD_LISTEN_FDS_START, SD_LISTEN_FDS_START + count)]
+
+
+def listener_name(sock):
+    """Return the address of a listening socket in bind_socket() form"""
+    address = sock.getsockname()
+    if not isinstance(address, tuple):
+        return 'unix://' + (address.decode('utf-8', 'replace')
+                            if isinstance(address, bytes) else address)
+    if sock.family == getattr(socket, 'AF_INET6', None):
+        return '[%s]:%d' % address[:2]
+    return '%s:%d' % address
+
+
+def accept_queue(sock):
+    """Return (queued connections, backlog) for a listening TCP socket
+
+    Uses TCP_INFO, so this only works on Linux; returns None elsewhere and
+    for unix sockets.
+    """
+    if sock.family == getattr(socket, 'AF_UNIX', None) or \
+            not hasattr(socket, 'TCP_INFO'):
+        return None
+    try:
+        info = sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO,
+                               _tcp_info.size)
+    except OSError:
+        return None
+    if len(info) < _tcp_info.size:
+        return None
+    fields = _tcp_info.unpack(info)
+    return fields[4], fields[5]
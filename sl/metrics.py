@@ -0,0 +1,313 @@
+"""Request metrics in the Prometheus text exposition format
+
+Counters live in per-thread ``array('q')`` rows: a request only ever touches
+the row owned by the thread serving it, so the hot path takes no lock.  Rows
+are folded together when the metrics are flushed or scraped.
+
+To aggregate across forked workers, every process also owns one slot of an
+anonymous shared memory map created before the first fork.  A process
+publishes the sum of its thread rows into its own slot (it is the only
+writer), and a scrape from any process adds up all of the slots.
+
+Usage::
+
+    httpd = make_server('', 8000, app)
+    httpd.enable_metrics('/metrics')
+    httpd.serve_forever()
+"""
+
+import mmap
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+__all__ = ['Metrics', 'DEFAULT_BUCKETS']
+
+#: Upper bounds (in seconds) of the latency histogram buckets.  A final
+#: ``+Inf`` bucket is always added.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+_METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'DELETE', 'PATCH', 'OPTIONS',
+            'other')
+_method_index = dict((m, i) for i, m in enumerate(_METHODS[:-1])).get
+
+# Codes that get their own label; anything else is counted as e.g. '4xx'.
+_CODES = ('200', '201', '202', '204', '206', '301', '302', '303', '304',
+          '307', '308', '400', '401', '403', '404', '405', '408', '409',
+          '410', '413', '415', '422', '429', '500', '501', '502', '503',
+          '504')
+_CLASSES = ('1xx', '2xx', '3xx', '4xx', '5xx')
+_STATUSES = _CODES + _CLASSES
+_code_index = dict((c, i) for i, c in enumerate(_CODES)).get
+
+# Fixed leading fields of a row; the histogram and request counters follow.
+_IN_FLIGHT = 0
+_BYTES_SENT = 1
+_DURATION_US = 2
+_COUNTERS = 3                   # fields handed out by add_counter()
+MAX_COUNTERS = 16
+_HISTOGRAM = _COUNTERS + MAX_COUNTERS
+
+
+def _status_index(status):
+    code = status[:3]
+    index = _code_index(code)
+    if index is None:
+        klass = code[:1]
+        if not klass or klass not in '12345':
+            klass = '5'
+        index = len(_CODES) + int(klass) - 1
+    return index
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % item
+                             for item in sorted(labels.items()))
+
+
+class Metrics(object):
+    """Process-wide request counters, gauges and latency histograms
+
+    'slots' is the number of processes that can publish into the shared
+    map at the same time; slot 0 belongs to the process that created the
+    object.
+    """
+
+    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self, slots=1, buckets=DEFAULT_BUCKETS, flush_interval=1.0):
+        self.buckets = tuple(float(b) for b in buckets)
+        self.flush_interval = flush_interval
+        self.slots = slots
+        nbuckets = len(self.buckets) + 1
+        self._requests = _HISTOGRAM + nbuckets
+        self.width = self._requests + len(_METHODS) * len(_STATUSES)
+
+        self._map = mmap.mmap(-1, slots * self.width * 8)
+        self._shared = memoryview(self._map).cast('q')
+        self._owners = [None] * slots       # pid per slot (parent only)
+        self._lock = threading.Lock()
+        self.extra = []                     # (name, help, collect, type)
+        self.counters = []                  # (name, help, labels) per field
+        self._attach(0)
+
+    def add_metric(self, name, help, collect, type='gauge'):
+        """Render the metric 'name', sampled by 'collect()' at scrape time
+
+        'collect' returns an iterable of (labels, value) pairs, 'labels'
+        being a dict of label names and values.  These values are read
+        from the scraped process only, not summed over forked workers;
+        use add_counter() for counts that should be.
+        """
+        self.extra.append((name, help, collect, type))
+
+    def add_counter(self, name, help, labels=None):
+        """Add a counter summed over every process; return its index
+
+        Pass the index to 'increment()'.  Counters sharing a 'name' are
+        rendered together, each with its own 'labels' dict.  Add them
+        before forking, so every worker uses the same indexes.
+        """
+        if len(self.counters) >= MAX_COUNTERS:
+            raise ValueError('at most %d counters' % MAX_COUNTERS)
+        self.counters.append((name, help, labels or {}))
+        return _COUNTERS + len(self.counters) - 1
+
+    def increment(self, index, value=1):
+        """Add 'value' to the counter returned by add_counter()"""
+        self._row()[index] += value
+
+    def counter_totals(self, indexes):
+        """Return the values of the given counters, summed over slots"""
+        totals = self.totals()
+        return [totals[index] for index in indexes]
+
+    def _attach(self, slot):
+        """Start publishing into 'slot', discarding inherited thread rows"""
+        self.slot = slot
+        start = slot * self.width
+        # Anything already in the slot was published by an earlier owner.
+        self._base = array('q', self._shared[start:start + self.width])
+        self._retired = array('q', bytes(8 * self.width))
+        self._rows = []
+        self._local = threading.local()
+        self._next_flush = time.monotonic() + self.flush_interval
+
+    def _row(self):
+        try:
+            return self._local.row
+        except AttributeError:
+            row = self._local.row = array('q', bytes(8 * self.width))
+            with self._lock:
+                self._rows.append((threading.current_thread(), row))
+            return row
+
+    # Hot path
+
+    def request_started(self):
+        """Mark a request as in flight, returning its start time"""
+        self._row()[_IN_FLIGHT] += 1
+        return time.monotonic()
+
+    def request_finished(self, started, method, status, bytes_sent):
+        """Record a completed request begun at 'started'"""
+        now = time.monotonic()
+        elapsed = now - started
+        row = self._row()
+        row[_IN_FLIGHT] -= 1
+        row[_BYTES_SENT] += bytes_sent
+        row[_DURATION_US] += int(elapsed * 1000000)
+        row[_HISTOGRAM + bisect_left(self.buckets, elapsed)] += 1
+        if status:
+            index = _method_index(method)
+            if index is None:
+                index = len(_METHODS) - 1
+            row[self._requests + index * len(_STATUSES)
+                + _status_index(status)] += 1
+        if now >= self._next_flush:
+            self.flush()
+
+    # Aggregation
+
+    def flush(self):
+        """Publish this process's totals into its shared slot"""
+        with self._lock:
+            self._next_flush = time.monotonic() + self.flush_interval
+            total = array('q', self._base)
+            retired = self._retired
+            live = []
+            for thread, row in self._rows:
+                if thread.is_alive():
+                    live.append((thread, row))
+                else:
+                    # Fold rows of finished threads so the list stays short
+                    for i, value in enumerate(row):
+                        if value:
+                            retired[i] += value
+            self._rows = live
+            for row in [retired] + [row for thread, row in live]:
+                for i, value in enumerate(row):
+                    if value:
+                        total[i] += value
+            start = self.slot * self.width
+            self._shared[start:start + self.width] = total
+
+    def totals(self):
+        """Return the counters summed over every slot"""
+        self.flush()
+        width = self.width
+        totals = [0] * width
+        shared = self._shared
+        for slot in range(self.slots):
+            start = slot * width
+            for i, value in enumerate(shared[start:start + width]):
+                if value:
+                    totals[i] += value
+        return totals
+
+    # Forked workers
+
+    def reserve_slot(self, live_pids):
+        """Pick a free slot for a worker about to be forked (parent side)
+
+        Returns the slot number, or None if every slot is in use.
+        """
+        for slot in range(1, self.slots):
+            if self._owners[slot] not in live_pids:
+                self._owners[slot] = None
+                return slot
+        return None
+
+    def assign_slot(self, slot, pid):
+        """Remember that 'pid' now owns 'slot' (parent side)"""
+        self._owners[slot] = pid
+
+    def set_slots(self, slots):
+        """Make room for 'slots' processes; only valid before forking"""
+        if slots == self.slots:
+            return
+        self.flush()
+        keep = min(slots, self.slots) * self.width
+        shared = memoryview(mmap.mmap(-1, slots * self.width * 8)).cast('q')
+        shared[:keep] = self._shared[:keep]
+        self._map = shared.obj
+        self._shared = shared
+        self._owners = (self._owners + [None] * slots)[:slots]
+        self.slots = slots
+
+    def enter_worker(self, slot):
+        """Switch a freshly forked child over to its own slot"""
+        if slot is None:
+            # No room to publish; keep counting locally in a private slot.
+            self._shared = memoryview(bytearray(8 * self.width)).cast('q')
+            self.slots = 1
+            slot = 0
+        self._lock = threading.Lock()
+        self._attach(slot)
+
+    # Exposition
+
+    def render(self):
+        """Return the metrics in Prometheus text format"""
+        totals = self.totals()
+        lines = [
+            '# HELP sl_requests_total Completed requests.',
+            '# TYPE sl_requests_total counter',
+        ]
+        base = self._requests
+        for m, method in enumerate(_METHODS):
+            for s, status in enumerate(_STATUSES):
+                value = totals[base + m * len(_STATUSES) + s]
+                if value:
+                    lines.append(
+                        'sl_requests_total{method="%s",status="%s"} %d'
+                        % (method, status, value))
+        lines.extend([
+            '# HELP sl_requests_in_flight Requests currently being served.',
+            '# TYPE sl_requests_in_flight gauge',
+            'sl_requests_in_flight %d' % totals[_IN_FLIGHT],
+            '# HELP sl_response_bytes_total Response bytes sent.',
+            '# TYPE sl_response_bytes_total counter',
+            'sl_response_bytes_total %d' % totals[_BYTES_SENT],
+            '# HELP sl_request_duration_seconds Request latency.',
+            '# TYPE sl_request_duration_seconds histogram',
+        ])
+        count = 0
+        for i, bound in enumerate(self.buckets + (None,)):
+            count += totals[_HISTOGRAM + i]
+            le = '+Inf' if bound is None else repr(bound)
+            lines.append('sl_request_duration_seconds_bucket{le="%s"} %d'
+                         % (le, count))
+        lines.append('sl_request_duration_seconds_sum %.6f'
+                     % (totals[_DURATION_US] / 1000000.0))
+        lines.append('sl_request_duration_seconds_count %d' % count)
+        done = set()
+        for name, help, labels in self.counters:
+            if name in done:
+                continue
+            done.add(name)
+            lines.append('# HELP %s %s' % (name, help))
+            lines.append('# TYPE %s counter' % name)
+            for i, (other, help, labels) in enumerate(self.counters):
+                if other == name:
+                    lines.append('%s%s %d' % (name, _format_labels(labels),
+                                              totals[_COUNTERS + i]))
+        for name, help, collect, type in self.extra:
+            lines.append('# HELP %s %s' % (name, help))
+            lines.append('# TYPE %s %s' % (name, type))
+            for labels, value in collect():
+                lines.append('%s%s %s' % (name, _format_labels(labels),
+                                          value))
+        lines.append('')
+        return '\n'.join(lines)
+
+    def app(self, environ, start_response):
+        """WSGI application serving the rendered metrics"""
+        body = self.render().encode('utf-8')
+        start_response('200 OK', [('Content-Type', self.content_type),
+                                  ('Content-Length', str(len(body)))])
+        return [body]
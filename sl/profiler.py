@@ -0,0 +1,106 @@
+"""On-demand deterministic profiling of single requests
+
+A RequestProfiler runs 'cProfile' around the handling of a request when the
+request carries a trigger header with a secret value, or for a random
+fraction 'rate' of requests.  Without a 'header_value' the header is
+ignored, so clients cannot make the server profile (and write files) at
+will.  Only one request is profiled at a time: cProfile cannot run in
+several threads at once on Python 3.12+, and others are served normally
+while it is busy.  Each profiled request leaves two files in 'directory':
+
+* '<name>.prof' -- the 'pstats' data, for 'python -m pstats' or snakeviz
+* '<name>.json' -- method, path, status, bytes sent and wall time
+
+Requests that are not selected only pay for the header lookup.
+
+Usage::
+
+    httpd = make_server('', 8000, app)
+    httpd.enable_request_profiler('/tmp/profiles', header_value='s3cret')
+    httpd.serve_forever()
+
+    $ curl -H 'X-SL-Profile: s3cret' http://localhost:8000/slow
+"""
+
+import hmac
+import json
+import os
+import re
+import threading
+import time
+from random import random
+
+__all__ = ['RequestProfiler']
+
+_unsafe = re.compile(r'[^A-Za-z0-9._-]+')
+
+
+class RequestProfiler(object):
+    """Decide which requests to profile and store their profiles"""
+
+    def __init__(self, directory, header='X-SL-Profile', header_value=None,
+                 rate=0.0):
+        self.directory = directory
+        self.header = header
+        self.header_value = header_value
+        self.rate = rate
+        self.skipped = 0                # selected while another was profiled
+        self._lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def wants(self, request_handler):
+        """True if this request should be profiled"""
+        if self.header and self.header_value is not None:
+            value = request_handler.headers.get(self.header)
+            if value is not None and hmac.compare_digest(
+                    value.encode('latin-1'),
+                    self.header_value.encode('latin-1')):
+                return True
+        return self.rate > 0.0 and random() < self.rate
+
+    def run(self, handler, application):
+        """Profile 'handler._run(application)' and save the results
+
+        If another request is being profiled, just run this one.
+        """
+        if not self._lock.acquire(False):
+            self.skipped += 1
+            return handler._run(application)
+        try:
+            self._run(handler, application)
+        finally:
+            self._lock.release()
+
+    def _run(self, handler, application):
+        import cProfile
+        request_handler = handler.request_handler
+        profile = cProfile.Profile()
+        started = time.time()
+        try:
+            profile.runcall(handler._run, application)
+        finally:
+            elapsed = time.time() - started
+            self.save(profile, {
+                'time': started,
+                'elapsed': elapsed,
+                'method': request_handler.command,
+                'path': request_handler.path,
+                'client': request_handler.client_address[0],
+                'status': handler.final_status,
+                'bytes': handler.final_bytes,
+                'pid': os.getpid(),
+            })
+
+    def save(self, profile, metadata):
+        """Write the profile and its metadata, returning the .prof path"""
+        path = metadata['path'].split('?', 1)[0]
+        name = '%d-%06d-%d-%s-%s' % (
+            metadata['time'], metadata['time'] % 1 * 1000000,
+            metadata['pid'], metadata['method'],
+            _unsafe.sub('_', path).strip('_')[:80] or 'root')
+        base = os.path.join(self.directory, name)
+        profile.dump_stats(base + '.prof')
+        with open(base + '.json', 'w') as f:
+            json.dump(metadata, f, indent=2, sort_keys=True)
+        return base + '.prof'
@@ -0,0 +1,122 @@
+"""Mount several WSGI applications by path prefix and Host header
+
+The mount table is compiled once into a trie of path segments per host, so
+finding the application for a request walks PATH_INFO a single time no
+matter how many applications are mounted.  The matched prefix is moved from
+PATH_INFO to SCRIPT_NAME by slicing, as 'shift_path_info()' would do one
+segment at a time.
+
+Usage::
+
+    from sl.router import Router
+
+    router = Router()
+    router.mount('/blog', blog_app)
+    router.mount('/api/v1', api_app)
+    router.mount('/', site_app, host='www.example.com')
+    make_server('', 8000, router).serve_forever()
+
+Prefixes match whole segments: '/blog' serves '/blog' and '/blog/post' but
+not '/blogger'.  The longest matching prefix wins; mounts for the request's
+host are tried before host-independent ones.
+"""
+
+__all__ = ['Router', 'not_found']
+
+
+def not_found(environ, start_response):
+    """Default application for requests no mount matches"""
+    start_response('404 Not Found', [('Content-Type', 'text/plain'),
+                                     ('Content-Length', '9')])
+    return [b'Not Found']
+
+
+class _Node(object):
+
+    __slots__ = ('app', 'children')
+
+    def __init__(self):
+        self.app = None
+        self.children = {}
+
+
+class Router(object):
+    """WSGI application dispatching to mounted applications"""
+
+    def __init__(self, default=not_found):
+        self.default = default
+        self.mounts = []
+        self._table = None
+
+    def mount(self, prefix, application, host=None):
+        """Serve requests under 'prefix' (and for 'host', if given)"""
+        prefix = prefix.rstrip('/')
+        if prefix and not prefix.startswith('/'):
+            raise ValueError("Mount prefix must start with '/': %r" % prefix)
+        if host is not None:
+            host = host.lower()
+        self.mounts.append((host, prefix, application))
+        self._table = None              # recompile on the next request
+
+    def compile(self):
+        """Build the lookup tries from the mount table"""
+        table = {}
+        for host, prefix, application in self.mounts:
+            node = table.get(host)
+            if node is None:
+                node = table[host] = _Node()
+            if prefix:
+                for segment in prefix[1:].split('/'):
+                    child = node.children.get(segment)
+                    if child is None:
+                        child = node.children[segment] = _Node()
+                    node = child
+            node.app = application
+        self._table = table
+        return table
+
+    def _match(self, node, path):
+        """Return (app, length of the matched prefix) within one trie"""
+        app, matched = node.app, 0
+        pos, length = 0, len(path)
+        while pos < length:
+            end = path.find('/', pos + 1)
+            if end < 0:
+                end = length
+            node = node.children.get(path[pos + 1:end])
+            if node is None:
+                break
+            pos = end
+            if node.app is not None:
+                app, matched = node.app, end
+        return app, matched
+
+    def lookup(self, environ):
+        """Return (app, matched prefix length) for a request, or (None, 0)"""
+        table = self._table
+        if table is None:
+            table = self.compile()
+        path = environ.get('PATH_INFO', '')
+        if len(table) > 1 or None not in table:
+            host = environ.get('HTTP_HOST') or environ.get('SERVER_NAME', '')
+            node = table.get(host.rsplit(':', 1)[0].lower()
+                             if not host.endswith(']') else host.lower())
+            if node is not None:
+                app, matched = self._match(node, path)
+                if app is not None:
+                    return app, matched
+        node = table.get(None)
+        if node is None:
+            return None, 0
+        return self._match(node, path)
+
+    def __call__(self, environ, start_response):
+        application, matched = self.lookup(environ)
+        if application is None:
+            return self.default(environ, start_response)
+        if matched:
+            path = environ.get('PATH_INFO', '')
+            script_name = environ.get('SCRIPT_NAME', '')
+            environ['SCRIPT_NAME'] = script_name + path[:matched]
+            environ['PATH_INFO'] = path[matched:]
+        return application(environ, start_response)
@@ -0,0 +1,217 @@
+"""Sampling profiler producing collapsed stacks for flame graphs
+
+A daemon thread wakes up 'rate' times per second, grabs every thread's
+current frame with 'sys._current_frames()' and counts the stack.  Stacks of
+threads that are serving a request are prefixed with the request
+("GET /path"), so a flame graph shows where time goes per endpoint.  At
+most 'max_labels' distinct labels are kept; later paths are counted as
+"GET (other)".  Pass 'route' to label requests some other way.
+
+The output is the "collapsed stack" format understood by flamegraph.pl,
+speedscope and friends: one line per distinct stack, frames separated by
+';' from the root, followed by a space and the sample count.
+
+Only the threads of the process running the sampler are seen.  The thread
+is not restarted in forked children, so with ForkingWSGIServer the
+per-request children are not sampled; long-lived workers may call
+'start()' themselves after forking.
+
+Usage::
+
+    httpd = make_server('', 8000, app)
+    httpd.enable_sampler(rate=100, path='/_sl/profile', signum=signal.SIGUSR2)
+    httpd.serve_forever()
+"""
+
+import os
+import sys
+import threading
+import time
+from threading import get_ident
+
+__all__ = ['Sampler']
+
+
+def default_route(request_handler):
+    return '%s %s' % (request_handler.command,
+                      request_handler.path.split('?', 1)[0])
+
+
+class Sampler(object):
+    """Periodically sample the stacks of all threads
+
+    'rate' is the number of samples per second, 'max_depth' the number of
+    innermost frames kept per stack.  If 'requests_only' is true, threads
+    that are not serving a request are not sampled.  'route', if given,
+    returns the label of the request served by a request handler.
+    """
+
+    max_labels = 100                    # distinct request labels kept
+
+    def __init__(self, rate=100, max_depth=64, requests_only=False,
+                 route=None):
+        self.interval = 1.0 / rate
+        self.max_depth = max_depth
+        self.requests_only = requests_only
+        self.route = route or default_route
+        self.active = {}                # thread ident -> request label
+        self.labels = set()
+        self.counts = {}                # (label, codes...) -> samples
+        self.samples = 0
+        self._names = {}
+        # Reentrant: dump() may run in a signal handler on a thread that
+        # is inside collapsed()
+        self._lock = threading.RLock()
+        self._dump_path = None          # set by the signal handler
+        self._dump_requested = False
+        self._thread = None
+        self._stop = threading.Event()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    # Request attribution (called from request threads)
+
+    def enter(self, request_handler):
+        label = self.route(request_handler)
+        if label not in self.labels:
+            if len(self.labels) >= self.max_labels:
+                label = '%s (other)' % request_handler.command
+            self.labels.add(label)
+        self.active[get_ident()] = label
+
+    def leave(self):
+        self.active.pop(get_ident(), None)
+
+    # Sampling thread
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run,
+                                            name='sl-sampler')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        own = get_ident()
+        interval = self.interval
+        deadline = time.monotonic()
+        while not self._stop.is_set():
+            if self._dump_requested:
+                self._dump_requested = False
+                self.dump(self._dump_path)
+            self.sample(own)
+            deadline += interval
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                self._stop.wait(delay)
+            else:
+                deadline = time.monotonic()  # fell behind; don't burst
+
+    def sample(self, skip=None):
+        """Take one sample of every thread except 'skip'"""
+        frames = sys._current_frames()
+        active = self.active
+        names = None
+        max_depth = self.max_depth
+        with self._lock:
+            counts = self.counts
+            for ident, frame in frames.items():
+                if ident == skip:
+                    continue
+                label = active.get(ident)
+                if label is None:
+                    if self.requests_only:
+                        continue
+                    if names is None:
+                        names = dict((t.ident, t.name)
+                                     for t in threading.enumerate())
+                    label = names.get(ident, 'thread-%d' % ident)
+                stack = []
+                while frame is not None and len(stack) < max_depth:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                stack.append(label)
+                stack.reverse()
+                key = tuple(stack)
+                counts[key] = counts.get(key, 0) + 1
+            self.samples += 1
+        del frames
+
+    # Output
+
+    def _frame_name(self, code):
+        name = self._names.get(code)
+        if name is None:
+            name = self._names[code] = '%s (%s:%d)' % (
+                code.co_name, code.co_filename, code.co_firstlineno)
+        return name
+
+    def collapsed(self, reset=False):
+        """Return the samples in collapsed-stack format"""
+        with self._lock:
+            counts = self.counts
+            if reset:
+                self.counts = {}
+        lines = []
+        for key, count in counts.items():
+            frames = [key[0]] + [self._frame_name(c) for c in key[1:]]
+            lines.append('%s %d' % (
+                ';'.join(f.replace(';', ':') for f in frames), count))
+        lines.sort()
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def dump(self, path=None, reset=False):
+        """Write the collapsed stacks to 'path' (default: a file in the
+        working directory named after the process id) and return the path"""
+        if path is None:
+            path = 'sl-profile-%d-%d.collapsed' % (os.getpid(), time.time())
+        with open(path, 'w') as f:
+            f.write(self.collapsed(reset))
+        return path
+
+    def install_signal(self, signum, path=None):
+        """Dump the profile whenever the process receives 'signum'
+
+        The handler only flags the request; the sampling thread writes the
+        file.  If the sampler is not running, the handler writes it.
+        """
+        import signal
+        signal.signal(signum, lambda signum, frame: self._request_dump(path))
+
+    def _request_dump(self, path):
+        if self._thread is None:
+            self.dump(path)
+        else:
+            self._dump_path = path
+            self._dump_requested = True
+
+    def app(self, environ, start_response):
+        """WSGI application serving the collapsed stacks
+
+        Add '?reset=1' to clear the samples after reading them.
+        """
+        reset = 'reset=1' in environ.get('QUERY_STRING', '')
+        body = self.collapsed(reset).encode('utf-8')
+        start_response('200 OK', [
+            ('Content-Type', 'text/plain; charset=utf-8'),
+            ('Content-Length', str(len(body))),
+        ])
+        return [body]
+
+    def _after_fork(self):
+        # Only the forking thread survives; samples belong to the parent.
+        self.active = {}
+        self.labels = set()
+        self.counts = {}
+        self.samples = 0
+        self._lock = threading.RLock()
+        self._dump_requested = False
+        self._stop = threading.Event()
+        self._thread = None
@@ -14,19 +14,29 @@ from __future__ import print_function
 
 import sys
 import os
+import errno
 import socket
-from .handlers import SimpleHandler
-from platform import python_implementation
+import select
+import stat
+import selectors
+import threading
+from time import perf_counter, sleep
+from .handlers import SimpleHandler, read_environ
+from .util import LimitedInput
+from .timing import RequestTimer
+from .listeners import SocketOptions
 try:  # Py3
+    import queue
     import http.client as status
     from http.server import HTTPServer, BaseHTTPRequestHandler
-    from socketserver import ThreadingMixIn
+    from socketserver import ThreadingMixIn, TCPServer
     from urllib import parse as urllib
     PY2 = False
 except ImportError:  # Py2
+    import Queue as queue
     import httplib as status
     from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
-    from SocketServer import ThreadingMixIn
+    from SocketServer import ThreadingMixIn, TCPServer
     import urllib
     PY2 = True
 
@@ -42,26 +52,20 @@ except ImportError:
             pass  # Forking Not Supported
         forking = False
 
-import logging
-logger = logging.getLogger(__name__)
-
-try:
-    import ssl
-except ImportError:
-
-    class SSL(object):
-        def __getattr__(self, name):
-            raise RuntimeError("SSL support unavailable")
-
-    ssl = SSL()
-
 __version__ = "3.0.1"
 __all__ = ['WSGIServer', 'ThreadingWSGIServer', 'ForkingWSGIServer',
-           'WSGIRequestHandler', 'demo_app', 'make_server', 'software_version', ]
+           'ThreadPoolMixIn', 'ThreadPoolWSGIServer', 'WSGIRequestHandler',
+           'demo_app', 'make_server', 'software_version', ]
 
 
 server_version = "ServeLight/" + __version__
-sys_version = python_implementation() + "/" + sys.version.split()[0]
+# platform.python_implementation() without importing platform
+_implementations = {'cpython': 'CPython', 'pypy': 'PyPy',
+                    'ironpython': 'IronPython', 'jython': 'Jython'}
+_implementation = getattr(sys, 'implementation', None)
+sys_version = _implementations.get(
+    _implementation.name if _implementation else 'cpython', 'CPython'
+) + "/" + sys.version.split()[0]
 software_version = server_version + ' ' + sys_version
 
 try:
@@ -72,13 +76,242 @@ except AttributeError:
 
 class ServerHandler(SimpleHandler):
 
+    """SimpleHandler driven by a WSGIRequestHandler
+
+    One instance serves every request on a connection and is then returned
+    to the server's pool for the next connection, so per-request state is
+    (re)initialized by 'reset()' rather than by creating a new object.
+    """
+
+    __slots__ = (
+        'request_handler',              # backpointer for logging
+        'timer',                        # RequestTimer, if timing is enabled
+        'server_timing',                # send a Server-Timing header
+        'final_status',                 # status and size as sent, kept
+        'final_bytes',                  # after close() resets the state
+        'head_request',                 # suppress the body on the wire
+        'buffer_size',                  # see BaseHandler.buffer_size
+        'http_version',                 # '1.1' if keep-alive is enabled
+    )
+
     server_software = software_version
 
+    def __init__(self, stdin, stdout, stderr, environ,
+                 multithread=True, multiprocess=False):
+        SimpleHandler.__init__(self, stdin, stdout, stderr, environ,
+                               multithread, multiprocess)
+        self.request_handler = self.timer = self.final_status = None
+        self.server_timing = self.head_request = False
+        self.final_bytes = self.buffer_size = 0
+        self.http_version = "1.0"
+
+    def bind(self, request_handler):
+        """Attach to the connection served by 'request_handler'"""
+        server = request_handler.server
+        self.request_handler = request_handler
+        self.stdin = request_handler.rfile
+        self.stdout = request_handler.wfile
+        self.stderr = request_handler.get_stderr()
+        self.buffer_size = server.response_buffer_size
+        self.http_version = "1.1" if server.keep_alive else "1.0"
+
+    def release(self):
+        """Drop all references to the connection before pooling"""
+        self.request_handler = self.stdin = self.stdout = self.stderr = None
+        self.base_env = self.environ = self.result = self.timer = None
+        self.status = self.headers = None
+
+    def reset(self, environ):
+        """Prepare for a new request with the given environ"""
+        self.base_env = environ
+        self.environ = self.status = self.result = self.headers = None
+        self.headers_sent = False
+        self.bytes_sent = 0
+        self.timer = self.final_status = None
+        self.final_bytes = 0
+        self.head_request = environ.get('REQUEST_METHOD') == 'HEAD'
+
+    def run(self, application):
+        profiler = self.request_handler.server.request_profiler
+        if profiler is not None and profiler.wants(self.request_handler):
+            return profiler.run(self, application)
+        return self._run(application)
+
+    def _run(self, application):
+        server = self.request_handler.server
+        metrics, sampler = server.metrics, server.sampler
+        if metrics is None and sampler is None:
+            return SimpleHandler.run(self, application)
+        if sampler is not None:
+            sampler.enter(self.request_handler)
+        if metrics is not None:
+            started = metrics.request_started()
+            self.final_status, self.final_bytes = None, 0
+        try:
+            SimpleHandler.run(self, application)
+        finally:
+            if metrics is not None:
+                metrics.request_finished(
+                    started, self.request_handler.command,
+                    self.final_status, self.final_bytes
+                )
+            if sampler is not None:
+                sampler.leave()
+
+    def setup_environ(self):
+        env = self.base_env
+        if 'wsgi.version' in env:
+            # Built in one pass by WSGIRequestHandler.get_environ() from the
+            # server's template; no need to copy the OS environment again.
+            self.environ = env
+        else:
+            SimpleHandler.setup_environ(self)
+        if self.timer is not None:
+            self.timer.environ_built = perf_counter()
+            self.timer.update_environ(self.environ)
+
+    def finish_response(self):
+        if self.timer is not None and self.timer.app_done is None:
+            self.timer.app_done = perf_counter()
+        if self.head_request:
+            return self.finish_head()
+        SimpleHandler.finish_response(self)
+
+    def finish_head(self):
+        """Answer a HEAD request: headers only, with the body's length
+
+        The result is only iterated as far as needed to learn the length:
+        not at all for lists and files, and up to the first block if the
+        application set Content-Length itself.
+        """
+        try:
+            length = self.head_length()
+            if length is None:
+                for data in self.result:
+                    self.write(data)
+                    if 'Content-Length' in self.headers:
+                        break
+                else:
+                    length = self.bytes_sent
+            if length is not None and self.headers is not None:
+                self.headers.setdefault('Content-Length', str(length))
+            self.bytes_sent = 0         # nothing but headers goes out
+            self.finish_content()
+        except:
+            if hasattr(self.result, 'close'):
+                self.result.close()
+            raise
+        else:
+            self.close()
+
+    def head_length(self):
+        """Return the body length if it is known without iterating"""
+        result = self.result
+        if not self.status:
+            return None                 # start_response not called yet
+        if type(result) in (list, tuple):
+            return self.bytes_sent + sum(map(len, result))
+        if self.result_is_file():
+            try:
+                filelike = result.filelike
+                size = os.fstat(filelike.fileno()).st_size
+                return self.bytes_sent + size - filelike.tell()
+            except (AttributeError, OSError, ValueError):
+                return None
+        return None
+
+    def sendfile(self):
+        """Send a regular file result with os.sendfile()
+
+        Used when the connection allows it ('zero_copy' of the request
+        handler): plain TCP, or TLS whose encryption the kernel took over
+        (kTLS).  Anything else is left to the usual block-by-block path.
+        """
+        if not self.request_handler.zero_copy or \
+                not hasattr(os, 'sendfile'):
+            return False
+        sock = self.request_handler.connection
+        timeout = sock.gettimeout()
+        filelike = self.result.filelike
+        try:
+            fd = filelike.fileno()
+            st = os.fstat(fd)
+            offset = filelike.tell()
+        except (AttributeError, OSError, ValueError):
+            return False
+        if not stat.S_ISREG(st.st_mode):
+            return False
+        remaining = st.st_size - offset
+        length = self.headers.get('Content-Length')
+        if length is None:
+            self.headers['Content-Length'] = str(remaining)
+        elif length.isdigit():
+            remaining = min(remaining, int(length))
+        if not self.headers_sent:
+            self.send_headers()
+        self._flush()
+        out = sock.fileno()
+        blksize = max(self.result.blksize, 1 << 20)
+        while remaining > 0:
+            try:
+                sent = os.sendfile(out, fd, offset, min(remaining, blksize))
+            except BlockingIOError:
+                # A socket with a timeout is non-blocking underneath
+                if not wait_writable(out, timeout):
+                    raise socket.timeout('timed out')
+                continue
+            if not sent:
+                break                   # the file shrank
+            offset += sent
+            remaining -= sent
+            self.bytes_sent += sent
+        return True
+
+    def write(self, data):
+        if not self.head_request:
+            return SimpleHandler.write(self, data)
+        # HEAD: count the body for Content-Length but never send it
+        assert type(data) is bytes, \
+            "write() argument must be a bytes instance"
+        if not self.status:
+            raise AssertionError("write() before start_response()")
+        self.bytes_sent += len(data)
+
+    def cleanup_headers(self):
+        SimpleHandler.cleanup_headers(self)
+        if self.http_version == "1.1":
+            request_handler = self.request_handler
+            if 'Content-Length' not in self.headers:
+                # The body is delimited by closing the connection
+                request_handler.close_connection = True
+            if request_handler.close_connection:
+                self.headers['Connection'] = 'close'
+            elif request_handler.request_version == 'HTTP/1.0':
+                self.headers['Connection'] = 'keep-alive'
+        timer = self.timer
+        if timer is not None:
+            if timer.app_done is None:
+                # The app called write() before returning
+                timer.app_done = perf_counter()
+            if self.server_timing:
+                self.headers['Server-Timing'] = timer.header()
+
     def close(self):
+        if self.timer is not None:
+            self.timer.write_done = perf_counter()
+        # Remember what was sent before SimpleHandler.close() resets it
+        self.final_status, self.final_bytes = self.status, self.bytes_sent
         try:
-            self.request_handler.log_request(
-                self.status.split(' ', 1)[0], self.bytes_sent
-            )
+            request_handler = self.request_handler
+            request_handler.server.requests_served += 1
+            access_logger = request_handler.server.access_logger
+            if access_logger is None:
+                request_handler.log_request(
+                    self.status.split(' ', 1)[0], self.bytes_sent
+                )
+            elif not request_handler.quiet:
+                access_logger.log(request_handler, self.status[:3],
+                                  self.bytes_sent, self.timer)
         finally:
             SimpleHandler.close(self)
 
@@ -93,6 +326,24 @@ class WSGIServer(HTTPServer):
     application = None
     multithread = False
     multiprocess = False
+    keep_alive = False                  # speak HTTP/1.1 persistent connections
+    keep_alive_timeout = 5.0            # idle seconds allowed between requests
+    response_buffer_size = 0            # see BaseHandler.buffer_size
+    handler_pool_size = 128
+    accept_batch = 64                   # connections accepted per wakeup
+    accept_backoff = 0.1                # pause when out of file descriptors
+    poll_strategy = 'auto'              # 'epoll', 'poll', 'select', 'selector'
+    reuse_port = False                  # SO_REUSEPORT: one queue per process
+    socket_options = SocketOptions()    # see set_socket_options()
+    os_environ_keys = ()                # OS variables copied into environs
+    requests_served = 0                 # approximate with threads
+    metrics = None
+    access_logger = None
+    sampler = None
+    request_profiler = None
+    tls = None
+    timing = False
+    server_timing = False
 
     def __init__(self, server_address=('', None), handler=None, fd=None, ssl_context=None, *args, **kwargs):
 
@@ -122,7 +373,11 @@ class WSGIServer(HTTPServer):
 
         HTTPServer.__init__(self, server_address, handler, *args, **kwargs)
 
+        self.admin_apps = {}
+        self.accept_times = {}
+        self.handler_pool = []          # idle ServerHandlers for reuse
         self.shutdown_signal = False
+        self._is_shut_down = threading.Event()
         self.host = self.socket.getsockname()[0]
         self.port = self.socket.getsockname()[1]
 
@@ -132,43 +387,62 @@ class WSGIServer(HTTPServer):
             self.socket = real_sock
             self.server_address = self.socket.getsockname()
 
-        if ssl_context:  # copied from werkzeug and edited    :copyright: 2007 Pallets    #:license: BSD-3-Clause
-            if isinstance(ssl_context, tuple) or isinstance(ssl_context, list):
-                sock = self.socket
-                protocol = None
-                certfile = ssl_context[0]
-                if len(ssl_context) > 1:
-                    keyfile = ssl_context[1]
-                else:
-                    keyfile = certfile
-                if len(ssl_context) > 2:
-                    protocol = ssl_context[2]
-                else:
-                    try:
-                        protocol = ssl.PROTOCOL_TLS_SERVER
-                    except AttributeError:
-                        # Python <= 3.5 compat
-                        protocol = ssl.PROTOCOL_SSLv23
-                # If we are on Python 2 the return value from socket.fromfd
-                # is an internal socket object but what we need for ssl wrap
-                # is the wrapper around it :(
-                #
-                if PY2 and not isinstance(sock, socket.socket):
-                    sock = socket.socket(
-                        sock.family, sock.type, sock.proto, sock)
-                self.socket = ssl.wrap_socket(
-                    sock, keyfile=keyfile, certfile=certfile, ssl_version=protocol, server_side=True)
+        if ssl_context:
+            if isinstance(ssl_context, (tuple, list)):
+                self.enable_tls(*ssl_context[:2])
+            else:
+                self.enable_tls(context=ssl_context)
+
+        self.listeners = [self.socket]
 
     def server_bind(self):
         """Override server_bind to store the server name."""
-        HTTPServer.server_bind(self)
+        if self.reuse_port and self.address_family != af_unix:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        TCPServer.server_bind(self)
+        self.set_server_name()
+        self.setup_environ()
+
+    def set_server_name(self):
+        """Derive SERVER_NAME and SERVER_PORT from the bound address"""
+        if isinstance(self.server_address, tuple):
+            host, port = self.server_address[:2]
+            self.server_name = socket.getfqdn(host)
+            self.server_port = port
+        else:                           # unix socket path
+            self.server_name = 'localhost'
+            self.server_port = 0
+
+    def use_socket(self, sock):
+        """Serve from the already listening 'sock' instead of binding
+
+        For servers created with bind_and_activate=False around sockets
+        bound elsewhere (sl.listeners.bind_socket(), socket activation).
+        """
+        self.socket.close()
+        self.socket = self.listeners[0] = sock
+        self.address_family = sock.family
+        self.server_address = sock.getsockname()
+        self.socket_options.apply_listener(sock)
+        self.set_server_name()
         self.setup_environ()
 
     def setup_environ(self):
-        # Set up base environment
+        # Set up the template every request environ is copied from
         env = self.base_environ = {}
+        if self.os_environ_keys:
+            os_environ = read_environ()
+            for key in self.os_environ_keys:
+                if key in os_environ:
+                    env[key] = os_environ[key]
+        env['wsgi.version'] = (1, 0)
+        env['wsgi.url_scheme'] = 'https' if self.tls is not None else 'http'
+        env['wsgi.errors'] = sys.stderr
+        env['wsgi.run_once'] = False
         env['wsgi.multithread'] = self.multithread
         env['wsgi.multiprocess'] = self.multiprocess
+        if ServerHandler.wsgi_file_wrapper is not None:
+            env['wsgi.file_wrapper'] = ServerHandler.wsgi_file_wrapper
         env['SERVER_NAME'] = self.server_name
         env['GATEWAY_INTERFACE'] = 'CGI/1.1'
         env['SERVER_PORT'] = str(self.server_port)
@@ -182,13 +456,253 @@ class WSGIServer(HTTPServer):
     def set_app(self, application):
         self.application = application
 
-    def serve_forever(self):
-        self.shutdown_signal = False
+    def get_admin_app(self, path):
+        """Return the built-in app mounted at 'path', if any"""
+        return self.admin_apps.get(path)
+
+    def enable_metrics(self, path='/metrics', slots=1, **kwargs):
+        """Collect request metrics and serve them at 'path'
+
+        The metrics app is answered by the server itself, without going
+        through the WSGI application.  'slots' is the number of processes
+        that may publish metrics at once (see sl.metrics).
+        """
+        from .metrics import Metrics
+        self.metrics = Metrics(slots=slots, **kwargs)
+        self.metrics.add_metric(
+            'sl_listen_queue_depth',
+            'Connections waiting to be accepted, per listener.',
+            self.accept_queue_depths)
+        if self.tls is not None:
+            self.tls.register_metrics(self.metrics)
+        if path:
+            self.admin_apps[path] = self.metrics.app
+        return self.metrics
+
+    def enable_tls(self, certfile=None, keyfile=None, context=None,
+                   handshake_timeout=None, **kwargs):
+        """Serve HTTPS, handshaking in the connection's worker (see sl.tls)
+
+        Pass either a certificate (and key) file, with further
+        sl.tls.make_context() options as keywords, or a ready SSLContext.
+        """
+        try:
+            from .tls import TLS, make_context
+        except ImportError:
+            raise RuntimeError("SSL support unavailable")
+        if context is None:
+            context = make_context(certfile, keyfile, **kwargs)
+        self.tls = TLS(context, handshake_timeout)
+        if self.metrics is not None:
+            self.tls.register_metrics(self.metrics)
+        self.base_environ['wsgi.url_scheme'] = 'https'
+        return self.tls
+
+    def enable_timing(self, server_timing=True):
+        """Time each phase of every request (see sl.timing)
+
+        Phase durations are added to the environ and the access log, and
+        also sent as a 'Server-Timing' header if 'server_timing' is true.
+        """
+        self.timing = True
+        self.server_timing = server_timing
+
+    def enable_access_log(self, stream=None, format='combined', sample=1.0,
+                          **kwargs):
+        """Write the access log from a background thread (see sl.accesslog)
+
+        'stream' defaults to sys.stderr; 'format' is 'combined' or 'json';
+        'sample' is the fraction of requests to log.
+        """
+        from .accesslog import AccessLogger
+        self.access_logger = AccessLogger(stream, format, sample, **kwargs)
+        return self.access_logger
+
+    def enable_sampler(self, rate=100, path='/_sl/profile', signum=None,
+                       **kwargs):
+        """Start a sampling profiler thread (see sl.sampler)
+
+        Collapsed stacks are served at 'path' and, if 'signum' is given,
+        dumped to a file whenever the process receives that signal.
+        """
+        from .sampler import Sampler
+        self.sampler = Sampler(rate, **kwargs)
+        if path:
+            self.admin_apps[path] = self.sampler.app
+        if signum is not None:
+            self.sampler.install_signal(signum)
+        self.sampler.start()
+        return self.sampler
+
+    def enable_request_profiler(self, directory, header='X-SL-Profile',
+                                header_value=None, rate=0.0):
+        """Profile selected requests with cProfile (see sl.profiler)
+
+        A request is profiled if it carries 'header' with the secret value
+        'header_value' (the header is ignored while that is None) or,
+        failing that, with probability 'rate'.  One request is profiled at
+        a time.
+        """
+        from .profiler import RequestProfiler
+        self.request_profiler = RequestProfiler(
+            directory, header, header_value, rate)
+        return self.request_profiler
+
+    def add_listener(self, sock):
+        """Also accept connections from the listening socket 'sock'
+
+        'sock' may be a TCP or unix socket of any family, for example one
+        from sl.listeners.bind_socket() or systemd_sockets().  Connections
+        from every listener are served by this server's application.
+        """
+        self.socket_options.apply_listener(sock)
+        self.listeners.append(sock)
+        return sock
+
+    def set_socket_options(self, options):
+        """Tune every listener and future connection (see sl.listeners)
+
+        'options' is a SocketOptions instance; listeners added later with
+        add_listener() are tuned as well.
+        """
+        self.socket_options = options
+        for sock in self.listeners:
+            options.apply_listener(sock)
+
+    def server_close(self):
+        HTTPServer.server_close(self)
+        for sock in self.listeners[1:]:
+            sock.close()
+        if self.access_logger is not None:
+            self.access_logger.close()
+        if self.sampler is not None:
+            self.sampler.stop()
+
+    def handle_error(self, request, client_address):
+        if self.tls is not None:
+            from .tls import HandshakeFailed
+            if isinstance(sys.exc_info()[1], HandshakeFailed):
+                return                  # counted by self.tls; not a bug
+        HTTPServer.handle_error(self, request, client_address)
+
+    def get_request(self, listener=None):
+        request, client_address = (listener or self.socket).accept()
+        if not client_address:          # unix socket peers have no address
+            client_address = ('<local>', 0)
+        if self.timing:
+            self.accept_times[request] = perf_counter()
+        return request, client_address
+
+    def close_request(self, request):
+        if self.accept_times:
+            self.accept_times.pop(request, None)
+        HTTPServer.close_request(self, request)
+
+    def accept_capacity(self):
+        """Number of connections the next batch may accept"""
+        return self.accept_batch
+
+    def accept_requests(self, listener):
+        """Accept and process up to 'accept_batch' pending connections
+
+        Running out of file descriptors pauses accepting for
+        'accept_backoff' seconds: the listener stays readable, so the
+        poller would otherwise wake up again at once.
+        """
+        for i in range(self.accept_capacity()):
+            try:
+                request, client_address = self.get_request(listener)
+            except (BlockingIOError, InterruptedError):
+                return                  # accept queue drained
+            except OSError as e:
+                if e.errno in _accept_exhausted:
+                    sleep(self.accept_backoff)
+                    return
+                if e.errno in _accept_transient:
+                    continue            # that client is gone; try the next
+                raise
+            if self.verify_request(request, client_address):
+                try:
+                    self.process_request(request, client_address)
+                except Exception:
+                    self.handle_error(request, client_address)
+                    self.shutdown_request(request)
+                except:
+                    self.shutdown_request(request)
+                    raise
+            else:
+                self.shutdown_request(request)
+
+    def accept_queue_depths(self):
+        """Yield ({'listener': address}, queued connections) per listener"""
+        from .listeners import accept_queue, listener_name
+        for sock in self.listeners:
+            queue = accept_queue(sock)
+            if queue is not None:
+                yield {'listener': listener_name(sock)}, queue[0]
+
+    def serve_forever(self, poll_interval=0.5):
+        """Serve connections from every listener until shutdown()
+
+        One poller watches all listening sockets; each wakeup accepts the
+        pending connections of a ready socket in a batch instead of going
+        back to the poller after every one.  'poll_strategy' picks the
+        poller: 'epoll' is used directly (with EPOLLEXCLUSIVE, so workers
+        sharing a socket are not all woken), 'poll' and 'select' go through
+        the selectors module; 'auto' prefers epoll where available.
+        """
+        self._is_shut_down.clear()
+        strategy = self.poll_strategy
+        if strategy == 'auto':
+            strategy = 'epoll' if hasattr(select, 'epoll') else 'selector'
+        for sock in self.listeners:
+            sock.setblocking(False)
         try:
-            HTTPServer.serve_forever(self)
+            if strategy == 'epoll':
+                self.serve_epoll(poll_interval)
+            else:
+                self.serve_selector(poll_interval, _selectors[strategy])
         except KeyboardInterrupt as e:
             self.server_close()  # Prevent ResourceWarning: unclosed socket # from bottlepy
             raise e
+        finally:
+            self.shutdown_signal = False
+            self._is_shut_down.set()
+
+    def serve_epoll(self, poll_interval):
+        listeners = dict((sock.fileno(), sock) for sock in self.listeners)
+        flags = select.EPOLLIN | getattr(select, 'EPOLLEXCLUSIVE', 0)
+        poller = select.epoll()
+        try:
+            for fd in listeners:
+                poller.register(fd, flags)
+            while not self.shutdown_signal:
+                events = poller.poll(poll_interval)
+                # Accept even when shutting down: with EPOLLEXCLUSIVE this
+                # may have been the only process woken for the connection
+                for fd, event in events:
+                    self.accept_requests(listeners[fd])
+                self.service_actions()
+        finally:
+            poller.close()
+
+    def serve_selector(self, poll_interval, selector_class):
+        selector = selector_class()
+        try:
+            for sock in self.listeners:
+                selector.register(sock, selectors.EVENT_READ)
+            while not self.shutdown_signal:
+                ready = selector.select(poll_interval)
+                for key, events in ready:
+                    self.accept_requests(key.fileobj)
+                self.service_actions()
+        finally:
+            selector.close()
+
+    def shutdown(self):
+        """Stop the serve_forever() loop and wait until it has returned"""
+        self.shutdown_signal = True
+        self._is_shut_down.wait()
 
 
 class WSGIRequestHandler(BaseHTTPRequestHandler):
@@ -196,14 +710,62 @@ class WSGIRequestHandler(BaseHTTPRequestHandler):
     """A request handler that implements WSGI dispatching."""
 
     server_version = "ServerLight/" + __version__
+    quiet = False                       # set to True to skip access logging
+    accepted = None                     # accept() time, if timing
+    timer = None
+    server_handler_class = ServerHandler
+    wsgi_handler = None                 # ServerHandler for this connection
+    body = None                         # LimitedInput, on keep-alive
+    zero_copy = True                    # os.sendfile() may write to the socket
+    idle_timeout = None                 # keep_alive_timeout, on keep-alive
+    max_drain = 65536                   # unread body bytes worth skipping
+
+    def setup(self):
+        if self.server.timing:
+            # Keyed by the accepted socket, before TLS replaces it
+            self.accepted = self.server.accept_times.pop(self.request, None)
+        tls = self.server.tls
+        if tls is not None:
+            self.request = tls.wrap(self.request)
+            self.zero_copy = tls.kernel_offload(self.request)
+        BaseHTTPRequestHandler.setup(self)
+        self.server.socket_options.apply_connection(self.connection)
+        if self.server.keep_alive:
+            self.protocol_version = "HTTP/1.1"
+            self.idle_timeout = self.server.keep_alive_timeout
+
+    def handle_one_request(self):
+        if self.idle_timeout is not None:
+            # Wait at most 'idle_timeout' seconds for the next request and
+            # its headers, so an idle connection does not keep its thread
+            # (or the server) from serving others; parse_request() puts
+            # the usual timeout back.
+            self.connection.settimeout(self.idle_timeout)
+            try:
+                self.rfile.peek(1)
+            except socket.timeout:
+                self.close_connection = True
+                return
+        BaseHTTPRequestHandler.handle_one_request(self)
+
+    def parse_request(self):
+        timing = self.server.timing
+        if timing:
+            started = perf_counter()
+        result = BaseHTTPRequestHandler.parse_request(self)
+        if self.idle_timeout is not None:
+            self.connection.settimeout(self.timeout)
+        if timing:
+            # Only the first request on a connection waited in the accept
+            # queue
+            self.timer = RequestTimer(self.accepted, started, perf_counter())
+            self.accepted = None
+        return result
 
     def get_environ(self):
         env = self.server.base_environ.copy()
-        env['wsgi.version'] = (1, 0)
-        env['wsgi.url_scheme'] = 'http'
         env['wsgi.input'] = self.rfile
-        env['wsgi.error'] = sys.stderr
-        env['wsgi.run_once'] = False
+        env['wsgi.errors'] = self.get_stderr()
         env['SERVER_PROTOCOL'] = self.request_version
         env['SERVER_SOFTWARE'] = self.server_version
         env['REQUEST_METHOD'] = self.command
@@ -231,7 +793,12 @@ class WSGIRequestHandler(BaseHTTPRequestHandler):
         else:
             env['REMOTE_ADDR'] = self.client_address[0]
 
-        env['REMOTE_PORT'] = self.client_address[1]
+        env['REMOTE_PORT'] = str(self.client_address[1])
+        if len(self.server.listeners) > 1:
+            # Report the port of the listener this connection arrived on
+            local = self.connection.getsockname()
+            if isinstance(local, tuple):
+                env['SERVER_PORT'] = str(local[1])
 
         try:
             if self.headers.typeheader is None:
@@ -262,30 +829,98 @@ class WSGIRequestHandler(BaseHTTPRequestHandler):
     def get_stderr(self):
         return sys.stderr
 
-    def do_GET(self):
-
-        handler = ServerHandler(
-            self.rfile, self.wfile, self.get_stderr(), self.get_environ(),
-            multithread=False,
-        )
-        handler.request_handler = self      # backpointer for logging
-        handler.run(self.server.get_app())
-
-    def do_POST(self):
-
-        handler = ServerHandler(
-            self.rfile, self.wfile, self.get_stderr(), self.get_environ(),
-            multithread=False,
-        )
-        handler.request_handler = self      # backpointer for logging
-        handler.run(self.server.get_app())
+    def get_app(self):
+        """Return the app for this request: a built-in one, or the server's"""
+        if self.server.admin_apps:
+            app = self.server.get_admin_app(self.path.split('?', 1)[0])
+            if app is not None:
+                return app
+        return self.server.get_app()
+
+    def get_handler(self):
+        """Return this connection's ServerHandler, reset for a new request
+
+        The handler is taken from the server's pool on the first request
+        of a connection and kept for the following ones.
+        """
+        handler = self.wsgi_handler
+        if handler is None:
+            try:
+                handler = self.server.handler_pool.pop()
+            except IndexError:
+                handler = self.server_handler_class(
+                    None, None, None, None, multithread=False)
+            handler.bind(self)
+            self.wsgi_handler = handler
+        environ = self.get_environ()
+        if self.server.keep_alive:
+            self.limit_input(environ)
+        handler.reset(environ)
+        if self.timer is not None:
+            handler.timer = self.timer
+            handler.server_timing = self.server.server_timing
+        return handler
+
+    def limit_input(self, environ):
+        """Keep the app from reading past the body on a persistent connection"""
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            self.close_connection = True    # chunked request bodies: no reuse
+            return
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            self.close_connection = True
+            return
+        self.body = environ['wsgi.input'] = LimitedInput(self.rfile, length)
+
+    def finish_input(self):
+        """Skip any unread body so the next request can be parsed"""
+        body, self.body = self.body, None
+        if body is not None and body.remaining and not self.close_connection:
+            if body.remaining > self.max_drain:
+                self.close_connection = True
+            else:
+                body.drain()
+
+    def finish(self):
+        BaseHTTPRequestHandler.finish(self)
+        if self.server.tls is not None:
+            # The server only knows the plain socket the TLS one replaced
+            self.server.shutdown_request(self.request)
+        handler = self.wsgi_handler
+        if handler is not None:
+            self.wsgi_handler = None
+            handler.release()
+            pool = self.server.handler_pool
+            if len(pool) < self.server.handler_pool_size:
+                pool.append(handler)
+
+    def run_wsgi(self):
+        """Dispatch the current request, whatever its method, to the app"""
+        self.get_handler().run(self.get_app())
+        if self.body is not None:
+            self.finish_input()
+
+    do_GET = do_HEAD = do_POST = do_PUT = do_DELETE = do_PATCH = run_wsgi
+    do_OPTIONS = do_TRACE = run_wsgi
+
+    def __getattr__(self, name):
+        # BaseHTTPRequestHandler looks up 'do_' + method; send extension
+        # methods (PROPFIND, PURGE, ...) to the application as well.
+        if name.startswith('do_'):
+            return self.run_wsgi
+        raise AttributeError(name)
 
     def address_string(self):  # Prevent reverse DNS lookups please. # from bottlepy
         return self.client_address[0]
 
-    def log_request(self, *args, **kw):  # from bottlepy
-        if not self.quiet:
-            return BaseHTTPRequestHandler.log_request(*args, **kw)
+    def log_request(self, code='-', size='-'):  # from bottlepy
+        if self.quiet:
+            return
+        if self.timer is None:
+            return BaseHTTPRequestHandler.log_request(self, code, size)
+        self.log_message('"%s" %s %s %s', self.requestline, str(code),
+                         str(size), self.timer.log_string())
 
 
 class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
@@ -298,6 +933,69 @@ class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
     daemon_threads = True
 
 
+class ThreadPoolMixIn(object):
+
+    """Handle connections in a fixed pool of 'pool_size' threads
+
+    Unlike ThreadingMixIn no thread is started per connection; accepted
+    connections wait in a queue for the next free thread.  The pool is
+    started on the first connection, so a server created before forking
+    gets a fresh pool in every worker.
+
+    If 'pool_queue_size' is set, at most that many connections wait for a
+    thread; the accept loop then blocks and further clients stay in the
+    listen backlog, where another worker may pick them up.
+    """
+    pool_size = 8
+    pool_queue_size = 0                 # 0: unbounded
+    pool_queue = None
+
+    def start_pool(self):
+        self.pool_queue = queue.Queue(self.pool_queue_size)
+        self.pool_threads = []
+        for i in range(self.pool_size):
+            thread = threading.Thread(target=self.pool_worker,
+                                      name='sl-pool-%d' % i)
+            thread.daemon = True
+            thread.start()
+            self.pool_threads.append(thread)
+
+    def pool_worker(self):
+        get = self.pool_queue.get
+        while True:
+            item = get()
+            if item is None:
+                return
+            request, client_address = item
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def process_request(self, request, client_address):
+        if self.pool_queue is None:
+            self.start_pool()
+        self.pool_queue.put((request, client_address))
+
+    def server_close(self):
+        super(ThreadPoolMixIn, self).server_close()
+        if self.pool_queue is not None:
+            # Queued connections are still served before the threads stop
+            for thread in self.pool_threads:
+                self.pool_queue.put(None)
+            for thread in self.pool_threads:
+                thread.join()
+            self.pool_queue = None
+
+
+class ThreadPoolWSGIServer(ThreadPoolMixIn, WSGIServer):
+
+    """WSGIServer serving connections from a fixed pool of threads"""
+    multithread = True
+
+
 class ForkingWSGIServer(ForkingMixIn, WSGIServer):
 
     """A WSGI server that does forking.
@@ -305,9 +1003,79 @@ class ForkingWSGIServer(ForkingMixIn, WSGIServer):
     using the ForkingMixIn. This is useful to handle web 
     browsers pre-opening sockets, on which Server would wait indefinitely.
     """
-    multiprocess = False
+    multithread = not forking
+    multiprocess = forking
     forking = forking
 
+    def enable_metrics(self, path='/metrics', slots=None, **kwargs):
+        # One slot for this process plus one per concurrent child
+        if slots is None:
+            slots = (self.max_children or 40) + 1
+        return WSGIServer.enable_metrics(self, path, slots, **kwargs)
+
+    def accept_capacity(self):
+        # Never run more than 'max_children' children (each one needs a
+        # metrics slot): wait for one to exit if the limit is reached
+        if not self.forking or not self.max_children:
+            return self.accept_batch
+        if self.active_children and \
+                len(self.active_children) >= self.max_children:
+            self.collect_children()
+        live = len(self.active_children or ())
+        return max(1, min(self.accept_batch, self.max_children - live))
+
+    def process_request(self, request, client_address):
+        if self.metrics is None or not self.forking:
+            return ForkingMixIn.process_request(self, request, client_address)
+        self.active_children = self.active_children or set()
+        slot = self.metrics.reserve_slot(self.active_children)
+        self._metrics_slot = slot           # inherited by the child
+        before = set(self.active_children)
+        ForkingMixIn.process_request(self, request, client_address)
+        if slot is not None:
+            for pid in self.active_children - before:
+                self.metrics.assign_slot(slot, pid)
+
+    def finish_request(self, request, client_address):
+        # Runs in the forked child when forking is supported
+        if not self.forking:
+            return WSGIServer.finish_request(self, request, client_address)
+        if self.metrics is not None:
+            self.metrics.enter_worker(self._metrics_slot)
+        try:
+            WSGIServer.finish_request(self, request, client_address)
+        finally:
+            # The child exits with os._exit(), so publish everything now
+            if self.metrics is not None:
+                self.metrics.flush()
+            if self.access_logger is not None:
+                self.access_logger.flush()
+
+
+# accept() errors: out of resources (back off), or a connection that failed
+# before it could be accepted (skip it, as accept(2) recommends on Linux)
+_accept_exhausted = frozenset(getattr(errno, name) for name in (
+    'EMFILE', 'ENFILE', 'ENOBUFS', 'ENOMEM') if hasattr(errno, name))
+_accept_transient = frozenset(getattr(errno, name) for name in (
+    'ECONNABORTED', 'EPROTO', 'EPERM', 'ENETDOWN', 'ENOPROTOOPT',
+    'EHOSTDOWN', 'ENONET', 'EHOSTUNREACH', 'EOPNOTSUPP', 'ENETUNREACH')
+    if hasattr(errno, name))
+
+_selectors = {
+    'selector': selectors.DefaultSelector,
+    'poll': getattr(selectors, 'PollSelector', selectors.DefaultSelector),
+    'select': selectors.SelectSelector,
+}
+
+
+def wait_writable(fd, timeout):
+    """Wait up to 'timeout' seconds until the socket 'fd' takes more data"""
+    if hasattr(select, 'poll'):
+        poller = select.poll()
+        poller.register(fd, select.POLLOUT)
+        return bool(poller.poll(None if timeout is None else timeout * 1000))
+    return bool(select.select([], [fd], [], timeout)[1])
+
 
 def get_sockaddr(host, port, family):
     """Return a fully qualified socket address that can be passed to
@@ -342,9 +1110,15 @@ def demo_app(environ, start_response):
 
 
 def make_server(
-    host, port, app, server_class=WSGIServer, handler_class=WSGIRequestHandler
+    host, port, app, server_class=WSGIServer, handler_class=WSGIRequestHandler,
+    socket_options=None
 ):
-    """Create a new WSGI server listening on `host` and `port` for `app`"""
+    """Create a new WSGI server listening on `host` and `port` for `app`
+
+    `socket_options` is an optional sl.listeners.SocketOptions instance.
+    """
     server = server_class((host, port), handler_class)
     server.set_app(app)
+    if socket_options is not None:
+        server.set_socket_options(socket_options)
     return server
@@ -0,0 +1,188 @@
+"""Size workers and threads from the CPU and memory the process may use
+
+In a container 'os.cpu_count()' reports the host's cores, not the CPU
+quota of the container, so sizing from it oversubscribes.  This module
+reads the limits of the process's cgroup (v1 or v2, under
+/sys/fs/cgroup) -- the CPU quota, the cpuset through the CPU affinity,
+and the memory limit -- and derives the number of worker processes,
+threads per worker and connections per worker from them:
+
+* one worker per CPU allowed (rounded down, at least one);
+* no more workers than fit in 3/4 of the memory limit, counting
+  'worker_memory' bytes per worker;
+* 'threads' threads per worker, and 'connections_per_thread' connections
+  admitted per thread (the rest wait in the listen backlog).
+
+Usage::
+
+    sizing = auto_size()
+    logger.info('%s', sizing)
+    arbiter = Arbiter(server, sizing.workers)
+
+'python -m sl --workers auto --threads auto' does this at startup.
+"""
+
+import math
+import os
+
+__all__ = ['Sizing', 'auto_size', 'cpu_limit', 'memory_limit',
+           'cgroup_paths']
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+
+# cgroup v1 reports "no limit" as a huge, page aligned number
+_unlimited = 1 << 60
+
+MEMORY_HEADROOM = 0.75                  # share of the limit workers may use
+
+
+def cgroup_paths(proc_file='/proc/self/cgroup'):
+    """Map each cgroup v1 controller (and '' for v2) to our cgroup path"""
+    paths = {}
+    try:
+        with open(proc_file) as f:
+            for line in f:
+                parts = line.rstrip('\n').split(':', 2)
+                if len(parts) == 3:
+                    for controller in parts[1].split(','):
+                        paths[controller] = parts[2]
+    except OSError:
+        pass
+    return paths
+
+
+def _directories(base, path):
+    """The cgroup directory for 'path' under 'base' and its ancestors
+
+    Limits are hierarchical, so the smallest one on the way up applies.
+    Inside a cgroup namespace the path is '/' and 'base' is the cgroup.
+    """
+    parts = [part for part in path.split('/') if part]
+    while True:
+        directory = os.path.join(base, *parts)
+        if os.path.isdir(directory):
+            yield directory
+        if not parts:
+            return
+        parts.pop()
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _v1_base(root, controller):
+    for name in (controller, 'cpu,cpuacct', 'cpuacct,cpu'):
+        base = os.path.join(root, name)
+        if os.path.isdir(base) and (name == controller or
+                                    controller in name.split(',')):
+            return base
+    return None
+
+
+def cpu_limit(root=CGROUP_ROOT, paths=None):
+    """CPUs this process may use, possibly fractional
+
+    The smallest of the CPU affinity (cpuset) and the cgroup CPU quota.
+    Returns (cpus, source) where source tells where the figure comes from.
+    """
+    if paths is None:
+        paths = cgroup_paths()
+    if hasattr(os, 'sched_getaffinity'):
+        cpus, source = float(len(os.sched_getaffinity(0))), 'affinity'
+    else:
+        cpus, source = float(os.cpu_count() or 1), 'cpu_count'
+    quotas = []
+    if '' in paths:                     # cgroup v2: "max 100000" or "q p"
+        for directory in _directories(root, paths['']):
+            value = _read(os.path.join(directory, 'cpu.max'))
+            if value and not value.startswith('max'):
+                quota, period = value.split()[:2]
+                quotas.append(float(quota) / float(period))
+    base = _v1_base(root, 'cpu')
+    if base is not None and 'cpu' in paths:
+        for directory in _directories(base, paths['cpu']):
+            quota = _read(os.path.join(directory, 'cpu.cfs_quota_us'))
+            period = _read(os.path.join(directory, 'cpu.cfs_period_us'))
+            if quota and period and int(quota) > 0:
+                quotas.append(float(quota) / float(period))
+    if quotas and min(quotas) < cpus:
+        cpus, source = min(quotas), 'cgroup quota'
+    return cpus, source
+
+
+def memory_limit(root=CGROUP_ROOT, paths=None):
+    """Bytes of memory this process may use, or None if unlimited
+
+    Returns (limit, source), also considering the physical memory.
+    """
+    if paths is None:
+        paths = cgroup_paths()
+    limits = []
+    if '' in paths:
+        for directory in _directories(root, paths['']):
+            value = _read(os.path.join(directory, 'memory.max'))
+            if value and value != 'max':
+                limits.append(int(value))
+    base = _v1_base(root, 'memory')
+    if base is not None and 'memory' in paths:
+        for directory in _directories(base, paths['memory']):
+            value = _read(os.path.join(directory, 'memory.limit_in_bytes'))
+            if value and int(value) < _unlimited:
+                limits.append(int(value))
+    physical = None
+    try:
+        physical = os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        pass
+    if limits and (physical is None or min(limits) < physical):
+        return min(limits), 'cgroup limit'
+    return physical, 'physical memory'
+
+
+class Sizing(object):
+    """Worker, thread and connection counts derived from the limits"""
+
+    def __init__(self, cpus, cpu_source, memory, memory_source, workers,
+                 threads, max_connections, reason):
+        self.cpus = cpus
+        self.cpu_source = cpu_source
+        self.memory = memory            # bytes, or None if unknown
+        self.memory_source = memory_source
+        self.workers = workers
+        self.threads = threads
+        self.max_connections = max_connections      # per worker
+        self.reason = reason            # what bounded the worker count
+
+    def key(self):
+        return (self.workers, self.threads, self.max_connections)
+
+    def __str__(self):
+        memory = 'unknown memory'
+        if self.memory is not None:
+            memory = '%.0f MB memory (%s)' % (self.memory / 1048576.0,
+                                              self.memory_source)
+        return ('%g CPUs (%s), %s: %d workers (%s) x %d threads, '
+                'up to %d connections per worker' % (
+                    self.cpus, self.cpu_source, memory, self.workers,
+                    self.reason, self.threads, self.max_connections))
+
+
+def auto_size(worker_memory=64 << 20, threads=4, connections_per_thread=4,
+              root=CGROUP_ROOT):
+    """Return the Sizing for the limits of this process's cgroup"""
+    paths = cgroup_paths()
+    cpus, cpu_source = cpu_limit(root, paths)
+    memory, memory_source = memory_limit(root, paths)
+    workers = max(1, int(math.floor(cpus + 1e-6)))
+    reason = 'one per CPU'
+    if memory is not None and worker_memory:
+        fit = max(1, int(memory * MEMORY_HEADROOM // worker_memory))
+        if fit < workers:
+            workers, reason = fit, 'memory bound'
+    return Sizing(cpus, cpu_source, memory, memory_source, workers,
+                  threads, threads * connections_per_thread, reason)
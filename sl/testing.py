@@ -0,0 +1,205 @@
+"""In-process test client
+
+A Client runs a WSGI application the way the server does -- through a
+handler's start_response() checks, header cleanup and Content-Length
+logic -- but without any socket: the request body is read from and the
+response written to in-memory streams, and the raw response is parsed
+back into a Response.  The environ is built from the request the same way
+WSGIRequestHandler builds it, minus the OS environment, so results do not
+depend on the machine running them.
+
+Usage::
+
+    client = Client(app)
+    response = client.get('/hello?name=world')
+    assert response.status_code == 200
+    response = client.post('/items', b'{"name": "x"}',
+                           headers={'Content-Type': 'application/json'})
+
+    for response in client.replay([('GET', '/'), ('GET', '/about')]):
+        ...
+
+Exceptions raised by the application are re-raised by the client if
+'raise_errors' is true (the default); otherwise the handler's 500 response
+is returned and the traceback is available as 'response.errors'.
+"""
+
+import sys
+from io import BytesIO, StringIO
+
+from .handlers import SimpleHandler
+from .headers import Headers
+
+try:
+    from urllib.parse import unquote
+except ImportError:
+    from urllib import unquote
+
+__all__ = ['Client', 'Response', 'parse_response']
+
+
+class ClientHandler(SimpleHandler):
+    """SimpleHandler that keeps the application's exception"""
+
+    __slots__ = ('exc_info',)
+
+    os_environ = {}                     # deterministic: no OS environment
+
+    def __init__(self, *args, **kw):
+        SimpleHandler.__init__(self, *args, **kw)
+        self.exc_info = None
+
+    def handle_error(self):
+        self.exc_info = sys.exc_info()
+        SimpleHandler.handle_error(self)
+
+
+class Response(object):
+    """A parsed response: 'status' line, 'headers' and 'body' bytes"""
+
+    def __init__(self, status, headers, body, errors=''):
+        self.status = status
+        self.headers = headers          # an sl.headers.Headers
+        self.body = body
+        self.errors = errors            # what was written to wsgi.errors
+
+    @property
+    def status_code(self):
+        return int(self.status.split(None, 1)[0])
+
+    @property
+    def text(self):
+        """The body decoded with the charset of its Content-Type"""
+        charset = 'iso-8859-1'
+        for param in (self.headers.get('Content-Type') or '').split(';')[1:]:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'charset':
+                charset = value.strip().strip('"')
+        return self.body.decode(charset)
+
+    def __repr__(self):
+        return '<Response %s, %d bytes>' % (self.status, len(self.body))
+
+
+def parse_response(data, errors=''):
+    """Parse the raw HTTP response 'data' (bytes) into a Response"""
+    head, _, body = data.partition(b'\r\n\r\n')
+    lines = head.decode('iso-8859-1').split('\r\n')
+    status = lines[0].split(None, 1)[1]     # drop the HTTP version
+    headers = []
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        headers.append((name, value.strip()))
+    return Response(status, Headers(headers), body, errors)
+
+
+class Client(object):
+    """Run requests through 'application' without sockets
+
+    'environ' holds extra variables added to every request's environ.
+    """
+
+    handler_class = ClientHandler
+
+    def __init__(self, application, environ=None, raise_errors=True,
+                 multithread=False, multiprocess=False):
+        self.application = application
+        self.environ = environ or {}
+        self.raise_errors = raise_errors
+        self.multithread = multithread
+        self.multiprocess = multiprocess
+
+    def build_environ(self, method, path, body=b'', headers=None,
+                      environ=None):
+        """Return the CGI variables of a request, as the server sets them"""
+        if '?' in path:
+            path, query = path.split('?', 1)
+        else:
+            query = ''
+        env = {
+            'REQUEST_METHOD': method.upper(),
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote(path, 'iso-8859-1'),
+            'QUERY_STRING': query,
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': '127.0.0.1',
+            'REMOTE_PORT': '54321',
+            'HTTP_HOST': 'localhost',
+            'CONTENT_TYPE': 'text/plain',
+        }
+        if body:
+            env['CONTENT_LENGTH'] = str(len(body))
+        if headers:
+            if hasattr(headers, 'items'):
+                headers = headers.items()
+            seen = set()
+            for name, value in headers:
+                key = name.replace('-', '_').upper()
+                value = value.strip()
+                if key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                    env[key] = value
+                    continue
+                key = 'HTTP_' + key
+                if key in seen:
+                    env[key] += ',' + value  # repeated headers
+                else:
+                    env[key] = value
+                    seen.add(key)
+        env.update(self.environ)
+        if environ:
+            env.update(environ)
+        return env
+
+    def request(self, method, path, body=b'', headers=None, environ=None):
+        """Run one request and return its Response"""
+        stdout = BytesIO()
+        stderr = StringIO()
+        handler = self.handler_class(
+            BytesIO(body), stdout, stderr,
+            self.build_environ(method, path, body, headers, environ),
+            self.multithread, self.multiprocess)
+        handler.run(self.application)
+        exc_info, handler.exc_info = handler.exc_info, None
+        if exc_info is not None and self.raise_errors:
+            try:
+                raise exc_info[1].with_traceback(exc_info[2])
+            finally:
+                exc_info = None
+        response = parse_response(stdout.getvalue(), stderr.getvalue())
+        if method.upper() == 'HEAD':
+            # As the server answers HEAD: the body's length but no body
+            response.headers.setdefault('Content-Length',
+                                        str(len(response.body)))
+            response.body = b''
+        return response
+
+    def get(self, path, **kw):
+        return self.request('GET', path, **kw)
+
+    def head(self, path, **kw):
+        return self.request('HEAD', path, **kw)
+
+    def post(self, path, body=b'', **kw):
+        return self.request('POST', path, body, **kw)
+
+    def put(self, path, body=b'', **kw):
+        return self.request('PUT', path, body, **kw)
+
+    def delete(self, path, **kw):
+        return self.request('DELETE', path, **kw)
+
+    def replay(self, requests):
+        """Yield the Response of each request in 'requests'
+
+        Every item is a tuple of request() arguments, such as
+        ('GET', '/') or ('POST', '/items', b'data', {'X-Id': '1'}), or a
+        dict of request() keyword arguments.
+        """
+        request = self.request
+        for spec in requests:
+            if isinstance(spec, dict):
+                yield request(**spec)
+            else:
+                yield request(*spec)
@@ -0,0 +1,63 @@
+"""Per-phase request timing
+
+A RequestTimer records monotonic timestamps as a request moves through the
+server:
+
+* queue -- from accept() until the handler starts reading the request
+  (first request on a connection only)
+* parse -- request line and header parsing ('parse_request')
+* environ -- building the WSGI environ
+* app -- calling the application, up to the point where it returns or the
+  headers are sent
+* write -- iterating the result and writing it to the client
+
+Durations are exposed as a 'Server-Timing' response header, as 'sl.timing.*'
+environ keys (the phases finished before the application is called) and in
+the access log.  Timing is off unless enabled with
+'WSGIServer.enable_timing()'; when off, the only cost is an attribute check.
+"""
+
+
+__all__ = ['RequestTimer']
+
+
+class RequestTimer(object):
+    """Timestamps for the phases of a single request"""
+
+    __slots__ = ('accepted', 'parse_start', 'parsed', 'environ_built',
+                 'app_done', 'write_done')
+
+    def __init__(self, accepted=None, parse_start=None, parsed=None):
+        self.accepted = accepted
+        self.parse_start = parse_start
+        self.parsed = parsed
+        self.environ_built = self.app_done = self.write_done = None
+
+    def phases(self):
+        """Return a list of (name, seconds) for the completed phases"""
+        result = []
+        marks = (('queue', self.accepted, self.parse_start),
+                 ('parse', self.parse_start, self.parsed),
+                 ('environ', self.parsed, self.environ_built),
+                 ('app', self.environ_built, self.app_done),
+                 ('write', self.app_done, self.write_done))
+        for name, start, end in marks:
+            if start is not None and end is not None:
+                result.append((name, end - start))
+        return result
+
+    def update_environ(self, environ):
+        """Add 'sl.timing' and the finished phases to 'environ'"""
+        environ['sl.timing'] = self
+        for name, seconds in self.phases():
+            environ['sl.timing.' + name] = seconds
+
+    def header(self):
+        """Return a 'Server-Timing' header value (durations in ms)"""
+        return ', '.join('%s;dur=%.3f' % (name, seconds * 1000.0)
+                         for name, seconds in self.phases())
+
+    def log_string(self):
+        """Return the phases in a compact 'name=ms' form for access logs"""
+        return ' '.join('%s=%.3f' % (name, seconds * 1000.0)
+                        for name, seconds in self.phases())
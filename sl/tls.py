@@ -0,0 +1,192 @@
+"""TLS for WSGIServer through a reusable SSLContext
+
+The listening socket stays a plain socket: connections are accepted as
+TCP and the TLS handshake runs later, in the thread (or process) that
+handles the connection, bounded by 'handshake_timeout'.  A slow or broken
+client therefore only ties up its own worker instead of the accept loop.
+
+One SSLContext serves every connection, so OpenSSL's server session cache
+and session tickets work and returning clients can resume a session
+instead of doing a full handshake.  How often that happens is counted and
+exported by the metrics endpoint, summed over forked workers.  Create the
+server (and its context) before forking workers so they share the ticket
+keys.
+
+Where Linux and OpenSSL support kernel TLS, the context asks for it
+(OP_ENABLE_KTLS).  Whether the kernel actually encrypts a connection's
+output depends on the negotiated cipher and the 'tls' kernel module, so
+it is checked per connection; file responses on such connections are
+sent with os.sendfile() just like on plain TCP.
+
+Usage::
+
+    httpd = make_server('', 8443, app)
+    httpd.enable_tls('cert.pem', 'key.pem')
+    httpd.serve_forever()
+
+or pass an 'ssl.SSLContext' (or a '(certfile, keyfile)' tuple) as the
+server's 'ssl_context' argument.
+"""
+
+import socket
+import ssl
+import threading
+
+__all__ = ['TLS', 'HandshakeFailed', 'make_context', 'kernel_tls_send']
+
+# SSL_OP_ENABLE_KTLS is only exposed by the ssl module from Python 3.12
+if hasattr(ssl, 'OP_ENABLE_KTLS'):
+    OP_ENABLE_KTLS = ssl.OP_ENABLE_KTLS
+elif ssl.OPENSSL_VERSION_INFO >= (3, 0):
+    OP_ENABLE_KTLS = 1 << 3
+else:
+    OP_ENABLE_KTLS = 0
+
+SOL_TLS = getattr(socket, 'SOL_TLS', 282)
+TLS_TX = 1
+
+
+class HandshakeFailed(Exception):
+    """The TLS handshake of a new connection failed or timed out"""
+
+
+def make_context(certfile, keyfile=None, password=None, cafile=None,
+                 alpn=('http/1.1',), session_tickets=True, ciphers=None,
+                 ktls=True):
+    """Return a server SSLContext set up for session resumption
+
+    'cafile' enables (optional) client certificate verification; 'alpn'
+    lists the protocols offered through ALPN; 'ktls' requests kernel TLS
+    where OpenSSL supports it.
+    """
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(certfile, keyfile, password)
+    if cafile:
+        context.load_verify_locations(cafile)
+        context.verify_mode = ssl.CERT_OPTIONAL
+    if ciphers:
+        context.set_ciphers(ciphers)
+    context.options |= getattr(ssl, 'OP_NO_COMPRESSION', 0)
+    if not session_tickets:
+        context.options |= ssl.OP_NO_TICKET
+    if alpn and ssl.HAS_ALPN:
+        context.set_alpn_protocols(list(alpn))
+    if ktls and OP_ENABLE_KTLS:
+        context.options |= OP_ENABLE_KTLS
+    return context
+
+
+def kernel_tls_send(sock):
+    """True if the kernel encrypts data sent on the TLS socket 'sock'"""
+    try:
+        sock.getsockopt(SOL_TLS, TLS_TX, 64)
+    except OSError:
+        return False                    # no kTLS (or not for sending)
+    return True
+
+
+class TLS(object):
+    """Wraps accepted connections using one shared SSLContext"""
+
+    handshake_timeout = 10.0            # seconds allowed for the handshake
+
+    def __init__(self, context, handshake_timeout=None):
+        self.context = context
+        if handshake_timeout is not None:
+            self.handshake_timeout = handshake_timeout
+        self.handshakes = 0             # completed handshakes
+        self.resumed = 0                # ... of which resumed a session
+        self.failures = 0
+        self.offloaded = 0              # connections using kernel TLS
+        self.metrics = None             # also counted there, if registered
+        self._fields = ()
+        self._lock = threading.Lock()
+
+    def wrap(self, sock):
+        """Run the server handshake on 'sock' and return the SSLSocket
+
+        Raises HandshakeFailed (after closing the connection) if the
+        handshake fails or does not finish within 'handshake_timeout'.
+        """
+        timeout = sock.gettimeout()
+        sock.settimeout(self.handshake_timeout)
+        try:
+            tls_sock = self.context.wrap_socket(
+                sock, server_side=True, do_handshake_on_connect=False)
+        except (OSError, ValueError) as e:
+            sock.close()
+            self.count(failed=True)
+            raise HandshakeFailed(e)
+        try:
+            tls_sock.do_handshake()
+        except (OSError, ValueError) as e:
+            tls_sock.close()
+            self.count(failed=True)
+            raise HandshakeFailed(e)
+        tls_sock.settimeout(timeout)
+        self.count(resumed=tls_sock.session_reused)
+        return tls_sock
+
+    def kernel_offload(self, sock):
+        """True if 'sock' uses kTLS, so os.sendfile() can write to it"""
+        if not self.context.options & OP_ENABLE_KTLS or \
+                not kernel_tls_send(sock):
+            return False
+        with self._lock:
+            self.offloaded += 1
+        if self.metrics is not None:
+            self.metrics.increment(self._fields[3])
+        return True
+
+    def count(self, resumed=False, failed=False):
+        with self._lock:
+            if failed:
+                self.failures += 1
+            else:
+                self.handshakes += 1
+                if resumed:
+                    self.resumed += 1
+        if self.metrics is not None:
+            full, reused, failures = self._fields[:3]
+            self.metrics.increment(
+                failures if failed else reused if resumed else full)
+
+    def hit_rate(self):
+        """Fraction of completed handshakes that resumed a session
+
+        Over every worker if the counters are registered with a Metrics,
+        else for this process.
+        """
+        if self.metrics is not None:
+            full, resumed = self.metrics.counter_totals(self._fields[:2])
+            handshakes = full + resumed
+        else:
+            handshakes, resumed = self.handshakes, self.resumed
+        if not handshakes:
+            return 0.0
+        return float(resumed) / handshakes
+
+    def register_metrics(self, metrics):
+        """Export the handshake counters through an sl.metrics.Metrics
+
+        The counters are kept in the shared rows of 'metrics', so they are
+        summed over forked workers like the request counters.
+        """
+        self.metrics = metrics
+        self._fields = (
+            metrics.add_counter('sl_tls_handshakes_total',
+                                'Completed TLS handshakes.',
+                                {'resumed': 'false'}),
+            metrics.add_counter('sl_tls_handshakes_total',
+                                'Completed TLS handshakes.',
+                                {'resumed': 'true'}),
+            metrics.add_counter('sl_tls_handshake_failures_total',
+                                'TLS handshakes that failed or timed out.'),
+            metrics.add_counter('sl_tls_kernel_offload_total',
+                                'TLS connections encrypted by the kernel '
+                                '(kTLS).'),
+        )
+        metrics.add_metric(
+            'sl_tls_session_reuse_ratio',
+            'Fraction of TLS handshakes that resumed a session.',
+            lambda: [({}, self.hit_rate())])
@@ -3,14 +3,16 @@
 import posixpath
 
 __all__ = [
-    'FileWrapper', 'guess_scheme', 'application_uri', 'request_uri',
-    'shift_path_info', 'setup_testing_defaults',
+    'FileWrapper', 'LimitedInput', 'guess_scheme', 'application_uri',
+    'request_uri', 'shift_path_info', 'setup_testing_defaults',
 ]
 
 
 class FileWrapper:
     """Wrapper to convert file-like objects to iterables"""
 
+    __slots__ = ('filelike', 'blksize', 'close')
+
     def __init__(self, filelike, blksize=8192):
         self.filelike = filelike
         self.blksize = blksize
@@ -40,6 +42,63 @@ class FileWrapper:
         raise StopIteration
 
 
+class LimitedInput:
+    """'wsgi.input' that stops at the end of the request body
+
+    On a persistent connection the bytes after the body belong to the next
+    request, so reads are capped at 'length' and 'drain()' discards whatever
+    the application left unread.
+    """
+
+    __slots__ = ('stream', 'remaining')
+
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        if not size:
+            return b''
+        data = self.stream.read(size)
+        self.remaining -= len(data)
+        if not data:
+            self.remaining = 0          # client went away
+        return data
+
+    def readline(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        if not size:
+            return b''
+        data = self.stream.readline(size)
+        self.remaining -= len(data)
+        if not data:
+            self.remaining = 0
+        return data
+
+    def readlines(self, hint=-1):
+        lines = []
+        total = 0
+        while True:
+            line = self.readline()
+            if not line:
+                return lines
+            lines.append(line)
+            total += len(line)
+            if 0 < hint <= total:
+                return lines
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def drain(self, blksize=65536):
+        """Read and discard the rest of the body"""
+        while self.remaining and self.read(blksize):
+            pass
+
+
 def guess_scheme(environ):
     """Return a guess for whether 'wsgi.url_scheme' should be 'http' or 'https'
     """
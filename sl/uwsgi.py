@@ -0,0 +1,142 @@
+"""uwsgi binary protocol listener
+
+Front ends such as nginx ('uwsgi_pass') can forward requests using the
+uwsgi protocol: a 4-byte header followed by length-prefixed key/value pairs
+that already are the CGI variables of the request.  The environ is built
+straight from those pairs, so there is no HTTP request line or header
+parsing on this side; the response is written back as plain HTTP.
+
+Usage::
+
+    from sl.uwsgi import make_uwsgi_server
+
+    server = make_uwsgi_server('127.0.0.1', 3031, app)
+    # or: make_uwsgi_server('unix:///run/app.sock', 0, app)
+    server.serve_forever()
+"""
+
+import struct
+import sys
+
+try:  # Py3
+    from socketserver import StreamRequestHandler, ThreadingMixIn
+except ImportError:  # Py2
+    from SocketServer import StreamRequestHandler, ThreadingMixIn
+
+from .handlers import SimpleHandler
+from .server import WSGIServer, software_version
+from .util import LimitedInput
+
+__all__ = ['UWSGIServer', 'ThreadingUWSGIServer', 'UWSGIRequestHandler',
+           'UWSGIHandler', 'make_uwsgi_server', 'parse_vars']
+
+_header = struct.Struct('<BHB')
+_length = struct.Struct('<H')
+
+
+def parse_vars(data):
+    """Decode a uwsgi vars block into a dict of latin-1 strings"""
+    environ = {}
+    pos, end = 0, len(data)
+    unpack = _length.unpack_from
+    while pos < end:
+        size = unpack(data, pos)[0]
+        pos += 2
+        key = data[pos:pos + size].decode('iso-8859-1')
+        pos += size
+        size = unpack(data, pos)[0]
+        pos += 2
+        environ[key] = data[pos:pos + size].decode('iso-8859-1')
+        pos += size
+    return environ
+
+
+class UWSGIHandler(SimpleHandler):
+    """SimpleHandler for an environ that arrived as uwsgi vars
+
+    The environ is used as is, plus the 'wsgi.*' keys; nothing from the
+    process environment is merged in.
+    """
+
+    __slots__ = ()
+
+    server_software = software_version
+
+    def setup_environ(self):
+        env = self.environ = self.base_env
+        env['wsgi.input'] = self.get_stdin()
+        env['wsgi.errors'] = self.get_stderr()
+        env['wsgi.version'] = self.wsgi_version
+        env['wsgi.run_once'] = self.wsgi_run_once
+        env['wsgi.url_scheme'] = self.get_scheme()
+        env['wsgi.multithread'] = self.wsgi_multithread
+        env['wsgi.multiprocess'] = self.wsgi_multiprocess
+        if self.wsgi_file_wrapper is not None:
+            env['wsgi.file_wrapper'] = self.wsgi_file_wrapper
+        env.setdefault('SERVER_SOFTWARE', self.server_software)
+
+    def get_scheme(self):
+        scheme = self.environ.get('UWSGI_SCHEME') or \
+            self.environ.get('REQUEST_SCHEME')
+        if scheme in ('http', 'https'):
+            return scheme
+        return SimpleHandler.get_scheme(self)
+
+
+class UWSGIRequestHandler(StreamRequestHandler):
+    """Read one uwsgi packet from the connection and run the request"""
+
+    rbufsize = 65536
+
+    def get_stderr(self):
+        return sys.stderr
+
+    def read_environ(self):
+        """Return the request's environ, or None if there is no request"""
+        header = self.rfile.read(_header.size)
+        if len(header) < _header.size:
+            return None
+        modifier1, size, modifier2 = _header.unpack(header)
+        data = self.rfile.read(size)
+        if modifier1 != 0 or len(data) < size:
+            return None                 # only plain WSGI requests
+        return parse_vars(data)
+
+    def handle(self):
+        environ = self.read_environ()
+        if environ is None:
+            return
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        handler = UWSGIHandler(
+            LimitedInput(self.rfile, length), self.wfile, self.get_stderr(),
+            environ, multithread=self.server.multithread,
+            multiprocess=self.server.multiprocess,
+        )
+        handler.run(self.server.get_app())
+
+
+class UWSGIServer(WSGIServer):
+    """Accept uwsgi connections (TCP or 'unix://' path) for a WSGI app"""
+
+    def __init__(self, server_address=('', None), handler=None, *args,
+                 **kwargs):
+        WSGIServer.__init__(self, server_address,
+                            handler or UWSGIRequestHandler, *args, **kwargs)
+
+
+class ThreadingUWSGIServer(ThreadingMixIn, UWSGIServer):
+    """UWSGIServer handling each connection in a new thread"""
+
+    multithread = True
+    daemon_threads = True
+
+
+def make_uwsgi_server(host, port, app, server_class=ThreadingUWSGIServer,
+                      handler_class=UWSGIRequestHandler):
+    """Create a uwsgi server listening on 'host' and 'port' for 'app'"""
+    server = server_class((host, port), handler_class)
+    server.set_app(app)
+    return server
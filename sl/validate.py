@@ -107,24 +107,53 @@ Some of the things this checks:
   - That .close() is called (doesn't raise exception, only prints to
     sys.stderr, because we only know it isn't called when the object
     is garbage collected).
+
+SamplingValidator is a variant meant to stay on in production: it only
+checks a sample of the requests (a fraction of them, or the first few of
+every route), runs the cheap structural checks inline and the expensive
+ones from a background thread, and counts and logs violations instead of
+raising.  It does not wrap wsgi.input or wsgi.errors, and cannot tell
+whether the response iterator is closed.
 """
-__all__ = ['validator']
+__all__ = ['validator', 'SamplingValidator']
 
 
+import logging
+import os
 import re
 import sys
+import threading
 import warnings
+from collections import deque
+from random import random
 
 header_re = re.compile(r'^[a-zA-Z][a-zA-Z0-9\-_]*$')
 bad_header_value_re = re.compile(r'[\000-\037]')
 
 
+required_keys = ('REQUEST_METHOD', 'SERVER_NAME', 'SERVER_PORT',
+                 'wsgi.version', 'wsgi.input', 'wsgi.errors',
+                 'wsgi.multithread', 'wsgi.multiprocess', 'wsgi.run_once')
+
+# Checks run by SamplingValidator collect warnings here instead of
+# emitting them ('warnings.catch_warnings' is not thread-safe)
+_collector = threading.local()
+
+
 class WSGIWarning(Warning):
     """
     Raised in response to WSGI-spec-related warnings
     """
 
 
+def warn(message):
+    collected = getattr(_collector, 'warnings', None)
+    if collected is None:
+        warnings.warn(message, WSGIWarning, stacklevel=2)
+    else:
+        collected.append(message)
+
+
 def assert_(cond, *args):
     if not cond:
         raise AssertionError(*args)
@@ -309,10 +338,7 @@ def check_environ(environ):
             "Environment is not of the right type: %r (environment: %r)"
             % (type(environ), environ))
 
-    for key in ['REQUEST_METHOD', 'SERVER_NAME', 'SERVER_PORT',
-                'wsgi.version', 'wsgi.input', 'wsgi.errors',
-                'wsgi.multithread', 'wsgi.multiprocess',
-                'wsgi.run_once']:
+    for key in required_keys:
         assert_(key in environ,
                 "Environment missing required key: %r" % (key,))
 
@@ -322,11 +348,9 @@ def check_environ(environ):
                 "(use %s instead)" % (key, key[5:]))
 
     if 'QUERY_STRING' not in environ:
-        warnings.warn(
-            'QUERY_STRING is not in the WSGI environment; the cgi '
-            'module will use sys.argv when this variable is missing, '
-            'so application errors are more likely',
-            WSGIWarning)
+        warn('QUERY_STRING is not in the WSGI environment; the cgi '
+             'module will use sys.argv when this variable is missing, '
+             'so application errors are more likely')
 
     for key in environ.keys():
         if '.' in key:
@@ -347,9 +371,7 @@ def check_environ(environ):
     # @@: these need filling out:
     if environ['REQUEST_METHOD'] not in (
             'GET', 'HEAD', 'POST', 'OPTIONS', 'PATCH', 'PUT', 'DELETE', 'TRACE'):
-        warnings.warn(
-            "Unknown REQUEST_METHOD: %r" % environ['REQUEST_METHOD'],
-            WSGIWarning)
+        warn("Unknown REQUEST_METHOD: %r" % environ['REQUEST_METHOD'])
 
     assert_(not environ.get('SCRIPT_NAME')
             or environ['SCRIPT_NAME'].startswith('/'),
@@ -393,10 +415,9 @@ def check_status(status):
     status_int = int(status_code)
     assert_(status_int >= 100, "Status code is invalid: %r" % status_int)
     if len(status) < 4 or status[3] != ' ':
-        warnings.warn(
-            "The status string (%r) should be a three-digit integer "
-            "followed by a single space and a status explanation"
-            % status, WSGIWarning)
+        warn("The status string (%r) should be a three-digit integer "
+             "followed by a single space and a status explanation"
+             % status)
 
 
 def check_headers(headers):
@@ -455,3 +476,251 @@ def check_iterator(iterator):
     assert_(not isinstance(iterator, (str, bytes)),
             "You should not return a string as your application iterator, "
             "instead return a single-item list containing a bytestring.")
+
+
+def check_environ_structure(environ):
+    """The part of check_environ() cheap enough to run inline"""
+    assert_(type(environ) is dict,
+            "Environment is not of the right type: %r" % (type(environ),))
+    for key in required_keys:
+        assert_(key in environ,
+                "Environment missing required key: %r" % (key,))
+
+
+def default_route(environ):
+    return '%s %s' % (environ.get('REQUEST_METHOD'),
+                      environ.get('PATH_INFO'))
+
+
+class SamplingValidator(object):
+    """WSGI middleware checking a sample of requests without failing them
+
+    A request is checked if it is one of the first 'first_per_route'
+    requests of its route ('route(environ)', by default the method and
+    PATH_INFO), or else with probability 'rate'.  Other requests go
+    straight to 'application'.  Violations are counted per check in
+    'violations' and logged to 'logger': the first one of each check, then
+    every 'log_every'-th.
+    """
+
+    log_every = 100                     # log 1 in N violations of a check
+    max_routes = 10000                  # routes remembered for first_per_route
+
+    def __init__(self, application, rate=0.01, first_per_route=0,
+                 route=None, logger=None, capacity=1024, interval=0.5):
+        self.application = application
+        self.rate = rate
+        self.first_per_route = first_per_route
+        self.route = route or default_route
+        self.logger = logger or logging.getLogger(__name__)
+        self.capacity = capacity        # deferred checks queued at most
+        self.interval = interval
+        self.checked = 0                # requests sampled
+        self.dropped = 0                # deferred checks dropped (queue full)
+        self.violations = {}            # check name -> count
+        self._seen = {}                 # route -> requests checked
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def wants(self, environ):
+        """True if this request should be checked"""
+        if self.first_per_route:
+            route = self.route(environ)
+            seen = self._seen.get(route, 0)
+            # Unsynchronized: a lost update only checks one more request
+            if seen < self.first_per_route and (
+                    seen or len(self._seen) < self.max_routes):
+                self._seen[route] = seen + 1
+                return True
+        return self.rate > 0.0 and random() < self.rate
+
+    def __call__(self, environ, start_response):
+        if not self.wants(environ):
+            return self.application(environ, start_response)
+        with self._lock:
+            self.checked += 1
+        where = '%s %s' % (environ.get('REQUEST_METHOD'),
+                           environ.get('PATH_INFO'))
+        if self.run_check('environ', check_environ_structure, environ,
+                          where=where):
+            self.defer('environ', check_environ, dict(environ), where=where)
+        started = []
+
+        def start_response_wrapper(status, headers, exc_info=None):
+            if self.run_check('start_response', self.check_response_types,
+                              status, headers, where=where):
+                headers = list(headers)
+                self.defer('status', check_status, status, where=where)
+                self.defer('headers', check_headers, headers, where=where)
+                self.defer('content_type', check_content_type, status,
+                           headers, where=where)
+            self.run_check('exc_info', check_exc_info, exc_info, where=where)
+            started.append(None)
+            write = start_response(status, headers, exc_info)
+
+            def write_wrapper(data):
+                self.run_check('write', self.check_bytes, data, 'write()',
+                               where=where)
+                write(data)
+            return write_wrapper
+
+        result = self.application(environ, start_response_wrapper)
+        if not self.run_check('iterator', check_iterator, result,
+                              where=where):
+            return result
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if isinstance(file_wrapper, type) and \
+                isinstance(result, file_wrapper):
+            return result               # keep the server's sendfile path
+        if type(result) in (list, tuple):
+            # Check the blocks now and hand the sequence itself on, so the
+            # server can still count a single block for Content-Length
+            for chunk in SampledIterator(self, result, started, where):
+                pass
+            return result
+        return SampledIterator(self, result, started, where)
+
+    # Running checks
+
+    @staticmethod
+    def check_response_types(status, headers):
+        check_string_type(status, "Status")
+        assert_(type(headers) is list,
+                "Headers (%r) must be of type list: %r"
+                % (headers, type(headers)))
+
+    @staticmethod
+    def check_bytes(value, what):
+        assert_(type(value) is bytes,
+                "%s called with a non-bytestring (%r)" % (what, value))
+
+    def run_check(self, name, check, *args, **kw):
+        """Run 'check(*args)', recording a violation instead of raising
+
+        Returns False if the check failed.
+        """
+        where = kw.get('where')
+        _collector.warnings = []
+        try:
+            check(*args)
+        except AssertionError as e:
+            self.violation(name, str(e), where)
+            return False
+        except Exception as e:          # e.g. int() of a bad status
+            self.violation(name, '%s: %s' % (type(e).__name__, e), where)
+            return False
+        finally:
+            collected, _collector.warnings = _collector.warnings, None
+            for message in collected:
+                self.violation(name, message, where, warning=True)
+        return True
+
+    def defer(self, name, check, *args, **kw):
+        """Queue 'check(*args)' for the background thread"""
+        if len(self._pending) >= self.capacity:
+            with self._lock:
+                self.dropped += 1
+            return
+        self._pending.append((name, check, args, kw.get('where')))
+        if self._thread is None:
+            self.start()
+        elif len(self._pending) == self.capacity // 2:
+            self._wake.set()
+
+    def violation(self, name, message, where=None, warning=False):
+        with self._lock:
+            count = self.violations.get(name, 0) + 1
+            self.violations[name] = count
+        if count == 1 or count % self.log_every == 0:
+            self.logger.warning(
+                'WSGI %s (%s, %d so far) in %s: %s',
+                'warning' if warning else 'violation', name, count,
+                where or '-', message)
+
+    # Background thread
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name='sl-validator')
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Run every deferred check queued so far"""
+        pending = self._pending
+        while True:
+            try:
+                name, check, args, where = pending.popleft()
+            except IndexError:
+                return
+            self.run_check(name, check, *args, where=where)
+
+    def _after_fork(self):
+        # Checks queued before the fork are run by the parent
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def register_metrics(self, metrics):
+        """Export the counters through an sl.metrics.Metrics"""
+        metrics.add_metric(
+            'sl_wsgi_validated_requests_total',
+            'Requests checked for WSGI conformance.',
+            lambda: [({}, self.checked)], 'counter')
+        metrics.add_metric(
+            'sl_wsgi_violations_total',
+            'WSGI conformance violations and warnings, per check.',
+            lambda: [({'check': name}, count)
+                     for name, count in sorted(self.violations.items())],
+            'counter')
+        metrics.add_metric(
+            'sl_wsgi_validation_dropped_total',
+            'Deferred WSGI checks dropped because the queue was full.',
+            lambda: [({}, self.dropped)], 'counter')
+
+
+class SampledIterator(object):
+    """Checks the body chunks of a sampled response"""
+
+    def __init__(self, validator, result, started, where):
+        self.validator = validator
+        self.result = result
+        self.iterator = iter(result)
+        self.started = started
+        self.where = where
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        chunk = next(self.iterator)
+        validator = self.validator
+        if self.started is not None:
+            if not self.started:
+                validator.violation(
+                    'iterator', 'The application returns and we started '
+                    'iterating over its body, but start_response has not '
+                    'yet been called', self.where)
+            self.started = None
+        if type(chunk) is not bytes:
+            validator.violation(
+                'body', "Iterator yielded non-bytestring (%r)" % (chunk,),
+                self.where)
+        return chunk
+
+    def close(self):
+        if hasattr(self.result, 'close'):
+            self.result.close()
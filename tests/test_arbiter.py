@@ -0,0 +1,141 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import unittest
+
+from sl.arbiter import Arbiter
+from sl.server import WSGIServer, make_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MASTER = '''
+import sys, time
+from sl.arbiter import Arbiter
+from sl.server import ThreadingWSGIServer, make_server
+
+def app(environ, start_response):
+    time.sleep(1.0)
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [b'done']
+
+server = make_server('127.0.0.1', 0, app, server_class=ThreadingWSGIServer)
+print(server.server_address[1], flush=True)
+Arbiter(server, workers=2, graceful_timeout=10.0).run()
+'''
+
+REUSE_PORT_MASTER = '''
+import os
+from sl.arbiter import Arbiter
+from sl.server import ThreadingWSGIServer, make_server
+
+class Server(ThreadingWSGIServer):
+    reuse_port = True
+
+def app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [str(os.getpid()).encode()]
+
+server = make_server('127.0.0.1', 0, app, server_class=Server)
+print(server.server_address[1], flush=True)
+Arbiter(server, workers=2).run()
+'''
+
+
+class ReusePortServer(WSGIServer):
+    reuse_port = True
+
+
+def listening(sock):
+    return bool(sock.getsockopt(socket.SOL_SOCKET, socket.SO_ACCEPTCONN))
+
+
+def run_master(source):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    return subprocess.Popen([sys.executable, '-c', source], env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def stop_master(master):
+    if master.poll() is None:
+        master.kill()
+        master.wait()
+    master.stdout.close()
+    master.stderr.close()
+
+
+def get(port):
+    with socket.create_connection(('127.0.0.1', port), 5) as sock:
+        sock.sendall(b'GET / HTTP/1.0\r\n\r\n')
+        sock.settimeout(5)
+        response = b''
+        while True:
+            data = sock.recv(4096)
+            if not data:
+                return response
+            response += data
+
+
+@unittest.skipUnless(hasattr(os, 'fork'), 'needs fork')
+class StopTests(unittest.TestCase):
+
+    def test_sigterm_lets_request_in_flight_finish(self):
+        master = run_master(MASTER)
+        try:
+            port = int(master.stdout.readline())
+            with socket.create_connection(('127.0.0.1', port), 5) as sock:
+                sock.sendall(b'GET / HTTP/1.0\r\n\r\n')
+                sock.settimeout(5)
+                time.sleep(0.5)         # the application is running now
+                master.send_signal(signal.SIGTERM)
+                response = b''
+                while True:
+                    data = sock.recv(4096)
+                    if not data:
+                        break
+                    response += data
+            self.assertTrue(response.startswith(b'HTTP/1.0 200 OK'), response)
+            self.assertTrue(response.endswith(b'done'), response)
+            self.assertEqual(master.wait(10), 0)
+            # Neither the busy worker nor the idle one failed to stop
+            self.assertNotIn(b'Traceback', master.stderr.read())
+        finally:
+            stop_master(master)
+
+
+@unittest.skipUnless(hasattr(os, 'fork') and hasattr(socket, 'SO_REUSEPORT'),
+                     'needs fork and SO_REUSEPORT')
+class ReusePortTests(unittest.TestCase):
+
+    def test_master_holds_the_port_without_listening(self):
+        server = make_server('127.0.0.1', 0, None,
+                             server_class=ReusePortServer)
+        self.addCleanup(server.server_close)
+        address = server.server_address
+        arbiter = Arbiter(server, workers=1)
+        arbiter.hold_ports()
+        self.assertFalse(listening(server.socket))
+        self.assertEqual(server.socket.getsockname(), address)
+        arbiter.bind_listeners()        # as a worker does after fork()
+        self.assertTrue(listening(server.socket))
+        self.assertIs(server.listeners[0], server.socket)
+        self.assertEqual(server.socket.getsockname(), address)
+
+    def test_workers_accept_on_their_own_sockets(self):
+        master = run_master(REUSE_PORT_MASTER)
+        try:
+            port = int(master.stdout.readline())
+            time.sleep(0.5)             # both workers are listening now
+            pids = set()
+            for i in range(30):
+                response = get(port)
+                self.assertTrue(response.startswith(b'HTTP/1.0 200 OK'),
+                                response)
+                pids.add(response.split(b'\r\n\r\n', 1)[1])
+            self.assertEqual(len(pids), 2)
+            master.send_signal(signal.SIGTERM)
+            self.assertEqual(master.wait(10), 0)
+        finally:
+            stop_master(master)
@@ -0,0 +1,163 @@
+import socket
+import struct
+import threading
+import time
+import unittest
+
+from sl import fastcgi
+from sl.fastcgi import decode_pairs, encode_pairs, make_fastcgi_server
+
+_header = struct.Struct('!BBHHBx')
+
+PARAMS = {
+    'REQUEST_METHOD': 'GET', 'SCRIPT_NAME': '', 'PATH_INFO': '/',
+    'QUERY_STRING': '', 'SERVER_NAME': 'localhost', 'SERVER_PORT': '80',
+    'SERVER_PROTOCOL': 'HTTP/1.1',
+}
+
+
+def record(record_type, request_id, content=b''):
+    return _header.pack(1, record_type, request_id, len(content), 0) + \
+        content
+
+
+def begin(request_id, keep_conn=True):
+    return record(fastcgi.FCGI_BEGIN_REQUEST, request_id,
+                  struct.pack('!HB5x', fastcgi.FCGI_RESPONDER,
+                              fastcgi.FCGI_KEEP_CONN if keep_conn else 0))
+
+
+def params(request_id, **extra):
+    pairs = dict(PARAMS, **extra)
+    return record(fastcgi.FCGI_PARAMS, request_id, encode_pairs(pairs)) + \
+        record(fastcgi.FCGI_PARAMS, request_id)
+
+
+def stream_app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    yield b'first'
+    time.sleep(0.3)
+    yield b'second'
+
+
+def app(environ, start_response):
+    if environ['PATH_INFO'] == '/stream':
+        return stream_app(environ, start_response)
+    body = environ['wsgi.input'].read()
+    if environ['PATH_INFO'] == '/slow':
+        time.sleep(0.3)
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [environ['PATH_INFO'].encode(), b' ', body]
+
+
+class PairsTests(unittest.TestCase):
+
+    def test_round_trip(self):
+        pairs = {'SHORT': 'x', 'EMPTY': '', 'LONG': 'v' * 300,
+                 'N' * 200: 'long name'}
+        self.assertEqual(decode_pairs(encode_pairs(pairs)), pairs)
+
+    def test_length_encoding(self):
+        data = encode_pairs({'A': 'b' * 128})
+        self.assertEqual(data[:1], b'\x01')
+        self.assertEqual(struct.unpack('!I', data[1:5])[0], 0x80000080)
+
+
+class FastCGIServerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.server = make_fastcgi_server('127.0.0.1', 0, app)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.sock = socket.create_connection(self.server.server_address, 5)
+        self.addCleanup(self.sock.close)
+        self.rfile = self.sock.makefile('rb')
+        self.addCleanup(self.rfile.close)
+
+    def read_record(self):
+        header = self.rfile.read(_header.size)
+        version, record_type, request_id, length, padding = \
+            _header.unpack(header)
+        content = self.rfile.read(length + padding)[:length]
+        return record_type, request_id, content
+
+    def read_responses(self, count):
+        """Return {request id: (stdout, END_REQUEST body)}"""
+        stdout, ended = {}, {}
+        while len(ended) < count:
+            record_type, request_id, content = self.read_record()
+            if record_type == fastcgi.FCGI_STDOUT:
+                stdout[request_id] = stdout.get(request_id, b'') + content
+            elif record_type == fastcgi.FCGI_END_REQUEST:
+                ended[request_id] = content
+        return dict((i, (stdout.get(i, b''), ended[i])) for i in ended)
+
+    def test_request(self):
+        self.sock.sendall(begin(1) + params(1, CONTENT_LENGTH='4') +
+                          record(fastcgi.FCGI_STDIN, 1, b'data') +
+                          record(fastcgi.FCGI_STDIN, 1))
+        stdout, end = self.read_responses(1)[1]
+        self.assertTrue(stdout.startswith(b'Status: 200 OK\r\n'), stdout)
+        self.assertTrue(stdout.endswith(b'\r\n\r\n/ data'), stdout)
+        self.assertEqual(end, struct.pack('!IB3x', 0,
+                                          fastcgi.FCGI_REQUEST_COMPLETE))
+
+    def test_multiplexed_requests(self):
+        # The slow request starts first but the fast one ends first
+        self.sock.sendall(begin(1) + begin(2) +
+                          params(1, PATH_INFO='/slow') +
+                          params(2, PATH_INFO='/fast') +
+                          record(fastcgi.FCGI_STDIN, 1) +
+                          record(fastcgi.FCGI_STDIN, 2))
+        ends = []
+        responses = {}
+        while len(ends) < 2:
+            record_type, request_id, content = self.read_record()
+            if record_type == fastcgi.FCGI_STDOUT:
+                responses[request_id] = \
+                    responses.get(request_id, b'') + content
+            elif record_type == fastcgi.FCGI_END_REQUEST:
+                ends.append(request_id)
+        self.assertEqual(ends, [2, 1])
+        self.assertTrue(responses[1].endswith(b'/slow '))
+        self.assertTrue(responses[2].endswith(b'/fast '))
+
+    def test_streamed_blocks_are_not_held_back(self):
+        self.sock.sendall(begin(1) + params(1, PATH_INFO='/stream') +
+                          record(fastcgi.FCGI_STDIN, 1))
+        record_type, request_id, content = self.read_record()
+        self.assertEqual(record_type, fastcgi.FCGI_STDOUT)
+        self.assertTrue(content.endswith(b'\r\n\r\nfirst'), content)
+        stdout, end = self.read_responses(1)[1]
+        self.assertEqual(stdout, b'second')
+
+    def test_abort_before_start(self):
+        self.sock.sendall(begin(1) + params(1) +
+                          record(fastcgi.FCGI_ABORT_REQUEST, 1))
+        stdout, end = self.read_responses(1)[1]
+        self.assertEqual(stdout, b'')
+        # The connection is still usable
+        self.sock.sendall(begin(2) + params(2) +
+                          record(fastcgi.FCGI_STDIN, 2))
+        stdout, end = self.read_responses(1)[2]
+        self.assertTrue(stdout.startswith(b'Status: 200 OK'), stdout)
+
+    def test_get_values(self):
+        query = encode_pairs({'FCGI_MPXS_CONNS': '', 'FCGI_MAX_REQS': ''})
+        self.sock.sendall(record(fastcgi.FCGI_GET_VALUES, 0, query))
+        record_type, request_id, content = self.read_record()
+        self.assertEqual(record_type, fastcgi.FCGI_GET_VALUES_RESULT)
+        self.assertEqual(decode_pairs(content),
+                         {'FCGI_MPXS_CONNS': '1', 'FCGI_MAX_REQS': '100'})
+
+    def test_unknown_role(self):
+        self.sock.sendall(record(fastcgi.FCGI_BEGIN_REQUEST, 1,
+                                 struct.pack('!HB5x', 2,
+                                             fastcgi.FCGI_KEEP_CONN)))
+        record_type, request_id, content = self.read_record()
+        self.assertEqual(record_type, fastcgi.FCGI_END_REQUEST)
+        self.assertEqual(content, struct.pack('!IB3x', 0,
+                                              fastcgi.FCGI_UNKNOWN_ROLE))
@@ -0,0 +1,48 @@
+import unittest
+
+from sl.testing import Client, ClientHandler
+
+
+class BufferedHandler(ClientHandler):
+    buffer_size = 1024
+
+
+def mixed_app(environ, start_response):
+    write = start_response('200 OK', [('Content-Type', 'text/plain')])
+    yield b'a'
+    write(b'b')
+    yield b'c'
+
+
+def write_last_app(environ, start_response):
+    write = start_response('200 OK', [('Content-Type', 'text/plain')])
+    yield b'a'
+    yield b'b'
+    write(b'c')
+
+
+class WriteBufferedTests(unittest.TestCase):
+
+    def request(self, app):
+        client = Client(app)
+        client.handler_class = BufferedHandler
+        return client.get('/')
+
+    def test_write_between_yields_keeps_order(self):
+        self.assertEqual(self.request(mixed_app).body, b'abc')
+
+    def test_write_after_last_yield_keeps_order(self):
+        self.assertEqual(self.request(write_last_app).body, b'abc')
+
+    def test_short_result_gets_content_length(self):
+        def app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            yield b'a'
+            yield b'bc'
+        response = self.request(app)
+        self.assertEqual(response.body, b'abc')
+        self.assertEqual(response.headers['Content-Length'], '3')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import os
+import threading
+import unittest
+
+from sl.metrics import Metrics
+
+
+def parse(text):
+    """Return {sample name with labels: value} from rendered metrics"""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    return samples
+
+
+class MetricsTests(unittest.TestCase):
+
+    def record(self, metrics, count, status='200 OK', size=10):
+        for i in range(count):
+            metrics.request_finished(metrics.request_started(), 'GET',
+                                     status, size)
+
+    def test_threads_are_summed(self):
+        metrics = Metrics()
+        threads = [threading.Thread(target=self.record, args=(metrics, 5))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.record(metrics, 1, '404 Not Found')
+        samples = parse(metrics.render())
+        self.assertEqual(
+            samples['sl_requests_total{method="GET",status="200"}'], 20)
+        self.assertEqual(
+            samples['sl_requests_total{method="GET",status="404"}'], 1)
+        self.assertEqual(samples['sl_response_bytes_total'], 210)
+        self.assertEqual(samples['sl_request_duration_seconds_count'], 21)
+        self.assertEqual(samples['sl_requests_in_flight'], 0)
+
+    def test_counters(self):
+        metrics = Metrics()
+        hits = metrics.add_counter('test_total', 'Test.', {'kind': 'hit'})
+        misses = metrics.add_counter('test_total', 'Test.', {'kind': 'miss'})
+        metrics.increment(hits, 3)
+        metrics.increment(misses)
+        self.assertEqual(metrics.counter_totals([hits, misses]), [3, 1])
+        samples = parse(metrics.render())
+        self.assertEqual(samples['test_total{kind="hit"}'], 3)
+
+    def test_reserve_slot_skips_live_owners(self):
+        metrics = Metrics(slots=3)
+        self.assertEqual(metrics.reserve_slot({}), 1)
+        metrics.assign_slot(1, 100)
+        self.assertEqual(metrics.reserve_slot({100: 0}), 2)
+        metrics.assign_slot(2, 200)
+        self.assertIsNone(metrics.reserve_slot({100: 0, 200: 0}))
+        # A slot whose owner exited is handed out again
+        self.assertEqual(metrics.reserve_slot({200: 0}), 1)
+
+    def test_set_slots_keeps_counts(self):
+        metrics = Metrics()
+        self.record(metrics, 3)
+        metrics.set_slots(4)
+        self.assertEqual(metrics.slots, 4)
+        self.record(metrics, 2)
+        samples = parse(metrics.render())
+        self.assertEqual(samples['sl_request_duration_seconds_count'], 5)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'needs fork')
+    def test_slots_are_summed_across_processes(self):
+        metrics = Metrics(slots=3)
+        counter = metrics.add_counter('test_total', 'Test.')
+        self.record(metrics, 1)
+        pids = []
+        for i in range(2):
+            slot = metrics.reserve_slot(pids)
+            pid = os.fork()
+            if not pid:
+                status = 1
+                try:
+                    metrics.enter_worker(slot)
+                    self.record(metrics, 10)
+                    metrics.increment(counter, 2)
+                    metrics.flush()
+                    status = 0
+                finally:
+                    os._exit(status)
+            metrics.assign_slot(slot, pid)
+            pids.append(pid)
+        for pid in pids:
+            self.assertEqual(os.waitpid(pid, 0)[1], 0)
+        samples = parse(metrics.render())
+        self.assertEqual(samples['sl_request_duration_seconds_count'], 21)
+        self.assertEqual(samples['test_total'], 4)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'needs fork')
+    def test_worker_without_slot_counts_privately(self):
+        metrics = Metrics(slots=1)
+        pid = os.fork()
+        if not pid:
+            status = 1
+            try:
+                metrics.enter_worker(None)
+                self.record(metrics, 10)
+                samples = parse(metrics.render())
+                if samples['sl_response_bytes_total'] == 100:
+                    status = 0
+            finally:
+                os._exit(status)
+        self.assertEqual(os.waitpid(pid, 0)[1], 0)
+        samples = parse(metrics.render())
+        self.assertEqual(samples['sl_request_duration_seconds_count'], 0)
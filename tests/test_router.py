@@ -0,0 +1,67 @@
+import unittest
+
+from sl.router import Router
+from sl.testing import Client
+
+
+def named(name):
+    def app(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [('%s %s %s' % (name, environ['SCRIPT_NAME'],
+                               environ['PATH_INFO'])).encode()]
+    return app
+
+
+class RouterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.router = Router()
+        self.router.mount('/blog', named('blog'))
+        self.router.mount('/api/v1/', named('api'))
+        self.router.mount('/', named('site'))
+        self.client = Client(self.router)
+
+    def get(self, path, **kw):
+        return self.client.get(path, **kw).body.decode()
+
+    def test_prefix_moves_to_script_name(self):
+        self.assertEqual(self.get('/blog/post/1'), 'blog /blog /post/1')
+        self.assertEqual(self.get('/blog'), 'blog /blog ')
+        self.assertEqual(self.get('/blog/'), 'blog /blog /')
+
+    def test_prefixes_match_whole_segments(self):
+        self.assertEqual(self.get('/blogger'), 'site  /blogger')
+
+    def test_longest_prefix_wins(self):
+        self.assertEqual(self.get('/api/v1/users'), 'api /api/v1 /users')
+        self.assertEqual(self.get('/api/v2/users'), 'site  /api/v2/users')
+
+    def test_existing_script_name_is_kept(self):
+        body = self.get('/blog/post', environ={'SCRIPT_NAME': '/app'})
+        self.assertEqual(body, 'blog /app/blog /post')
+
+    def test_host_mounts_come_first(self):
+        self.router.mount('/blog', named('www'), host='WWW.example.com')
+        self.assertEqual(
+            self.get('/blog/x', headers={'Host': 'www.example.com:8080'}),
+            'www /blog /x')
+        self.assertEqual(
+            self.get('/blog/x', headers={'Host': 'other.example.com'}),
+            'blog /blog /x')
+        # Paths the host's mounts do not cover fall back to the others
+        self.assertEqual(
+            self.get('/about', headers={'Host': 'www.example.com'}),
+            'site  /about')
+
+    def test_no_match_is_not_found(self):
+        router = Router()
+        router.mount('/blog', named('blog'))
+        response = Client(router).get('/about')
+        self.assertEqual(response.status_code, 404)
+
+    def test_lookup(self):
+        app, matched = self.router.lookup({'PATH_INFO': '/api/v1/x'})
+        self.assertEqual(matched, len('/api/v1'))
+
+    def test_prefix_must_be_absolute(self):
+        self.assertRaises(ValueError, self.router.mount, 'blog', named('x'))
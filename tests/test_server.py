@@ -0,0 +1,37 @@
+import socket
+import unittest
+
+from sl.server import make_server
+
+try:
+    import ssl
+except ImportError:
+    ssl = None
+
+
+def app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [b'']
+
+
+@unittest.skipIf(ssl is None, 'needs ssl')
+class URLSchemeTests(unittest.TestCase):
+
+    def setUp(self):
+        self.server = make_server('127.0.0.1', 0, app)
+        self.addCleanup(self.server.server_close)
+        self.context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+
+    def test_enable_tls_sets_https(self):
+        self.server.enable_tls(context=self.context)
+        self.assertEqual(self.server.base_environ['wsgi.url_scheme'],
+                         'https')
+
+    def test_use_socket_after_enable_tls_keeps_https(self):
+        self.server.enable_tls(context=self.context)
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        sock.listen(5)
+        self.server.use_socket(sock)
+        self.assertEqual(self.server.base_environ['wsgi.url_scheme'],
+                         'https')
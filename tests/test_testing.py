@@ -0,0 +1,23 @@
+import unittest
+
+from sl.testing import Client
+
+
+def app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    yield b'hello, '
+    yield b'world'
+
+
+class ClientTests(unittest.TestCase):
+
+    def test_get(self):
+        response = Client(app).get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.body, b'hello, world')
+
+    def test_head_drops_body_and_keeps_length(self):
+        response = Client(app).head('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.body, b'')
+        self.assertEqual(response.headers['Content-Length'], '12')
@@ -0,0 +1,56 @@
+import unittest
+from io import BytesIO
+
+from sl.util import LimitedInput
+
+
+class LimitedInputTests(unittest.TestCase):
+
+    def make(self, body=b'line one\nline two\n', rest=b'NEXT REQUEST'):
+        self.stream = BytesIO(body + rest)
+        return LimitedInput(self.stream, len(body))
+
+    def test_read_stops_at_length(self):
+        body = self.make()
+        self.assertEqual(body.read(), b'line one\nline two\n')
+        self.assertEqual(body.read(), b'')
+        self.assertEqual(self.stream.read(), b'NEXT REQUEST')
+
+    def test_read_size(self):
+        body = self.make()
+        self.assertEqual(body.read(5), b'line ')
+        self.assertEqual(body.read(100), b'one\nline two\n')
+        self.assertEqual(body.read(1), b'')
+
+    def test_readline(self):
+        body = self.make()
+        self.assertEqual(body.readline(), b'line one\n')
+        self.assertEqual(body.readline(4), b'line')
+        self.assertEqual(body.readline(), b' two\n')
+        self.assertEqual(body.readline(), b'')
+
+    def test_readline_without_newline_stops_at_length(self):
+        body = self.make(b'no newline', b'\nNEXT')
+        self.assertEqual(body.readline(), b'no newline')
+        self.assertEqual(self.stream.read(), b'\nNEXT')
+
+    def test_readlines_and_iteration(self):
+        self.assertEqual(self.make().readlines(),
+                         [b'line one\n', b'line two\n'])
+        self.assertEqual(self.make().readlines(3), [b'line one\n'])
+        self.assertEqual(list(self.make()), [b'line one\n', b'line two\n'])
+
+    def test_drain(self):
+        body = self.make()
+        body.read(3)
+        body.drain(blksize=4)
+        self.assertEqual(body.remaining, 0)
+        self.assertEqual(self.stream.read(), b'NEXT REQUEST')
+
+    def test_short_stream(self):
+        # The client went away before sending the whole body
+        body = LimitedInput(BytesIO(b'short'), 100)
+        self.assertEqual(body.read(), b'short')
+        self.assertEqual(body.read(), b'')
+        self.assertEqual(body.remaining, 0)
+        body.drain()
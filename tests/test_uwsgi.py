@@ -0,0 +1,81 @@
+import socket
+import struct
+import threading
+import unittest
+
+from sl.uwsgi import make_uwsgi_server, parse_vars
+
+
+def encode_vars(pairs):
+    out = []
+    for key, value in pairs.items():
+        for item in (key.encode('iso-8859-1'), value.encode('iso-8859-1')):
+            out.append(struct.pack('<H', len(item)) + item)
+    return b''.join(out)
+
+
+def packet(pairs, modifier1=0):
+    data = encode_vars(pairs)
+    return struct.pack('<BHB', modifier1, len(data), 0) + data
+
+
+VARS = {
+    'REQUEST_METHOD': 'POST', 'SCRIPT_NAME': '', 'PATH_INFO': '/echo',
+    'QUERY_STRING': 'a=1', 'SERVER_NAME': 'localhost', 'SERVER_PORT': '80',
+    'SERVER_PROTOCOL': 'HTTP/1.1', 'CONTENT_LENGTH': '4',
+}
+
+
+def app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [environ['wsgi.url_scheme'].encode(), b' ',
+            environ['QUERY_STRING'].encode(), b' ',
+            environ['wsgi.input'].read()]
+
+
+class ParseVarsTests(unittest.TestCase):
+
+    def test_round_trip(self):
+        pairs = {'EMPTY': '', 'PATH_INFO': '/caf\xe9', 'LONG': 'x' * 1000}
+        self.assertEqual(parse_vars(encode_vars(pairs)), pairs)
+
+    def test_empty(self):
+        self.assertEqual(parse_vars(b''), {})
+
+
+class UWSGIServerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.server = make_uwsgi_server('127.0.0.1', 0, app)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def request(self, data):
+        with socket.create_connection(self.server.server_address, 5) as sock:
+            sock.sendall(data)
+            response = b''
+            while True:
+                chunk = sock.recv(4096)
+                if not chunk:
+                    return response
+                response += chunk
+
+    def test_request(self):
+        # The bytes after the body are not the application's to read
+        response = self.request(packet(VARS) + b'bodyEXTRA')
+        self.assertTrue(response.startswith(b'HTTP/1.0 200 OK\r\n'),
+                        response)
+        self.assertTrue(response.endswith(b'\r\n\r\nhttp a=1 body'),
+                        response)
+
+    def test_scheme(self):
+        response = self.request(packet(dict(VARS, UWSGI_SCHEME='https')) +
+                                b'body')
+        self.assertTrue(response.endswith(b'\r\n\r\nhttps a=1 body'),
+                        response)
+
+    def test_other_modifiers_are_refused(self):
+        self.assertEqual(self.request(packet(VARS, modifier1=5)), b'')
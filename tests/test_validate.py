@@ -0,0 +1,28 @@
+import unittest
+
+from sl.testing import Client
+from sl.validate import SamplingValidator
+
+
+def app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [b'hello']
+
+
+class SamplingValidatorTests(unittest.TestCase):
+
+    def test_sampled_response_keeps_headers(self):
+        plain = Client(app).get('/')
+        sampled = Client(SamplingValidator(app, rate=1.0)).get('/')
+        for name in ('Content-Type', 'Content-Length'):
+            self.assertEqual(sampled.headers[name], plain.headers[name])
+        self.assertEqual(sampled.headers['Content-Length'], '5')
+        self.assertEqual(sampled.body, b'hello')
+
+    def test_list_blocks_are_checked(self):
+        def bad_app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return [b'a', 'b']
+        validator = SamplingValidator(bad_app, rate=1.0)
+        Client(validator, raise_errors=False).get('/')
+        self.assertEqual(validator.violations.get('body'), 1)